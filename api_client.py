@@ -1,26 +1,246 @@
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+
 import requests
+from requests.adapters import HTTPAdapter
+
+import metricas
 
 # URL base da API da Caixa para a Lotofácil
 URL_BASE = "https://servicebus2.caixa.gov.br/portaldeloterias/api/lotofacil/"
 
-def get_latest_concurso_info():
-    """Busca os dados do último concurso para obter o número total de sorteios."""
+# Tempo máximo (em segundos) de espera por uma resposta
+TEMPO_LIMITE = 10
+# Tentativas por requisição em caso de erro 5xx/429, timeout ou falha de conexão
+MAX_TENTATIVAS = 4
+# Espera antes da primeira nova tentativa; dobra a cada tentativa seguinte
+ESPERA_INICIAL_TENTATIVA = 0.5
+# Requisições simultâneas ao baixar vários concursos
+MAX_CONCORRENCIA = 8
+# Limite de requisições por segundo (e rajada máxima) enviadas à API
+REQUISICOES_POR_SEGUNDO = 10
+
+# Diretório do cache em disco das respostas da API. Um concurso publicado nunca
+# muda, então fica guardado para sempre; o "último concurso" vale por TTL_ULTIMO_CONCURSO
+CACHE_API_DIR = "cache_api"
+# Tempo (em segundos) em que a resposta do último concurso é usada sem consultar a API
+TTL_ULTIMO_CONCURSO = 300
+# Modo offline: responde apenas com o que está no cache, sem acessar a rede
+MODO_OFFLINE = False
+
+class LimitadorTaxa:
+    """
+    Balde de fichas (token bucket): libera até `taxa` requisições por segundo,
+    permitindo rajadas de até `capacidade` requisições. Pode ser usado por
+    várias threads ao mesmo tempo.
+    """
+
+    def __init__(self, taxa=REQUISICOES_POR_SEGUNDO, capacidade=None):
+        self.taxa = taxa
+        self.capacidade = capacidade or taxa
+        self._fichas = self.capacidade
+        self._ultima_recarga = time.monotonic()
+        self._trava = threading.Lock()
+
+    def aguardar(self):
+        """Bloqueia até haver uma ficha disponível e a consome."""
+        while True:
+            with self._trava:
+                agora = time.monotonic()
+                self._fichas = min(self.capacidade, self._fichas + (agora - self._ultima_recarga) * self.taxa)
+                self._ultima_recarga = agora
+                if self._fichas >= 1:
+                    self._fichas -= 1
+                    return
+                espera = (1 - self._fichas) / self.taxa
+            time.sleep(espera)
+
+def _criar_sessao():
+    sessao = requests.Session()
+    # Mantém abertas tantas conexões quantas requisições simultâneas usamos
+    adaptador = HTTPAdapter(pool_connections=1, pool_maxsize=MAX_CONCORRENCIA)
+    sessao.mount("https://", adaptador)
+    sessao.mount("http://", adaptador)
+    # verify=False é usado para contornar erros de certificado SSL que podem ocorrer.
+    sessao.verify = False
+    return sessao
+
+# Sessão compartilhada: reaproveita as conexões (keep-alive) entre as requisições
+_sessao = _criar_sessao()
+_limitador = LimitadorTaxa()
+
+def definir_modo_offline(ativo=True):
+    """Liga ou desliga o modo offline, em que as respostas vêm apenas do cache em disco."""
+    global MODO_OFFLINE
+    MODO_OFFLINE = ativo
+
+def definir_diretorio_cache(diretorio):
+    """Muda o diretório do cache em disco das respostas da API."""
+    global CACHE_API_DIR
+    CACHE_API_DIR = diretorio
+
+def _caminho_cache(nome):
+    return os.path.join(CACHE_API_DIR, nome)
+
+def _nome_cache(nome, url_base):
+    """
+    Nome do arquivo do cache para `url_base`. A API padrão fica na raiz do
+    cache; outras URLs ficam em um subdiretório próprio, para que respostas de
+    fontes diferentes não se misturem.
+    """
+    if not url_base or url_base == URL_BASE:
+        return nome
+    fonte = hashlib.sha1(url_base.encode("utf-8")).hexdigest()[:12]
+    return os.path.join("fontes", fonte, nome)
+
+def _ler_cache(nome):
     try:
-        # O parâmetro verify=False é usado para contornar erros de certificado SSL que podem ocorrer.
-        response = requests.get(URL_BASE, verify=False)
-        response.raise_for_status()  # Lança um erro para respostas com status 4xx ou 5xx
-        return response.json()
-    except requests.exceptions.RequestException as e:
-        print(f"Erro de conexão ao buscar o último concurso: {e}")
+        with open(_caminho_cache(nome), encoding="utf-8") as arquivo:
+            return json.load(arquivo)
+    except (OSError, ValueError):
         return None
 
-def get_concurso_data(numero_concurso):
-    """Busca os dados de um concurso específico."""
-    url_concurso = f"{URL_BASE}{numero_concurso}"
+def _gravar_cache(nome, conteudo):
+    """Grava o arquivo do cache de forma atômica (arquivo temporário + rename)."""
+    caminho = _caminho_cache(nome)
+    os.makedirs(os.path.dirname(caminho), exist_ok=True)
+    temporario = f"{caminho}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(temporario, "w", encoding="utf-8") as arquivo:
+        json.dump(conteudo, arquivo)
+    os.replace(temporario, caminho)
+
+def _requisitar(url, descricao, limitador=None, cabecalhos=None):
+    """
+    Faz um GET em `url` e retorna a resposta (200 ou 304), ou None em caso de erro.
+    Erros 5xx/429, timeouts e falhas de conexão são repetidos com espera
+    exponencial; os demais erros 4xx não.
+    """
+    limitador = limitador or _limitador
+    for tentativa in range(MAX_TENTATIVAS):
+        limitador.aguardar()
+        try:
+            with metricas.medir("api", "requisicao"):
+                response = _sessao.get(url, timeout=TEMPO_LIMITE, headers=cabecalhos)
+            if response.status_code < 500 and response.status_code != 429:
+                response.raise_for_status()  # Lança um erro para respostas com status 4xx
+                return response
+            erro = f"status {response.status_code}"
+        except (requests.exceptions.Timeout, requests.exceptions.ConnectionError) as e:
+            erro = e
+        except requests.exceptions.RequestException as e:
+            print(f"Erro ao buscar {descricao}: {e}")
+            return None
+
+        if tentativa + 1 < MAX_TENTATIVAS:
+            # Espera exponencial com um pouco de aleatoriedade para não sincronizar as threads
+            espera = ESPERA_INICIAL_TENTATIVA * 2 ** tentativa * random.uniform(1, 1.5)
+            print(f"Erro ao buscar {descricao} ({erro}); nova tentativa em {espera:.1f}s...")
+            time.sleep(espera)
+    print(f"Erro de conexão ao buscar {descricao}: {erro}")
+    return None
+
+def _json_da_resposta(response, descricao):
     try:
-        response = requests.get(url_concurso, verify=False)
-        response.raise_for_status()
         return response.json()
-    except requests.exceptions.RequestException as e:
-        print(f"Erro de conexão ao buscar o concurso {numero_concurso}: {e}")
+    except ValueError as e:
+        print(f"Erro ao buscar {descricao}: resposta inválida ({e})")
+        return None
+
+@metricas.medido("api")
+def get_latest_concurso_info(url_base=None):
+    """
+    Busca os dados do último concurso para obter o número total de sorteios.
+
+    Dentro do TTL a resposta guardada é usada sem acessar a rede; depois dele
+    a API é consultada com ETag/Last-Modified e, se nada mudou (304), a
+    resposta guardada continua valendo.
+    """
+    descricao = "o último concurso"
+    nome_cache = _nome_cache("ultimo_concurso.json", url_base)
+    guardado = _ler_cache(nome_cache)
+    if MODO_OFFLINE:
+        if guardado is None:
+            print(f"Modo offline: {descricao} não está no cache.")
+            return None
+        return guardado["dados"]
+    if guardado and time.time() - guardado["obtido_em"] < TTL_ULTIMO_CONCURSO:
+        return guardado["dados"]
+
+    cabecalhos = {}
+    if guardado and guardado.get("etag"):
+        cabecalhos["If-None-Match"] = guardado["etag"]
+    if guardado and guardado.get("last_modified"):
+        cabecalhos["If-Modified-Since"] = guardado["last_modified"]
+    response = _requisitar(url_base or URL_BASE, descricao, cabecalhos=cabecalhos)
+    if response is None:
         return None
+
+    if response.status_code == 304 and guardado:
+        dados = guardado["dados"]
+    else:
+        dados = _json_da_resposta(response, descricao)
+        if dados is None:
+            return None
+    _gravar_cache(nome_cache, {
+        "dados": dados,
+        "etag": response.headers.get("ETag") or (guardado or {}).get("etag"),
+        "last_modified": response.headers.get("Last-Modified") or (guardado or {}).get("last_modified"),
+        "obtido_em": time.time(),
+    })
+    return dados
+
+@metricas.medido("api")
+def get_concurso_data(numero_concurso, url_base=None, limitador=None):
+    """Busca os dados de um concurso específico; concursos já obtidos vêm do cache em disco."""
+    descricao = f"o concurso {numero_concurso}"
+    nome_cache = _nome_cache(os.path.join("concursos", f"{int(numero_concurso)}.json"), url_base)
+    guardado = _ler_cache(nome_cache)
+    if guardado is not None:
+        return guardado
+    if MODO_OFFLINE:
+        print(f"Modo offline: {descricao} não está no cache.")
+        return None
+
+    url_concurso = f"{url_base or URL_BASE}{numero_concurso}"
+    response = _requisitar(url_concurso, descricao, limitador)
+    dados = _json_da_resposta(response, descricao) if response is not None else None
+    # Só guarda concursos já apurados: o resultado de um concurso publicado não muda mais
+    if dados and dados.get("listaDezenas"):
+        _gravar_cache(nome_cache, dados)
+    return dados
+
+def buscar_concursos(numeros_concursos, max_concorrencia=MAX_CONCORRENCIA, url_base=None, limitador=None):
+    """
+    Baixa vários concursos com até `max_concorrencia` requisições simultâneas,
+    respeitando o limite de requisições por segundo.
+
+    É um gerador: produz (numero_concurso, dados) na ordem de
+    `numeros_concursos` assim que cada concurso fica pronto, de modo que os
+    resultados podem ser gravados enquanto os seguintes ainda estão sendo
+    baixados. `dados` é None quando o concurso não pôde ser obtido.
+    """
+    numeros = iter(numeros_concursos)
+    with ThreadPoolExecutor(max_workers=max_concorrencia) as executor:
+        pendentes = deque()
+        try:
+            # Mantém uma janela limitada de requisições à frente do consumidor
+            for numero in numeros:
+                pendentes.append((numero, executor.submit(get_concurso_data, numero, url_base, limitador)))
+                if len(pendentes) >= 2 * max_concorrencia:
+                    break
+            while pendentes:
+                numero, futuro = pendentes.popleft()
+                proximo = next(numeros, None)
+                if proximo is not None:
+                    pendentes.append((proximo, executor.submit(get_concurso_data, proximo, url_base, limitador)))
+                yield numero, futuro.result()
+        finally:
+            # Se o consumidor parar antes do fim, descarta o que ainda não começou
+            for _, futuro in pendentes:
+                futuro.cancel()
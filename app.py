@@ -1,11 +1,14 @@
-from flask import Flask, render_template, request, redirect, url_for, flash
+from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, abort, Response, stream_with_context
 from flask_login import LoginManager, UserMixin, login_user, logout_user, login_required, current_user
 from werkzeug.security import generate_password_hash, check_password_hash
+import json
+import os
+import time
 import database
 import sugestoes
-import ml_sugestoes
-import backtest
 import main
+import metricas
+import tarefas
 
 app = Flask(__name__)
 app.config['SECRET_KEY'] = 'sua_chave_secreta_aqui' # Mude para uma chave secreta forte!
@@ -30,6 +33,31 @@ def load_user(user_id):
         return User(user_data['id'], user_data['username'], user_data['password_hash'])
     return None
 
+@app.before_request
+def iniciar_medicao():
+    metricas.iniciar_requisicao()
+
+@app.before_request
+def inicializar_banco():
+    # Cria as tabelas e aplica as migrações na primeira requisição de cada processo
+    database.inicializar()
+
+@app.after_request
+def encerrar_medicao(response):
+    # A rota (ex.: /tarefas/<int:tarefa_id>) agrupa as requisições de todos os ids
+    rota = request.url_rule.rule if request.url_rule else 'desconhecida'
+    duracao, etapas = metricas.encerrar_requisicao(rota, request.method, response.status_code)
+    if metricas.DETALHAR_REQUISICOES:
+        print(metricas.formatar_detalhes(request.method, request.path, response.status_code, duracao, etapas))
+    return response
+
+@app.route('/metrics')
+def metrics():
+    """Métricas coletadas (contagens e histogramas de latência) no formato de texto do Prometheus."""
+    if not metricas.METRICAS_ATIVAS:
+        abort(404)
+    return Response(metricas.exportar_prometheus(), mimetype='text/plain; version=0.0.4')
+
 @app.route('/')
 @login_required
 def index():
@@ -39,28 +67,68 @@ def index():
         ultimo_concurso_info = database.obter_resultado_concurso(ultimo_concurso_num)
     return render_template('index.html', ultimo_concurso=ultimo_concurso_info)
 
+# Tarefas demoradas rodam em segundo plano (ver tarefas.py); as rotas apenas as enfileiram
+def _tarefa_atualizar_banco(parametros, progresso):
+    resumo = main.atualizar_banco_de_dados(ao_progresso=progresso)
+    if resumo is None:
+        raise RuntimeError("Não foi possível consultar a API da Caixa.")
+    return resumo
+
+# O ml_sugestoes e o backtest (pandas, scikit-learn) são importados só quando usados,
+# para que o processo da aplicação suba rápido e as demais páginas não paguem por eles
+def _tarefa_retreinar_ml(parametros, progresso):
+    import ml_sugestoes
+    proximo_concurso = database.obter_ultimo_concurso_salvo() + 1
+    progresso(0, 1, "Treinando os modelos...")
+    sugestao = ml_sugestoes.gerar_sugestao_ml(proximo_concurso, parametros['user_id'], force_retrain=True,
+                                              incremental=not parametros['completo'])
+    return {"concurso": proximo_concurso, "sugestao": sugestao}
+
+def _tarefa_backtest(parametros, progresso):
+    import backtest
+    # Cada concurso testado é publicado como evento para a página do backtest (SSE)
+    for evento in backtest.gerar_eventos_backtest(parametros['periodo_testes'], n_workers=parametros['n_workers']):
+        if evento['tipo'] == 'erro':
+            raise RuntimeError(evento['mensagem'])
+        if evento['tipo'] == 'concurso':
+            progresso(evento['indice'], evento['total'],
+                      f"Concurso {evento['concurso']}: {evento['acertos']} acertos", evento=evento)
+        elif evento['tipo'] == 'resumo':
+            progresso(1, 1, evento=evento)
+            return evento['distribuicao']
+        else:
+            progresso(0, 1, evento['mensagem'], evento=evento)
+
+# A atualização do banco e o backtest não dependem de quem os pede; o retreino
+# salva a sugestão gerada para o usuário que o pediu
+tarefas.registrar_tipo('atualizar_banco', _tarefa_atualizar_banco, compartilhada=True)
+tarefas.registrar_tipo('retreinar_ml', _tarefa_retreinar_ml)
+tarefas.registrar_tipo('backtest', _tarefa_backtest, compartilhada=True)
+
 @app.route('/update_db')
 @login_required
 def update_db():
-    main.atualizar_banco_de_dados()
-    return redirect(url_for('index'))
+    tarefa_id = tarefas.enfileirar('atualizar_banco', user_id=current_user.id)
+    return redirect(url_for('ver_tarefa', tarefa_id=tarefa_id))
 
 @app.route('/freq_suggestion')
 @login_required
 def freq_suggestion():
-    proximo_concurso = database.obter_ultimo_concurso_salvo() + 1
-    todos_os_resultados = database.obter_todos_os_resultados()
-    if not todos_os_resultados:
+    ultimo_concurso, quantidade = database.obter_resumo_concursos()
+    proximo_concurso = ultimo_concurso + 1
+    if not quantidade:
         message = "O banco de dados está vazio. Por favor, atualize o banco primeiro."
         suggestions = []
     else:
-        suggestions = sugestoes.gerar_sugestoes(todos_os_resultados, proximo_concurso, current_user.id)
+        # O histórico só é lido do banco se o ranking de frequência não estiver em cache
+        suggestions = sugestoes.gerar_sugestoes(None, proximo_concurso, current_user.id)
         message = f"Sugestões de Jogo para o concurso {proximo_concurso} (Análise de Frequência):"
     return render_template('suggestions.html', message=message, suggestions=suggestions)
 
 @app.route('/ml_suggestion')
 @login_required
 def ml_suggestion():
+    import ml_sugestoes
     proximo_concurso = database.obter_ultimo_concurso_salvo() + 1
     # Força o retreinamento se for a primeira vez ou se o usuário pedir
     # Para a web, vamos sempre tentar carregar, e o retreinamento será uma opção separada
@@ -74,9 +142,11 @@ def ml_suggestion():
 @app.route('/retrain_ml')
 @login_required
 def retrain_ml():
-    proximo_concurso = database.obter_ultimo_concurso_salvo() + 1
-    ml_sugestoes.gerar_sugestao_ml(proximo_concurso, current_user.id, force_retrain=True)
-    return redirect(url_for('index'))
+    # Por padrão os modelos são retreinados do zero, como antes; ?incremental=1 apenas
+    # acrescenta árvores treinadas com os concursos novos
+    completo = request.args.get('incremental') != '1'
+    tarefa_id = tarefas.enfileirar('retreinar_ml', {'completo': completo}, user_id=current_user.id)
+    return redirect(url_for('ver_tarefa', tarefa_id=tarefa_id))
 
 @app.route('/run_backtest', methods=['GET', 'POST'])
 @login_required
@@ -84,34 +154,107 @@ def run_backtest():
     if request.method == 'POST':
         try:
             periodo_testes = int(request.form['periodo_testes'])
-            if periodo_testes <= 0:
-                message = "O número de concursos deve ser positivo."
+            n_workers = int(request.form.get('n_workers') or 1)
+            if periodo_testes <= 0 or n_workers <= 0:
+                message = "O número de concursos e de processos deve ser positivo."
                 return render_template('backtest_results.html', message=message, results={})
             
-            results = backtest.executar_backtest(periodo_testes)
-            message = f"Relatório Final do Backtest ({periodo_testes} concursos):"
-
-            total_concursos_testados = sum(count for points, count in results)
-            maior_pontuacao = 0
-            if results:
-                maior_pontuacao = max(points for points, count in results)
-
-            return render_template('backtest_results.html', 
-                                   message=message, 
-                                   results=results,
-                                   total_concursos_testados=total_concursos_testados,
-                                   maior_pontuacao=maior_pontuacao)
+            tarefa_id = tarefas.enfileirar('backtest', {'periodo_testes': periodo_testes, 'n_workers': n_workers},
+                                           user_id=current_user.id)
+            return redirect(url_for('ver_tarefa', tarefa_id=tarefa_id))
         except ValueError:
             message = "Entrada inválida. Por favor, insira um número válido."
             return render_template('backtest_results.html', message=message, results={})
-    return render_template('backtest_form.html')
+    return render_template('backtest_form.html', n_workers_padrao=os.cpu_count() or 1)
+
+def _renderizar_backtest(periodo_testes, results):
+    message = f"Relatório Final do Backtest ({periodo_testes} concursos):"
+
+    total_concursos_testados = sum(count for points, count in results)
+    maior_pontuacao = 0
+    if results:
+        maior_pontuacao = max(points for points, count in results)
+
+    return render_template('backtest_results.html', 
+                           message=message, 
+                           results=results,
+                           total_concursos_testados=total_concursos_testados,
+                           maior_pontuacao=maior_pontuacao)
+
+@app.route('/tarefas')
+@login_required
+def listar_tarefas():
+    """Lista as tarefas em segundo plano mais recentes e os seus resultados."""
+    return render_template('tarefas.html', tarefas=tarefas.listar(user_id=current_user.id))
+
+@app.route('/tarefas/<int:tarefa_id>')
+@login_required
+def ver_tarefa(tarefa_id):
+    """Acompanha uma tarefa; quando termina, exibe o resultado guardado."""
+    # Tarefas de outros usuários respondem 404, como se não existissem
+    tarefa = tarefas.obter(tarefa_id, current_user.id)
+    if tarefa is None:
+        abort(404)
+    if tarefa['tipo'] == 'backtest':
+        if tarefa['status'] == 'concluida':
+            return _renderizar_backtest(tarefa['parametros']['periodo_testes'], tarefa['resultado'] or [])
+        if tarefa['status'] != 'erro':
+            # Em andamento: a página recebe cada concurso testado pelo endpoint de eventos
+            message = f"Backtest em andamento ({tarefa['parametros']['periodo_testes']} concursos)..."
+            return render_template('backtest_results.html', message=message, results={}, tarefa=tarefa)
+    return render_template('tarefa.html', tarefa=tarefa)
+
+@app.route('/tarefas/<int:tarefa_id>/eventos')
+@login_required
+def eventos_tarefa(tarefa_id):
+    """
+    Transmite os eventos da tarefa (ex.: cada concurso do backtest) como
+    server-sent events, à medida que acontecem. Ao final envia o evento "fim".
+    """
+    if tarefas.obter(tarefa_id, current_user.id) is None:
+        abort(404)
+
+    def transmitir():
+        for evento in tarefas.acompanhar(tarefa_id):
+            if evento is None:
+                yield ": aguardando\n\n"  # comentário SSE que mantém a conexão aberta
+            else:
+                yield f"event: {evento['tipo']}\ndata: {json.dumps(evento)}\n\n"
+        # A tarefa pode estar rodando em outro processo, sem eventos aqui: espera ela terminar
+        while tarefas.obter(tarefa_id)['status'] in ('pendente', 'executando'):
+            time.sleep(2)
+            yield ": aguardando\n\n"
+        yield "event: fim\ndata: {}\n\n"
+
+    return Response(stream_with_context(transmitir()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/tarefas/<int:tarefa_id>/status')
+@login_required
+def status_tarefa(tarefa_id):
+    """Estado e progresso da tarefa em JSON, consultado periodicamente pela página da tarefa."""
+    tarefa = tarefas.obter(tarefa_id, current_user.id)
+    if tarefa is None:
+        abort(404)
+    return jsonify(tarefa)
 
 @app.route('/sugestoes_salvas')
 @login_required
 def sugestoes_salvas():
-    """Exibe todas as sugestões de jogos que foram salvas no banco de dados."""
-    sugestoes = database.obter_sugestoes_salvas(current_user.id)
-    return render_template('sugestoes_salvas.html', sugestoes=sugestoes)
+    """Exibe as sugestões de jogos salvas no banco de dados, uma página por vez."""
+    # Cursor da página no formato "concurso-id" (a última sugestão da página anterior)
+    cursor = None
+    apos = request.args.get('apos', '')
+    if apos:
+        try:
+            concurso, sugestao_id = (int(parte) for parte in apos.split('-', 1))
+            cursor = (concurso, sugestao_id)
+        except ValueError:
+            return redirect(url_for('sugestoes_salvas'))
+    sugestoes, proximo_cursor = database.obter_pagina_sugestoes_salvas(current_user.id, cursor=cursor)
+    proxima_pagina = f"{proximo_cursor[0]}-{proximo_cursor[1]}" if proximo_cursor else None
+    return render_template('sugestoes_salvas.html', sugestoes=sugestoes, proxima_pagina=proxima_pagina,
+                           primeira_pagina=cursor is None)
 
 @app.route('/delete_sugestao/<int:sugestao_id>', methods=['POST'])
 @login_required
@@ -0,0 +1,164 @@
+import json
+import mmap
+import os
+import struct
+import threading
+import zlib
+
+import numpy as np
+
+# Formato do artefato de modelos: um único arquivo com
+#   MAGICA | versão (uint32) | tamanho do cabeçalho (uint32) | cabeçalho JSON | arrays
+# O cabeçalho traz o manifesto e, para cada array, dtype, forma, posição e
+# compressão. Os arrays começam em posições alinhadas e, sem compressão, são
+# lidos direto do arquivo mapeado em memória: vários processos que abrem o
+# mesmo artefato compartilham as mesmas páginas.
+MAGICA = b"LOTOFMOD"
+VERSAO_FORMATO = 1
+ALINHAMENTO = 64
+_PREFIXO = struct.Struct("<8sII")
+
+# Opções padrão na gravação: compressão ('zlib' ou None; um array comprimido é
+# descomprimido na memória de cada processo em vez de mapeado), precisão dos
+# limiares e das probabilidades das folhas, profundidade máxima das árvores e
+# quantidade máxima de árvores por floresta (None mantém tudo). Com os valores
+# padrão a previsão é idêntica à dos modelos originais.
+OPCOES_PADRAO = {
+    'compressao': None,
+    'precisao_limiares': 'float64',
+    'precisao_probabilidades': 'float64',
+    'profundidade_maxima': None,
+    'max_arvores': None,
+}
+PRECISOES = {'float64': np.float64, 'float32': np.float32, 'float16': np.float16}
+
+def _alinhar(posicao):
+    return -(-posicao // ALINHAMENTO) * ALINHAMENTO
+
+def gravar(caminho, manifesto, arrays, compressao=None):
+    """
+    Grava `manifesto` (dict serializável em JSON) e `arrays` ({nome: ndarray})
+    em um único arquivo, de forma atômica (arquivo temporário + rename): quem
+    já tem o artefato anterior mapeado continua lendo a versão antiga.
+    """
+    if compressao not in (None, 'zlib'):
+        raise ValueError(f"Compressão desconhecida: {compressao}")
+    blocos = []
+    descricoes = {}
+    posicao = 0
+    for nome, array in arrays.items():
+        array = np.ascontiguousarray(array)
+        dados = array.tobytes()
+        if compressao == 'zlib':
+            dados = zlib.compress(dados, 6)
+        posicao = _alinhar(posicao)
+        descricoes[nome] = {
+            'dtype': array.dtype.str,
+            'forma': list(array.shape),
+            'inicio': posicao,
+            'bytes': len(dados),
+            'compressao': compressao,
+        }
+        blocos.append((posicao, dados))
+        posicao += len(dados)
+
+    cabecalho = json.dumps({'manifesto': manifesto, 'arrays': descricoes}).encode('utf-8')
+    inicio_dados = _alinhar(_PREFIXO.size + len(cabecalho))
+
+    temporario = f"{caminho}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(temporario, 'wb') as arquivo:
+        arquivo.write(_PREFIXO.pack(MAGICA, VERSAO_FORMATO, len(cabecalho)))
+        arquivo.write(cabecalho)
+        for inicio, dados in blocos:
+            arquivo.seek(inicio_dados + inicio)
+            arquivo.write(dados)
+    os.replace(temporario, caminho)
+
+def ler(caminho, mapear=True):
+    """
+    Lê um artefato gravado por `gravar` e retorna (manifesto, arrays).
+    Com `mapear=True` os arrays sem compressão são somente leitura e apontam
+    para o arquivo mapeado em memória; as páginas só são lidas do disco quando
+    usadas. Lança ValueError se o arquivo não for um artefato válido.
+    """
+    with open(caminho, 'rb') as arquivo:
+        prefixo = arquivo.read(_PREFIXO.size)
+        if len(prefixo) < _PREFIXO.size:
+            raise ValueError(f"{caminho}: arquivo truncado.")
+        magica, versao, tamanho_cabecalho = _PREFIXO.unpack(prefixo)
+        if magica != MAGICA:
+            raise ValueError(f"{caminho}: não é um artefato de modelos.")
+        if versao != VERSAO_FORMATO:
+            raise ValueError(f"{caminho}: versão {versao} do formato não suportada (esperada {VERSAO_FORMATO}).")
+        try:
+            cabecalho = json.loads(arquivo.read(tamanho_cabecalho).decode('utf-8'))
+        except ValueError as e:
+            raise ValueError(f"{caminho}: cabeçalho inválido ({e}).")
+        inicio_dados = _alinhar(_PREFIXO.size + tamanho_cabecalho)
+        if mapear:
+            # O mapeamento continua válido depois que o arquivo é fechado
+            conteudo = mmap.mmap(arquivo.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            arquivo.seek(0)
+            conteudo = arquivo.read()
+
+    arrays = {}
+    for nome, descricao in cabecalho['arrays'].items():
+        inicio = inicio_dados + descricao['inicio']
+        fim = inicio + descricao['bytes']
+        if fim > len(conteudo):
+            raise ValueError(f"{caminho}: arquivo truncado (array {nome}).")
+        dtype = np.dtype(descricao['dtype'])
+        if descricao['compressao'] == 'zlib':
+            array = np.frombuffer(zlib.decompress(conteudo[inicio:fim]), dtype=dtype)
+        else:
+            array = np.frombuffer(conteudo, dtype=dtype, count=descricao['bytes'] // dtype.itemsize, offset=inicio)
+        arrays[nome] = array.reshape(descricao['forma'])
+    return cabecalho['manifesto'], arrays
+
+def preparar_florestas(florestas, opcoes=None):
+    """
+    Converte as florestas compiladas (ver ml_sugestoes.compilar_florestas) nos
+    arrays gravados no artefato, aplicando a poda (`max_arvores`,
+    `profundidade_maxima`) e a precisão pedidas em `opcoes`.
+    Retorna (arrays, n_arvores). Os índices são sempre gravados em int32.
+    """
+    opcoes = dict(OPCOES_PADRAO, **(opcoes or {}))
+    esquerda = florestas['esquerda']
+    direita = florestas['direita']
+    raizes = florestas['raizes']
+    n_arvores = florestas['n_arvores']
+
+    # Poda por quantidade: mantém as primeiras `max_arvores` árvores de cada floresta
+    if opcoes['max_arvores'] and opcoes['max_arvores'] < n_arvores:
+        raizes = raizes.reshape(-1, n_arvores)[:, :opcoes['max_arvores']].ravel()
+        n_arvores = opcoes['max_arvores']
+
+    # Profundidade de cada nó alcançável a partir das raízes mantidas (-1: descartado)
+    profundidade = np.full(len(esquerda), -1, dtype=np.int32)
+    nivel = 0
+    atuais = raizes
+    while atuais.size:
+        profundidade[atuais] = nivel
+        if opcoes['profundidade_maxima'] is not None and nivel >= opcoes['profundidade_maxima']:
+            break
+        internos = atuais[esquerda[atuais] != -1]
+        atuais = np.concatenate([esquerda[internos], direita[internos]])
+        nivel += 1
+
+    manter = profundidade >= 0
+    novo_indice = np.cumsum(manter) - 1
+    # Nós internos no limite de profundidade viram folhas com a probabilidade do próprio nó
+    folha = esquerda[manter] == -1
+    if opcoes['profundidade_maxima'] is not None:
+        folha |= profundidade[manter] == opcoes['profundidade_maxima']
+
+    arrays = {
+        'esquerda': np.where(folha, -1, novo_indice[np.where(folha, 0, esquerda[manter])]).astype(np.int32),
+        'direita': np.where(folha, -1, novo_indice[np.where(folha, 0, direita[manter])]).astype(np.int32),
+        'features': np.where(folha, 0, florestas['features'][manter]).astype(np.int32),
+        'limiares': florestas['limiares'][manter].astype(PRECISOES[opcoes['precisao_limiares']]),
+        'probabilidades': florestas['probabilidades'][manter].astype(PRECISOES[opcoes['precisao_probabilidades']]),
+        'raizes': novo_indice[raizes].astype(np.int32),
+    }
+    return arrays, n_arvores
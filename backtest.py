@@ -1,111 +1,296 @@
-import pandas as pd
-from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+import os
 import time
 
+import numpy as np
+
 # Importa as funções necessárias dos outros módulos
-from database import obter_todos_os_resultados
+from database import (
+    dezenas_para_mascara,
+    obter_checkpoints_backtest,
+    obter_todos_os_resultados,
+    salvar_checkpoint_backtest,
+)
+from features import carregar_features, contar_acertos, criar_matriz_sorteios, matriz_para_mascaras
+import metricas
+import ml_sugestoes
 from ml_sugestoes import (
-    criar_dataframe_features,
-    calcular_features_atraso,
-    calcular_features_frequencia,
-    calcular_feature_lag,
-    calcular_feature_soma,
-    treinar_ou_carregar_modelos_e_prever
+    compilar_florestas,
+    descrever_estrategia,
+    prever_probabilidades,
+    selecionar_dezenas,
+    treinar_modelos,
 )
 
-def executar_backtest(periodo_testes):
+# Estado de cada processo do backtest paralelo, preenchido por _inicializar_processo
+_df_features_processo = None
+_n_jobs_processo = 1
+
+def testar_concurso(df_features, concurso_real, n_jobs=-1):
     """
-    Executa uma simulação histórica (backtest) para avaliar a performance da
-    estratégia de Machine Learning.
+    Treina os modelos com os concursos anteriores a `concurso_real` e gera a
+    sugestão para ele. Os acertos são contados por `gerar_eventos_backtest`,
+    com as máscaras de todo o backtest.
+    Retorna (sugestao, tempo_em_segundos, tempo_treino, tempo_previsao).
+    """
+    start_time = time.time()
 
-    Args:
-        periodo_testes (int): Quantidade de concursos recentes para usar no teste.
+    # 1. Pega as features de todos os concursos que vieram ANTES do concurso que estamos testando
+    fim_treino = df_features.index.searchsorted(concurso_real)
+    df_features_hist = df_features.iloc[:fim_treino]
 
-    Returns:
-        dict: Um dicionário com a distribuição de acertos.
-    """    
+    # 2. Treina os modelos (sem salvar) e gera a sugestão para o concurso_real,
+    # medindo separadamente o treino e a previsão
+    modelos = treinar_modelos(df_features_hist, verbose=False, salvar=False, n_jobs=n_jobs)
+    tempo_treino = time.time() - start_time
+    inicio_previsao = time.time()
+    probabilidades = prever_probabilidades(modelos, df_features_hist, compilar_florestas(modelos))
+    sugestao = selecionar_dezenas(probabilidades)
+    tempo_previsao = time.time() - inicio_previsao
+    return sugestao, time.time() - start_time, tempo_treino, tempo_previsao
+
+def _inicializar_processo(df_features, n_jobs, motor):
+    """
+    Guarda a matriz de features uma vez por processo, evitando reenviá-la a
+    cada concurso, e usa o mesmo motor de modelos do processo principal.
+    """
+    global _df_features_processo, _n_jobs_processo
+    _df_features_processo = df_features
+    _n_jobs_processo = n_jobs
+    ml_sugestoes.definir_motor(motor)
+
+def _testar_concurso_no_processo(concurso_real):
+    return testar_concurso(_df_features_processo, concurso_real, n_jobs=_n_jobs_processo)
+
+def _executar_testes(df_features, concursos, n_workers):
+    """
+    Gera o resultado de cada concurso testado, na ordem de `concursos`.
+    Com `n_workers` > 1 os concursos são distribuídos entre processos.
+    """
+    if n_workers <= 1:
+        for concurso_real in concursos:
+            yield testar_concurso(df_features, concurso_real)
+        return
+
+    # Divide os núcleos entre os processos para que as RandomForests de cada
+    # processo não disputem os mesmos núcleos
+    n_jobs = max(1, (os.cpu_count() or 1) // n_workers)
+    # O backtest também roda em uma thread de tarefas da aplicação web; um processo
+    # criado com fork herdaria travas seguradas por outras threads (métricas,
+    # registro de modelos, pool do SQLite). Com forkserver os processos partem
+    # de um servidor sem threads e o inicializador recria todo o estado necessário.
+    # Onde não há forkserver (Windows), spawn também parte de um processo novo
+    metodo = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+    with ProcessPoolExecutor(max_workers=n_workers, mp_context=multiprocessing.get_context(metodo),
+                             initializer=_inicializar_processo,
+                             initargs=(df_features, n_jobs, ml_sugestoes.MOTOR_MODELOS)) as executor:
+        yield from executor.map(_testar_concurso_no_processo, concursos)
+
+def gerar_eventos_backtest(periodo_testes, n_workers=1, usar_checkpoints=True):
+    """
+    Executa o backtest gerando um evento (dict) a cada passo, para que quem
+    o consome possa exibir o andamento enquanto ele roda.
+
+    Tipos de evento (campo "tipo"):
+        "aviso":    mensagem informativa ("mensagem").
+        "erro":     o backtest não pôde ser executado ("mensagem"); é o último evento.
+        "concurso": um concurso testado ("concurso", "indice", "total",
+                    "sugestao", "dezenas_reais", "acertos", "tempo",
+                    "tempo_treino" e "tempo_previsao" (None nos concursos de
+                    checkpoint) e "checkpoint", verdadeiro se veio de uma
+                    execução anterior).
+        "resumo":   o último evento, com "periodo" e a "distribuicao" de
+                    acertos [(pontos, vezes), ...] em ordem decrescente de pontos.
+
+    Os argumentos são os mesmos de `executar_backtest`.
+    """
     if periodo_testes <= 0:
-        print("O número de concursos deve ser positivo.")
-        return {}
+        yield {"tipo": "erro", "mensagem": "O número de concursos deve ser positivo."}
+        return
 
-    print("Carregando todo o histórico de resultados...")
+    yield {"tipo": "aviso", "mensagem": "Carregando todo o histórico de resultados..."}
     todos_resultados = obter_todos_os_resultados()
     
     if len(todos_resultados) < periodo_testes + 60: # 60 é uma margem de segurança para o treino inicial
-        print("Histórico de dados insuficiente para realizar o backtest com esse período.")
-        return {}
+        yield {"tipo": "erro", "mensagem": "Histórico de dados insuficiente para realizar o backtest com esse período."}
+        return
 
-    print(f"O backtest irá simular o treinamento e a previsão para cada um dos {periodo_testes} concursos.")
-    print("Este processo pode ser bastante demorado...")
+    yield {"tipo": "aviso", "mensagem": f"O backtest irá simular o treinamento e a previsão para cada um dos "
+                                        f"{periodo_testes} concursos."}
+    yield {"tipo": "aviso", "mensagem": "Este processo pode ser bastante demorado..."}
 
     # Separa os dados: uma parte para o teste e o resto para o treino inicial
-    dados_para_teste = todos_resultados[-periodo_testes:]
-    
-    resultados_backtest = []
+    inicio_teste = len(todos_resultados) - periodo_testes
+    dados_para_teste = todos_resultados[inicio_teste:]
+
+    estrategia = descrever_estrategia()
+    # Impressão digital do histórico de treino de cada concurso: quantos concursos
+    # vêm antes dele e qual é o anterior. Preencher uma lacuna do histórico muda a
+    # impressão dos concursos seguintes, e os checkpoints deles deixam de valer
+    historicos = {
+        concurso: f"{inicio_teste + i}:{todos_resultados[inicio_teste + i - 1][0]}"
+        for i, (concurso, _) in enumerate(dados_para_teste)
+    }
+    checkpoints = {}
+    if usar_checkpoints:
+        checkpoints = obter_checkpoints_backtest(estrategia, historicos)
+        if checkpoints:
+            yield {"tipo": "aviso",
+                   "mensagem": f"Reaproveitando {len(checkpoints)} concurso(s) já testado(s) com esta estratégia."}
+    pendentes = [concurso for concurso, _ in dados_para_teste if concurso not in checkpoints]
+
+    # Máscaras uint32 de todo o backtest: o resultado real de cada concurso, calculado
+    # de uma vez, e a sugestão, preenchida à medida que cada concurso é testado
+    mascaras_reais = matriz_para_mascaras(criar_matriz_sorteios(dados_para_teste)[1])
+    mascaras_sugestoes = np.zeros(len(dados_para_teste), dtype=np.uint32)
+
+    testes = iter([])
+    if pendentes:
+        # Todas as features são causais (usam apenas concursos anteriores), então a
+        # matriz de features do feature store serve para todo o backtest e cada
+        # iteração treina com o prefixo dos concursos anteriores ao concurso testado.
+        df_features = carregar_features()
+
+        if n_workers > 1:
+            yield {"tipo": "aviso", "mensagem": f"Distribuindo os concursos entre {n_workers} processos."}
+        testes = _executar_testes(df_features, pendentes, n_workers)
 
     # Loop principal do backtest
     for i, (concurso_real, dezenas_reais) in enumerate(dados_para_teste):
-        start_time = time.time()
-        print(f"\nTestando para o concurso {concurso_real} ({i+1}/{periodo_testes})...")
-
-        # Pega todos os resultados que vieram ANTES do concurso que estamos testando
-        dados_treino_historico = [r for r in todos_resultados if r[0] < concurso_real]
-
-        # 1. Roda todo o pipeline de features para os dados históricos
-        df_resultados_hist = criar_dataframe_features_para_backtest(dados_treino_historico)
-        df_atraso_hist = calcular_features_atraso(df_resultados_hist)
-        df_frequencia_hist = calcular_features_frequencia(df_resultados_hist)
-        df_lag_hist = calcular_feature_lag(df_resultados_hist)
-        df_soma_hist = calcular_feature_soma(df_resultados_hist)
-        
-        df_features_hist = pd.concat([df_resultados_hist, df_atraso_hist, df_frequencia_hist, df_lag_hist, df_soma_hist], axis=1)
-        df_features_hist = df_features_hist.dropna()
-        for j in range(1, 26):
-            if f'lag_{j}' in df_features_hist.columns:
-                df_features_hist[f'lag_{j}'] = df_features_hist[f'lag_{j}'].astype(int)
-        df_features_hist['soma_dezenas'] = df_features_hist['soma_dezenas'].astype(int)
-
-        # 2. Treina os modelos (sem salvar) e gera a sugestão para o concurso_real
-        # Usamos verbose=False para manter o output limpo
-        sugestao = treinar_ou_carregar_modelos_e_prever(df_features_hist, force_retrain=True, verbose=False)
-
-        # 3. Compara a sugestão com o resultado real
-        acertos = len(set(sugestao).intersection(set(dezenas_reais)))
-        resultados_backtest.append(acertos)
-        end_time = time.time()
-        print(f"Sugestão: {sugestao}")
-        print(f"Resultado Real: {dezenas_reais}")
-        print(f"=> Acertos: {acertos} (levou {end_time - start_time:.2f}s)")
-
-    # 4. Apresenta o relatório final
-    print("--- RELATÓRIO FINAL DO BACKTEST ---")
-    contagem_acertos = Counter(resultados_backtest)
+        do_checkpoint = concurso_real in checkpoints
+        if do_checkpoint:
+            sugestao, _, duracao = checkpoints[concurso_real]
+            tempo_treino = tempo_previsao = None
+        else:
+            sugestao, duracao, tempo_treino, tempo_previsao = next(testes)
+        # Acertos: bits em comum entre a máscara da sugestão e a do resultado real
+        mascaras_sugestoes[i] = dezenas_para_mascara(sugestao)
+        acertos = int(contar_acertos(mascaras_sugestoes[i], mascaras_reais[i]))
+        if not do_checkpoint:
+            # A duração vem do processo que testou o concurso, inclusive no backtest paralelo
+            metricas.observar("backtest", "concurso", duracao)
+            if usar_checkpoints:
+                salvar_checkpoint_backtest(estrategia, concurso_real, historicos[concurso_real], sugestao, acertos,
+                                           duracao)
+        yield {
+            "tipo": "concurso",
+            "concurso": concurso_real,
+            "indice": i + 1,
+            "total": periodo_testes,
+            "sugestao": [int(dezena) for dezena in sugestao],
+            "dezenas_reais": dezenas_reais,
+            "acertos": acertos,
+            "tempo": duracao,
+            "tempo_treino": tempo_treino,
+            "tempo_previsao": tempo_previsao,
+            "checkpoint": do_checkpoint,
+        }
+
+    # Distribuição dos acertos de todo o backtest, contados de uma vez com as máscaras,
+    # ordenada por número de acertos (pontos) em ordem decrescente
+    contagem_acertos = np.bincount(contar_acertos(mascaras_sugestoes, mascaras_reais), minlength=16)
+    resultados_ordenados = [(int(pontos), int(vezes)) for pontos, vezes in enumerate(contagem_acertos) if vezes][::-1]
+    yield {"tipo": "resumo", "periodo": periodo_testes, "distribuicao": resultados_ordenados}
+
+def executar_backtest(periodo_testes, n_workers=1, usar_checkpoints=True, ao_progresso=None):
+    """
+    Executa uma simulação histórica (backtest) para avaliar a performance da
+    estratégia de Machine Learning.
+
+    Args:
+        periodo_testes (int): Quantidade de concursos recentes para usar no teste.
+        n_workers (int): Quantidade de processos usados para testar os concursos
+            em paralelo. Com 1 (padrão) o backtest roda no processo atual.
+        usar_checkpoints (bool): Reaproveita os concursos já testados com a
+            mesma estratégia e salva cada novo concurso assim que termina,
+            permitindo retomar execuções interrompidas.
+        ao_progresso (callable): Se informado, é chamado como
+            `ao_progresso(concluidos, total, mensagem)` a cada concurso testado.
+
+    Returns:
+        dict: Um dicionário com a distribuição de acertos.
+    """    
+    for evento in gerar_eventos_backtest(periodo_testes, n_workers, usar_checkpoints):
+        if evento["tipo"] in ("aviso", "erro"):
+            print(evento["mensagem"])
+            if evento["tipo"] == "erro":
+                return {}
+        elif evento["tipo"] == "concurso":
+            print(f"\nTestando para o concurso {evento['concurso']} ({evento['indice']}/{evento['total']})...")
+            print(f"Sugestão: {evento['sugestao']}")
+            print(f"Resultado Real: {evento['dezenas_reais']}")
+            print(f"=> Acertos: {evento['acertos']} (levou {evento['tempo']:.2f}s)")
+            if ao_progresso:
+                ao_progresso(evento['indice'], evento['total'], f"Concurso {evento['concurso']}: {evento['acertos']} acertos")
+        else:
+            # 4. Apresenta o relatório final
+            print("--- RELATÓRIO FINAL DO BACKTEST ---")
+            print(f"Período testado: {evento['periodo']} concursos.")
+            print("Distribuição de acertos:")
+            for acertos, contagem in evento["distribuicao"]:
+                print(f"- {acertos} pontos: {contagem} vez(es)")
+            return evento["distribuicao"]
+
+def comparar_motores(periodo_testes, n_workers=1, motores=ml_sugestoes.MOTORES):
+    """
+    Executa o mesmo backtest com cada motor de modelos (ver
+    ml_sugestoes.MOTORES) e imprime, lado a lado, a distribuição de acertos e
+    os tempos médios de treino e de previsão por concurso.
+    Os checkpoints não são usados, para que todos os tempos sejam medidos.
+
+    Returns:
+        dict: {motor: {"distribuicao", "acertos_medios", "tempo_treino",
+        "tempo_previsao", "tempo_total"}}, com os tempos em segundos.
+    """
+    motor_original = ml_sugestoes.MOTOR_MODELOS
+    comparacao = {}
+    try:
+        for motor in motores:
+            ml_sugestoes.definir_motor(motor)
+            print(f"\n--- Backtest com o motor '{motor}' ---")
+            inicio = time.time()
+            acertos, tempos_treino, tempos_previsao = [], [], []
+            for evento in gerar_eventos_backtest(periodo_testes, n_workers, usar_checkpoints=False):
+                if evento["tipo"] in ("aviso", "erro"):
+                    print(evento["mensagem"])
+                    if evento["tipo"] == "erro":
+                        return {}
+                elif evento["tipo"] == "concurso":
+                    acertos.append(evento["acertos"])
+                    tempos_treino.append(evento["tempo_treino"])
+                    tempos_previsao.append(evento["tempo_previsao"])
+                    print(f"Concurso {evento['concurso']} ({evento['indice']}/{evento['total']}): "
+                          f"{evento['acertos']} acertos (treino {evento['tempo_treino']:.2f}s, "
+                          f"previsão {evento['tempo_previsao'] * 1000:.1f}ms)")
+                else:
+                    comparacao[motor] = {
+                        "distribuicao": evento["distribuicao"],
+                        "acertos_medios": sum(acertos) / len(acertos),
+                        "tempo_treino": sum(tempos_treino) / len(tempos_treino),
+                        "tempo_previsao": sum(tempos_previsao) / len(tempos_previsao),
+                        "tempo_total": time.time() - inicio,
+                    }
+    finally:
+        ml_sugestoes.definir_motor(motor_original)
+
+    print("\n--- COMPARAÇÃO DOS MOTORES ---")
     print(f"Período testado: {periodo_testes} concursos.")
+    print(f"{'motor':<12} {'acertos médios':>15} {'treino médio':>13} {'previsão média':>15} {'tempo total':>12}")
+    for motor, resultado in comparacao.items():
+        print(f"{motor:<12} {resultado['acertos_medios']:>15.2f} {resultado['tempo_treino']:>12.2f}s "
+              f"{resultado['tempo_previsao'] * 1000:>13.1f}ms {resultado['tempo_total']:>11.1f}s")
+    pontos = sorted({acertos for resultado in comparacao.values() for acertos, _ in resultado["distribuicao"]},
+                    reverse=True)
     print("Distribuição de acertos:")
-    
-    # Ordena os resultados por número de acertos (pontos) em ordem decrescente
-    resultados_ordenados = sorted(contagem_acertos.items(), key=lambda item: item[0], reverse=True)
-
-    for acertos, contagem in resultados_ordenados:
-        print(f"- {acertos} pontos: {contagem} vez(es)")
-    
-    return resultados_ordenados
-
-def criar_dataframe_features_para_backtest(resultados):
-    """ Versão modificada de criar_dataframe_features para o backtest """
-    if not resultados:
-        return pd.DataFrame()
-    dados = []
-    for concurso, dezenas in resultados:
-        linha = {'concurso': concurso}
-        for i in range(1, 26):
-            linha[f'dezena_{i}'] = 1 if i in dezenas else 0
-        dados.append(linha)
-    df = pd.DataFrame(dados)
-    df = df.set_index('concurso')
-    df = df.sort_index()
-    return df
+    for acertos in pontos:
+        vezes = "  ".join(f"{motor}: {dict(resultado['distribuicao']).get(acertos, 0)}"
+                          for motor, resultado in comparacao.items())
+        print(f"- {acertos} pontos: {vezes}")
+    return comparacao
 
 # Exemplo de como usar (para teste)
 if __name__ == '__main__':
+    import database
+    database.inicializar()
     executar_backtest(50)
@@ -0,0 +1,559 @@
+"""
+Benchmarks dos caminhos críticos com históricos sintéticos.
+
+Uso:
+    python benchmark.py                               # 1.000 e 10.000 concursos
+    python benchmark.py --tamanhos 1000 10000 100000 --saida relatorio.json
+    python benchmark.py --comparar relatorio_anterior.json
+
+Cada tamanho roda em um diretório temporário próprio (banco, feature store e
+modelos), então o banco e os modelos de trabalho não são tocados.
+"""
+import argparse
+from contextlib import contextmanager, redirect_stdout
+import io
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+# Tamanhos (em concursos) usados quando nenhum é informado
+TAMANHOS_PADRAO = [1000, 10000]
+# Repetições cronometradas de cada benchmark (o treino e o backtest rodam uma vez só, sem medir a memória)
+REPETICOES_PADRAO = 3
+# Concursos testados no backtest curto
+PERIODO_BACKTEST = 3
+# Sugestões pendentes usadas no benchmark de atualização de acertos
+SUGESTOES_PENDENTES = 5000
+# Módulos cujo tempo de importação é medido em um processo novo (partida a frio)
+MODULOS_IMPORTACAO = ["database", "main", "app", "ml_sugestoes"]
+# Processos novos iniciados em cada benchmark de partida
+REPETICOES_IMPORTACAO = 5
+# Formatos de modelos comparados com --artefatos: None é o layout de um arquivo
+# joblib por dezena; os demais são as opções do artefato compacto (ver artefato.py)
+VARIANTES_ARTEFATO = {
+    "joblib": None,
+    "compacto": {},
+    "compacto_zlib": {"compressao": "zlib"},
+    "compacto_quantizado": {"precisao_limiares": "float32", "precisao_probabilidades": "float16"},
+    "compacto_podado": {"max_arvores": 50, "profundidade_maxima": 12},
+}
+# Processos que carregam os modelos ao mesmo tempo, como os workers da aplicação web
+PROCESSOS_ARTEFATO = 4
+
+# Executado em cada processo da comparação de artefatos: carrega os modelos,
+# faz uma previsão e espera (stdin) o processo principal medir a memória
+_CODIGO_PROCESSO_ARTEFATO = """
+import json, sys, time
+sys.path.insert(0, {raiz!r})
+import benchmark, features, ml_sugestoes
+opcoes = json.loads(sys.argv[1])
+ml_sugestoes.ARTEFATO_COMPACTO = opcoes is not None
+if opcoes is not None:
+    ml_sugestoes.OPCOES_ARTEFATO.update(opcoes)
+    ml_sugestoes.ARQUIVO_ARTEFATO = sys.argv[2]
+df_features = features.carregar_features()
+antes = benchmark._memoria_processo()
+inicio = time.perf_counter()
+probabilidades = ml_sugestoes.calcular_probabilidades(df_features, verbose=False)
+tempo = time.perf_counter() - inicio
+print(json.dumps({{"tempo": tempo, "memoria": antes, "probabilidades": [probabilidades[i] for i in range(1, 26)]}}),
+      flush=True)
+sys.stdin.read()
+"""
+VERSAO_RELATORIO = 1
+
+def gerar_historico_sintetico(n_concursos, semente=0):
+    """
+    Gera, de forma determinística, um histórico [(concurso, dezenas), ...] com
+    `n_concursos` sorteios de 15 dezenas distintas entre 1 e 25.
+    """
+    rng = np.random.default_rng(semente)
+    # As 15 menores posições de uma permutação aleatória de 25 são um sorteio sem repetição
+    sorteios = np.sort(np.argsort(rng.random((n_concursos, 25)), axis=1)[:, :15] + 1, axis=1)
+    return [(concurso, [int(dezena) for dezena in dezenas])
+            for concurso, dezenas in enumerate(sorteios, start=1)]
+
+# --- Pipeline de features antigo ---
+# Construção das features coluna a coluna com pandas (iterrows, rolling), como era
+# feita antes do motor de features (features.py). Fica aqui só como referência
+# de desempenho nos benchmarks.
+
+def criar_dataframe_features():
+    """
+    Cria um DataFrame do pandas com todos os resultados e a presença de cada dezena.
+    """
+    import pandas as pd
+    import database
+
+    # Obter todos os resultados do banco de dados
+    resultados = database.obter_todos_os_resultados()
+    if not resultados:
+        return pd.DataFrame()
+
+    # Converter para um formato mais fácil de analisar
+    dados = []
+    for concurso, dezenas in resultados:
+        linha = {'concurso': concurso}
+        # Adiciona uma coluna para cada dezena, marcando 1 se ela foi sorteada
+        for i in range(1, 26):
+            linha[f'dezena_{i}'] = 1 if i in dezenas else 0
+        dados.append(linha)
+
+    df = pd.DataFrame(dados)
+    df = df.set_index('concurso')
+    df = df.sort_index()
+    return df
+
+def calcular_features_atraso(df):
+    """
+    Calcula o atraso de cada dezena (há quantos concursos não aparece).
+    """
+    import pandas as pd
+    import features
+
+    colunas_dezenas = [f'dezena_{i}' for i in range(1, 26)]
+    colunas_atraso = [f'atraso_{i}' for i in range(1, 26)]
+    if df.empty:
+        return pd.DataFrame(index=df.index, columns=colunas_atraso)
+
+    atrasos = features.calcular_atrasos(df.index.to_numpy(), df[colunas_dezenas].to_numpy())
+    return pd.DataFrame(atrasos, index=df.index, columns=colunas_atraso)
+
+def calcular_features_frequencia(df):
+    """
+    Calcula a frequência de cada dezena nas últimas N janelas (10, 20, 50).
+    """
+    import pandas as pd
+
+    df_frequencia = pd.DataFrame(index=df.index)
+    janelas = [10, 20, 50]
+    for i in range(1, 26):
+        dezena_col = f'dezena_{i}'
+        for j in janelas:
+            # Usamos shift(1) para que a frequência seja baseada nos jogos *anteriores*
+            df_frequencia[f'freq_{j}_{i}'] = df[dezena_col].shift(1).rolling(window=j).sum()
+
+    # Remove as linhas que terão valores NaN devido à janela de rolling
+    df_frequencia = df_frequencia.dropna()
+    return df_frequencia
+
+def calcular_feature_lag(df):
+    """
+    Cria a feature de lag (se a dezena saiu no concurso anterior).
+    """
+    import pandas as pd
+
+    df_lag = pd.DataFrame(index=df.index)
+    for i in range(1, 26):
+        # A feature de lag é simplesmente o resultado da dezena no concurso anterior
+        df_lag[f'lag_{i}'] = df[f'dezena_{i}'].shift(1)
+    return df_lag
+
+def calcular_feature_soma(df):
+    """
+    Calcula a soma das dezenas sorteadas para cada concurso.
+    """
+    import pandas as pd
+
+    df_soma = pd.DataFrame(index=df.index)
+    somas = []
+    for index, row in df.iterrows():
+        # Pega apenas as colunas de dezenas (dezena_1 a dezena_25)
+        dezenas_sorteadas_no_concurso = [i for i in range(1, 26) if row[f'dezena_{i}'] == 1]
+        somas.append(sum(dezenas_sorteadas_no_concurso))
+
+    # Usamos shift(1) para que a feature seja baseada no concurso *anterior*
+    df_soma['soma_dezenas'] = pd.Series(somas, index=df.index).shift(1)
+    return df_soma
+
+def _medir(funcao, repeticoes, preparar=None, medir_memoria=True):
+    """
+    Executa `funcao` `repeticoes` vezes cronometrando cada execução e, se
+    `medir_memoria`, mede o pico de memória com o tracemalloc em uma execução
+    a mais (o tracemalloc deixa o código bem mais lento, por isso ela não
+    entra nos tempos). `preparar` (não cronometrada) roda antes de cada execução.
+    """
+    tempos = []
+    for _ in range(repeticoes):
+        if preparar:
+            preparar()
+        inicio = time.perf_counter()
+        funcao()
+        tempos.append(time.perf_counter() - inicio)
+
+    pico = None
+    if medir_memoria:
+        if preparar:
+            preparar()
+        tracemalloc.start()
+        try:
+            funcao()
+            _, pico = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+    return {
+        "tempos": [round(t, 6) for t in tempos],
+        "mediana": round(statistics.median(tempos), 6),
+        "minimo": round(min(tempos), 6),
+        "pico_memoria_mb": round(pico / 2 ** 20, 3) if pico is not None else None,
+    }
+
+@contextmanager
+def _diretorio_isolado():
+    """Roda o bloco em um diretório temporário, onde ficam o banco, o feature store e os modelos."""
+    anterior = os.getcwd()
+    with tempfile.TemporaryDirectory(prefix="benchmark_lotofacil_") as diretorio:
+        os.chdir(diretorio)
+        try:
+            yield diretorio
+        finally:
+            os.chdir(anterior)
+
+def _preparar_banco():
+    import database
+    database.inicializar()
+
+def executar_benchmarks(n_concursos, repeticoes=REPETICOES_PADRAO, semente=0):
+    """Roda todos os benchmarks para um histórico sintético de `n_concursos` e retorna {nome: medidas}."""
+    import backtest
+    import cache
+    import database
+    import features
+    import ml_sugestoes
+    import sugestoes
+
+    resultados = {}
+
+    def registrar(nome, funcao, repeticoes=repeticoes, preparar=None, medir_memoria=True):
+        print(f"  {nome}...", end=" ", flush=True)
+        # As funções medidas imprimem o próprio andamento; aqui só interessa o tempo
+        with redirect_stdout(io.StringIO()):
+            medidas = _medir(funcao, repeticoes, preparar, medir_memoria)
+        resultados[nome] = medidas
+        if medidas["pico_memoria_mb"] is None:
+            print(f"{medidas['mediana']:.4f}s")
+        else:
+            print(f"{medidas['mediana']:.4f}s (pico {medidas['pico_memoria_mb']:.1f} MiB)")
+
+    registrar("sintetico.gerar_historico", lambda: gerar_historico_sintetico(n_concursos, semente))
+    historico = gerar_historico_sintetico(n_concursos, semente)
+
+    with _diretorio_isolado():
+        with redirect_stdout(io.StringIO()):
+            _preparar_banco()
+
+        # --- Banco de dados ---
+        def limpar_resultados():
+            with database.transacao() as conn:
+                conn.execute("DELETE FROM resultados;")
+            cache.invalidar()
+        registrar("database.inserir_resultados", lambda: database.inserir_resultados(historico),
+                  preparar=limpar_resultados)
+        database.inserir_resultados(historico)
+        registrar("database.obter_todos_os_resultados", database.obter_todos_os_resultados)
+
+        rng = random.Random(semente)
+        ultimos = [concurso for concurso, _ in historico[-100:]]
+        for i in range(SUGESTOES_PENDENTES):
+            database.salvar_sugestao(i % 50, ultimos[i % len(ultimos)], sorted(rng.sample(range(1, 26), 15)), f"bench {i}")
+        def reabrir_sugestoes():
+            with database.transacao() as conn:
+                conn.execute("UPDATE sugestoes_salvas SET acertos = NULL, resultado_concurso = NULL;")
+        registrar("database.atualizar_acertos_sugestoes", database.atualizar_acertos_sugestoes,
+                  preparar=reabrir_sugestoes)
+
+        # --- Features ---
+        # O pipeline antigo mantém os nomes dos relatórios anteriores, quando ficava em ml_sugestoes
+        registrar("ml_sugestoes.criar_dataframe_features", criar_dataframe_features)
+        df = criar_dataframe_features()
+        for funcao in (calcular_features_atraso, calcular_features_frequencia,
+                       calcular_feature_lag, calcular_feature_soma):
+            registrar(f"ml_sugestoes.{funcao.__name__}", lambda funcao=funcao: funcao(df))
+        registrar("features.calcular_features", lambda: features.calcular_features(historico))
+        df_features = features.carregar_features()
+
+        # --- Modelos ---
+        def esquecer_modelos():
+            # Força a leitura dos arquivos (joblib e artefato), como no primeiro uso de um processo novo
+            with ml_sugestoes._trava_registro:
+                ml_sugestoes._registro_modelos.update(versao=None, modelos=None, florestas=None)
+                ml_sugestoes._registro_artefato.update(versao=None, florestas=None)
+        def carregar_modelos(artefato_compacto):
+            # Com o artefato desligado, os modelos vêm dos arquivos joblib de cada dezena
+            anterior = ml_sugestoes.ARTEFATO_COMPACTO
+            ml_sugestoes.ARTEFATO_COMPACTO = artefato_compacto
+            try:
+                return ml_sugestoes.treinar_ou_carregar_modelos_e_prever(df_features, verbose=False)
+            finally:
+                ml_sugestoes.ARTEFATO_COMPACTO = anterior
+        registrar("ml_sugestoes.treinar_ou_carregar_modelos_e_prever[treino]",
+                  lambda: ml_sugestoes.treinar_ou_carregar_modelos_e_prever(df_features, force_retrain=True,
+                                                                             verbose=False),
+                  repeticoes=1, medir_memoria=False)
+        registrar("ml_sugestoes.treinar_ou_carregar_modelos_e_prever[carregar_joblib]",
+                  lambda: carregar_modelos(False), preparar=esquecer_modelos)
+        registrar("ml_sugestoes.treinar_ou_carregar_modelos_e_prever[carregar_artefato]",
+                  lambda: carregar_modelos(True), preparar=esquecer_modelos)
+
+        # --- Sugestões por frequência ---
+        proximo = historico[-1][0] + 1
+        def preparar_sugestoes():
+            cache.invalidar()
+            random.seed(semente)
+        registrar("sugestoes.gerar_sugestoes",
+                  lambda: sugestoes.gerar_sugestoes(database.obter_todos_os_resultados(), proximo, 1),
+                  preparar=preparar_sugestoes)
+
+        # --- Backtest curto ---
+        registrar(f"backtest.executar_backtest[{PERIODO_BACKTEST}]",
+                  lambda: backtest.executar_backtest(PERIODO_BACKTEST, usar_checkpoints=False),
+                  repeticoes=1, medir_memoria=False)
+
+    return resultados
+
+def _medir_processo(comando, repeticoes, diretorio):
+    """
+    Roda `comando` em um processo novo `repeticoes` vezes e mede o tempo de
+    cada execução: o informado pelo próprio processo na última linha da saída
+    ou, se ela não for um número, o tempo total do processo.
+    """
+    tempos = []
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        saida = subprocess.run(comando, cwd=diretorio, capture_output=True, text=True, check=True).stdout
+        duracao = time.perf_counter() - inicio
+        try:
+            duracao = float(saida.strip().splitlines()[-1])
+        except (IndexError, ValueError):
+            pass
+        tempos.append(duracao)
+    return {
+        "tempos": [round(t, 6) for t in tempos],
+        "mediana": round(statistics.median(tempos), 6),
+        "minimo": round(min(tempos), 6),
+        "pico_memoria_mb": None,
+    }
+
+def executar_benchmarks_importacao(repeticoes=REPETICOES_IMPORTACAO):
+    """
+    Mede a partida a frio: o tempo de importar cada módulo de MODULOS_IMPORTACAO
+    (o que um processo da aplicação web paga ao subir) e o tempo total de
+    `python main.py --help`. Roda em um diretório temporário, então eventuais
+    arquivos criados na importação não ficam no diretório de trabalho.
+    """
+    raiz = os.path.dirname(os.path.abspath(__file__))
+    resultados = {}
+    with tempfile.TemporaryDirectory(prefix="benchmark_lotofacil_") as diretorio:
+        for modulo in MODULOS_IMPORTACAO:
+            codigo = (f"import sys, time; sys.path.insert(0, {raiz!r}); inicio = time.perf_counter(); "
+                      f"import {modulo}; print(time.perf_counter() - inicio)")
+            nome = f"importacao.{modulo}"
+            print(f"  {nome}...", end=" ", flush=True)
+            resultados[nome] = _medir_processo([sys.executable, "-c", codigo], repeticoes, diretorio)
+            print(f"{resultados[nome]['mediana']:.4f}s")
+        nome = "processo.main --help"
+        print(f"  {nome}...", end=" ", flush=True)
+        resultados[nome] = _medir_processo([sys.executable, os.path.join(raiz, "main.py"), "--help"],
+                                           repeticoes, diretorio)
+        print(f"{resultados[nome]['mediana']:.4f}s")
+    return resultados
+
+def _memoria_processo(pid="self"):
+    """
+    Retorna {"rss_mb", "pss_mb", "privada_mb"} do processo, lidos de
+    /proc/<pid>/smaps_rollup (Linux), ou None se não estiver disponível. O PSS
+    divide cada página compartilhada entre os processos que a usam.
+    """
+    campos = {"Rss": "rss_mb", "Pss": "pss_mb", "Private_Clean": "privada_mb", "Private_Dirty": "privada_mb"}
+    memoria = {"rss_mb": 0.0, "pss_mb": 0.0, "privada_mb": 0.0}
+    try:
+        with open(f"/proc/{pid}/smaps_rollup", encoding="ascii") as arquivo:
+            for linha in arquivo:
+                nome, _, valor = linha.partition(":")
+                if nome in campos:
+                    memoria[campos[nome]] += int(valor.split()[0]) / 1024
+    except OSError:
+        return None
+    return memoria
+
+def executar_comparacao_artefatos(n_concursos, semente=0, processos=PROCESSOS_ARTEFATO):
+    """
+    Treina os modelos com um histórico sintético e compara, para cada formato
+    de VARIANTES_ARTEFATO, o tamanho em disco, o tempo de carga + primeira
+    previsão e a memória acrescentada a cada um de `processos` processos que
+    carregam os modelos ao mesmo tempo, além da diferença das probabilidades
+    para o `predict_proba` dos modelos originais.
+    """
+    import ml_sugestoes
+
+    raiz = os.path.dirname(os.path.abspath(__file__))
+    resultados = {}
+    with _diretorio_isolado() as diretorio:
+        with redirect_stdout(io.StringIO()):
+            import database
+            import features
+            _preparar_banco()
+            database.inserir_resultados(gerar_historico_sintetico(n_concursos, semente))
+            df_features = features.carregar_features()
+            ml_sugestoes.ARTEFATO_COMPACTO = False
+            modelos = ml_sugestoes.treinar_modelos(df_features, verbose=False)
+            referencia = ml_sugestoes.prever_probabilidades(modelos, df_features)
+        referencia = np.array([referencia[i] for i in range(1, 26)])
+        dezenas_referencia = ml_sugestoes.selecionar_dezenas(dict(zip(range(1, 26), referencia)))
+        opcoes_originais = dict(ml_sugestoes.OPCOES_ARTEFATO)
+        arquivo_original = ml_sugestoes.ARQUIVO_ARTEFATO
+
+        try:
+            for variante, opcoes in VARIANTES_ARTEFATO.items():
+                print(f"  {variante}...", end=" ", flush=True)
+                arquivo_artefato = f"modelos_{variante}.lfm"
+                if opcoes is None:
+                    tamanho = sum(os.path.getsize(ml_sugestoes.caminho_modelo(i)) for i in range(1, 26))
+                else:
+                    # Gera o artefato da variante antes, para que os processos só o carreguem
+                    ml_sugestoes.ARTEFATO_COMPACTO = True
+                    ml_sugestoes.ARQUIVO_ARTEFATO = arquivo_artefato
+                    ml_sugestoes.OPCOES_ARTEFATO = dict(opcoes_originais, **opcoes)
+                    with redirect_stdout(io.StringIO()):
+                        ml_sugestoes.calcular_probabilidades(df_features, verbose=False)
+                    tamanho = os.path.getsize(ml_sugestoes.caminho_artefato())
+
+                codigo = _CODIGO_PROCESSO_ARTEFATO.format(raiz=raiz)
+                filhos = [subprocess.Popen([sys.executable, "-c", codigo, json.dumps(opcoes), arquivo_artefato],
+                                           cwd=diretorio, stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True)
+                          for _ in range(processos)]
+                try:
+                    # Cada processo informa o tempo e a memória antes da carga e fica esperando
+                    medidas = [json.loads(filho.stdout.readline()) for filho in filhos]
+                    # Com todos vivos, as páginas compartilhadas aparecem divididas no PSS
+                    memorias = [_memoria_processo(filho.pid) for filho in filhos]
+                finally:
+                    for filho in filhos:
+                        filho.communicate("")
+
+                tempos = [medida["tempo"] for medida in medidas]
+                probabilidades = np.array(medidas[0]["probabilidades"])
+                resultado = {
+                    "tamanho_mb": round(tamanho / 2 ** 20, 3),
+                    "tempos": [round(t, 6) for t in tempos],
+                    "mediana": round(statistics.median(tempos), 6),
+                    "diferenca_maxima": float(np.abs(probabilidades - referencia).max()),
+                    "mesmas_dezenas": ml_sugestoes.selecionar_dezenas(
+                        dict(zip(range(1, 26), probabilidades))) == dezenas_referencia,
+                }
+                if all(memorias) and all(medida["memoria"] for medida in medidas):
+                    for campo in ("rss_mb", "pss_mb", "privada_mb"):
+                        resultado[f"{campo}_por_processo"] = round(statistics.median(
+                            depois[campo] - medida["memoria"][campo] for depois, medida in zip(memorias, medidas)), 3)
+                resultados[variante] = resultado
+                print(f"{resultado['mediana']:.4f}s, {resultado['tamanho_mb']:.1f} MiB em disco")
+        finally:
+            ml_sugestoes.ARTEFATO_COMPACTO = True
+            ml_sugestoes.OPCOES_ARTEFATO = opcoes_originais
+            ml_sugestoes.ARQUIVO_ARTEFATO = arquivo_original
+    return resultados
+
+def imprimir_comparacao_artefatos(comparacao):
+    """Imprime a comparação de formatos de modelos como uma tabela."""
+    for tamanho, variantes in comparacao.items():
+        print(f"\n=== Formatos de modelos, {tamanho} concursos ===")
+        print(f"  {'formato':22s} {'disco':>9s} {'carga':>9s} {'RSS/proc':>9s} {'PSS/proc':>9s} "
+              f"{'priv/proc':>9s} {'dif. max':>9s}  mesmas dezenas")
+        for variante, r in variantes.items():
+            memoria = [f"{r[campo]:8.1f}M" if campo in r else f"{'-':>9s}"
+                       for campo in ("rss_mb_por_processo", "pss_mb_por_processo", "privada_mb_por_processo")]
+            print(f"  {variante:22s} {r['tamanho_mb']:8.1f}M {r['mediana']:8.3f}s {' '.join(memoria)} "
+                  f"{r['diferenca_maxima']:9.2g}  {'sim' if r['mesmas_dezenas'] else 'não'}")
+
+def _commit_atual():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def gerar_relatorio(tamanhos, repeticoes=REPETICOES_PADRAO, semente=0):
+    """
+    Roda os benchmarks de partida e os de cada tamanho e retorna o relatório
+    (dict serializável em JSON).
+    """
+    import sklearn
+    import pandas as pd
+
+    relatorio = {
+        "versao": VERSAO_RELATORIO,
+        "commit": _commit_atual(),
+        "data": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "ambiente": {
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "pandas": pd.__version__,
+            "scikit-learn": sklearn.__version__,
+            "plataforma": platform.platform(),
+            "cpus": os.cpu_count(),
+        },
+        "repeticoes": repeticoes,
+        "semente": semente,
+        "resultados": {},
+    }
+    print("\n=== partida ===")
+    relatorio["resultados"]["partida"] = executar_benchmarks_importacao()
+    for n_concursos in tamanhos:
+        print(f"\n=== {n_concursos} concursos ===")
+        relatorio["resultados"][str(n_concursos)] = executar_benchmarks(n_concursos, repeticoes, semente)
+    return relatorio
+
+def comparar_relatorios(anterior, atual):
+    """Imprime, para cada benchmark presente nos dois relatórios, a razão entre as medianas (atual/anterior)."""
+    print(f"\nComparação: {anterior.get('commit')} -> {atual.get('commit')} (razão < 1 = mais rápido)")
+    for tamanho, medidas in atual.get("resultados", {}).items():
+        base = anterior.get("resultados", {}).get(tamanho)
+        if not base:
+            continue
+        print(f"\n=== {tamanho} ===" if tamanho == "partida" else f"\n=== {tamanho} concursos ===")
+        for nome, medida in medidas.items():
+            if nome not in base:
+                continue
+            razao = medida["mediana"] / base[nome]["mediana"] if base[nome]["mediana"] else float("inf")
+            print(f"  {nome:70s} {base[nome]['mediana']:10.4f}s -> {medida['mediana']:10.4f}s  x{razao:.2f}")
+
+if __name__ == "__main__":
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    parser = argparse.ArgumentParser(description="Benchmarks do Analisador Lotofácil com históricos sintéticos.")
+    parser.add_argument("--tamanhos", type=int, nargs="*", default=TAMANHOS_PADRAO,
+                        help="quantidades de concursos do histórico sintético (padrão: 1000 10000); "
+                             "sem valores, mede apenas a partida")
+    parser.add_argument("--repeticoes", type=int, default=REPETICOES_PADRAO)
+    parser.add_argument("--semente", type=int, default=0)
+    parser.add_argument("--saida", default="benchmark.json", help="arquivo JSON do relatório")
+    parser.add_argument("--comparar", help="relatório JSON anterior para comparação")
+    parser.add_argument("--artefatos", action="store_true",
+                        help="compara apenas os formatos de modelos (joblib x artefato compacto) nos tamanhos informados")
+    args = parser.parse_args()
+
+    if args.artefatos:
+        relatorio = {"versao": VERSAO_RELATORIO, "commit": _commit_atual(), "data": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                     "processos": PROCESSOS_ARTEFATO, "artefatos": {}}
+        for n_concursos in args.tamanhos:
+            print(f"\n=== Formatos de modelos, {n_concursos} concursos ===")
+            relatorio["artefatos"][str(n_concursos)] = executar_comparacao_artefatos(n_concursos, args.semente)
+        imprimir_comparacao_artefatos(relatorio["artefatos"])
+    else:
+        relatorio = gerar_relatorio(args.tamanhos, args.repeticoes, args.semente)
+    with open(args.saida, "w", encoding="utf-8") as arquivo:
+        json.dump(relatorio, arquivo, indent=2)
+    print(f"\nRelatório salvo em {args.saida}.")
+
+    if args.comparar:
+        with open(args.comparar, encoding="utf-8") as arquivo:
+            comparar_relatorios(json.load(arquivo), relatorio)
@@ -0,0 +1,47 @@
+from collections import OrderedDict
+import threading
+
+# Quantidade máxima de resultados guardados em memória
+TAMANHO_MAXIMO_CACHE = 128
+
+class CacheLRU:
+    """
+    Cache em memória com tamanho limitado: quando fica cheio, descarta o item
+    usado há mais tempo. Pode ser usado por várias threads ao mesmo tempo.
+    """
+
+    def __init__(self, tamanho_maximo=TAMANHO_MAXIMO_CACHE):
+        self.tamanho_maximo = tamanho_maximo
+        self._itens = OrderedDict()
+        self._trava = threading.Lock()
+
+    def obter(self, chave, padrao=None):
+        """Retorna o valor guardado para `chave`, ou `padrao` se não existir."""
+        with self._trava:
+            if chave not in self._itens:
+                return padrao
+            self._itens.move_to_end(chave)
+            return self._itens[chave]
+
+    def guardar(self, chave, valor):
+        """Guarda `valor` para `chave`, descartando o item mais antigo se necessário."""
+        with self._trava:
+            self._itens[chave] = valor
+            self._itens.move_to_end(chave)
+            while len(self._itens) > self.tamanho_maximo:
+                self._itens.popitem(last=False)
+
+    def limpar(self):
+        """Remove todos os itens do cache."""
+        with self._trava:
+            self._itens.clear()
+
+    def __len__(self):
+        return len(self._itens)
+
+# Rankings e probabilidades calculados, com chave (último concurso, versão do modelo, estratégia)
+cache_resultados = CacheLRU()
+
+def invalidar():
+    """Descarta os resultados calculados; chamado quando novos concursos são inseridos."""
+    cache_resultados.limpar()
@@ -1,55 +1,245 @@
 import sqlite3
 import json
+import os
+import threading
+from contextlib import contextmanager
+import cache
+import metricas
 
 DB_FILE = "lotofacil.db"
 
+# Conexões ociosas mantidas no pool para reaproveitamento entre threads/requisições
+TAMANHO_POOL = 8
+# Quantidade de comandos SQL preparados mantidos em cache por conexão
+COMANDOS_EM_CACHE = 256
+# Tamanho do cache de páginas do SQLite por conexão (em KiB)
+CACHE_PAGINAS_KB = 16384
+# Tempo (em segundos) que uma escrita espera enquanto outra conexão está escrevendo
+TEMPO_ESPERA_BLOQUEIO = 30
+# Quantidade de concursos gravados por transação na inserção em lote
+TAMANHO_LOTE_INGESTAO = 500
+# Quantidade de sugestões salvas exibidas por página
+TAMANHO_PAGINA_SUGESTOES = 50
+
+# Funções chamadas depois que novos concursos são inseridos (ex.: atualização do feature store)
+_ouvintes_insercao = []
+# Bancos (caminho absoluto) já preparados por inicializar() neste processo
+_bancos_inicializados = set()
+_trava_inicializacao = threading.Lock()
+
+def dezenas_para_mascara(dezenas):
+    """Converte uma lista de dezenas (1 a 25) em um inteiro de 25 bits: o bit i-1 marca a dezena i."""
+    mascara = 0
+    for dezena in dezenas:
+        mascara |= 1 << (int(dezena) - 1)
+    return mascara
+
+def mascara_para_dezenas(mascara):
+    """Converte uma máscara de 25 bits de volta para a lista ordenada de dezenas."""
+    return [i for i in range(1, 26) if mascara >> (i - 1) & 1]
+
+def contar_bits(mascara):
+    """Conta os bits ligados (popcount); `contar_bits(a & b)` é o número de acertos entre duas máscaras."""
+    if mascara is None:
+        return None
+    return bin(mascara).count("1")
+
 def conectar_db():
-    """Cria uma conexão com o banco de dados."""
-    conn = sqlite3.connect(DB_FILE)
+    """Cria uma nova conexão com o banco de dados, já configurada."""
+    conn = sqlite3.connect(DB_FILE, timeout=TEMPO_ESPERA_BLOQUEIO, check_same_thread=False,
+                           cached_statements=COMANDOS_EM_CACHE)
+    # WAL: leitores não bloqueiam (nem são bloqueados por) quem está escrevendo
+    conn.execute("PRAGMA journal_mode=WAL;")
+    # Com WAL, NORMAL só sincroniza o disco nos checkpoints e continua seguro contra corrupção
+    conn.execute("PRAGMA synchronous=NORMAL;")
+    conn.execute(f"PRAGMA cache_size=-{CACHE_PAGINAS_KB};")
+    # Disponibiliza popcount(x) nas consultas SQL, ex.: popcount(a.mascara & b.mascara)
+    conn.create_function("popcount", 1, contar_bits, deterministic=True)
     return conn
 
+class PoolConexoes:
+    """
+    Pool de conexões SQLite compartilhado pelas threads do processo.
+
+    Cada thread pega uma conexão emprestada em `conexao()` e a devolve ao
+    final; chamadas aninhadas na mesma thread reaproveitam a conexão já
+    emprestada. Um processo filho (fork) descarta as conexões herdadas.
+    """
+
+    def __init__(self, tamanho_maximo=TAMANHO_POOL):
+        self.tamanho_maximo = tamanho_maximo
+        self._ociosas = []
+        self._trava = threading.Lock()
+        self._local = threading.local()
+        self._chave = None
+
+    def _chave_atual(self):
+        return (os.getpid(), os.path.abspath(DB_FILE))
+
+    def _pegar(self):
+        with self._trava:
+            chave = self._chave_atual()
+            if chave != self._chave:
+                # Banco trocado ou processo novo: as conexões antigas não servem mais
+                self._ociosas = []
+                self._chave = chave
+            if self._ociosas:
+                return self._ociosas.pop()
+        return conectar_db()
+
+    def _devolver(self, conn):
+        if conn.in_transaction:
+            conn.rollback()
+        with self._trava:
+            if self._chave == self._chave_atual() and len(self._ociosas) < self.tamanho_maximo:
+                self._ociosas.append(conn)
+                return
+        conn.close()
+
+    @contextmanager
+    def conexao(self):
+        """Empresta uma conexão para a thread atual durante o bloco `with`."""
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            yield conn
+            return
+        conn = self._pegar()
+        self._local.conn = conn
+        try:
+            yield conn
+        finally:
+            self._local.conn = None
+            self._devolver(conn)
+
+    def fechar(self):
+        """Fecha todas as conexões ociosas do pool."""
+        with self._trava:
+            ociosas, self._ociosas = self._ociosas, []
+        for conn in ociosas:
+            conn.close()
+
+_pool = PoolConexoes()
+
+def conexao():
+    """Conexão emprestada do pool para leituras: `with conexao() as conn: ...`."""
+    return _pool.conexao()
+
+@contextmanager
+def transacao():
+    """
+    Conexão emprestada do pool dentro de uma transação: confirma ao final do
+    bloco `with` ou desfaz tudo se ocorrer uma exceção.
+    """
+    with _pool.conexao() as conn:
+        if getattr(_pool._local, "em_transacao", False):
+            # Transação aninhada: quem abriu a externa é que confirma
+            yield conn
+            return
+        _pool._local.em_transacao = True
+        try:
+            with conn:
+                yield conn
+        finally:
+            _pool._local.em_transacao = False
+
+def fechar_conexoes():
+    """Fecha as conexões ociosas do pool (ex.: ao encerrar a aplicação)."""
+    _pool.fechar()
+
+def registrar_ouvinte_insercao(funcao):
+    """Registra uma função (sem argumentos) a ser chamada sempre que novos concursos forem inseridos."""
+    if funcao not in _ouvintes_insercao:
+        _ouvintes_insercao.append(funcao)
+
 
 
 def inserir_resultado(concurso, dezenas):
     """Insere um resultado de concurso no banco de dados."""
-    conn = conectar_db()
-    cursor = conn.cursor()
-    # Usamos json.dumps para converter a lista de dezenas em uma string
-    dezenas_str = json.dumps(dezenas)
-    cursor.execute("""
-        INSERT OR IGNORE INTO resultados (concurso, dezenas)
-        VALUES (?, ?);
-    """, (concurso, dezenas_str))
-    conn.commit()
-    conn.close()
+    inserir_resultados([(concurso, dezenas)])
+
+def inserir_resultados(resultados, tamanho_lote=TAMANHO_LOTE_INGESTAO):
+    """
+    Insere em lote os resultados de um iterável de (concurso, dezenas).
+
+    O iterável é consumido aos poucos (pode ser um gerador que ainda está
+    baixando os concursos) e cada lote de `tamanho_lote` linhas é gravado com
+    um único `executemany` em uma transação própria. Concursos que já estão no
+    banco são ignorados.
+    Retorna (inseridos, ignorados).
+    """
+    inseridos = ignorados = 0
+    lote = []
 
+    def gravar_lote():
+        nonlocal inseridos, ignorados
+        linhas = lote[:]
+        lote.clear()
+        # Mede só a gravação: o iterável pode estar baixando os concursos enquanto isso
+        with metricas.medir("database", "inserir_resultados"), transacao() as conn:
+            cursor = conn.executemany("""
+                INSERT OR IGNORE INTO resultados (concurso, dezenas, mascara)
+                VALUES (?, ?, ?);
+            """, linhas)
+            inseridos_lote = max(cursor.rowcount, 0)
+        inseridos += inseridos_lote
+        ignorados += len(linhas) - inseridos_lote
+
+    try:
+        for concurso, dezenas in resultados:
+            # Usamos json.dumps para converter a lista de dezenas em uma string
+            lote.append((concurso, json.dumps(dezenas), dezenas_para_mascara(dezenas)))
+            if len(lote) >= tamanho_lote:
+                gravar_lote()
+    finally:
+        # Grava o último lote, mesmo que a leitura tenha sido interrompida no meio
+        try:
+            if lote:
+                gravar_lote()
+        finally:
+            # Rankings e probabilidades calculados com o histórico anterior deixam de valer
+            if inseridos:
+                cache.invalidar()
+                for ouvinte in _ouvintes_insercao:
+                    ouvinte()
+    return inseridos, ignorados
+
+@metricas.medido("database")
 def obter_ultimo_concurso_salvo():
     """Retorna o número do último concurso salvo no banco de dados."""
-    conn = conectar_db()
-    cursor = conn.cursor()
-    cursor.execute("SELECT MAX(concurso) FROM resultados;")
-    resultado = cursor.fetchone()[0]
-    conn.close()
+    with conexao() as conn:
+        resultado = conn.execute("SELECT MAX(concurso) FROM resultados;").fetchone()[0]
     return resultado if resultado else 0
 
+@metricas.medido("database")
+def obter_resumo_concursos():
+    """Retorna (último concurso salvo, quantidade de concursos salvos) em uma única consulta."""
+    with conexao() as conn:
+        ultimo, quantidade = conn.execute("SELECT MAX(concurso), COUNT(*) FROM resultados;").fetchone()
+    return (ultimo or 0), quantidade
+
+@metricas.medido("database")
 def obter_todos_os_resultados():
     """Retorna todos os resultados do banco de dados."""
-    conn = conectar_db()
-    cursor = conn.cursor()
-    cursor.execute("SELECT concurso, dezenas FROM resultados ORDER BY concurso;")
-    resultados = cursor.fetchall()
-    conn.close()
+    with conexao() as conn:
+        resultados = conn.execute("SELECT concurso, dezenas FROM resultados ORDER BY concurso;").fetchall()
     
     # Converte as strings de dezenas de volta para listas
     return [(concurso, json.loads(dezenas_str)) for concurso, dezenas_str in resultados]
 
+@metricas.medido("database")
+def obter_resultados_apos(concurso):
+    """Retorna, em ordem, os resultados dos concursos posteriores ao concurso informado."""
+    with conexao() as conn:
+        resultados = conn.execute("SELECT concurso, dezenas FROM resultados WHERE concurso > ? ORDER BY concurso;",
+                                  (concurso,)).fetchall()
+    return [(concurso, json.loads(dezenas_str)) for concurso, dezenas_str in resultados]
+
+@metricas.medido("database")
 def obter_resultado_concurso(numero_concurso):
     """Retorna os detalhes de um concurso específico."""
-    conn = conectar_db()
-    cursor = conn.cursor()
-    cursor.execute("SELECT concurso, dezenas FROM resultados WHERE concurso = ?;", (numero_concurso,))
-    resultado = cursor.fetchone()
-    conn.close()
+    with conexao() as conn:
+        resultado = conn.execute("SELECT concurso, dezenas FROM resultados WHERE concurso = ?;",
+                                 (numero_concurso,)).fetchone()
     if resultado:
         concurso, dezenas_str = resultado
         return {"concurso": concurso, "dezenas": json.loads(dezenas_str)}
@@ -57,121 +247,297 @@ def obter_resultado_concurso(numero_concurso):
 
 def criar_tabela():
     """Cria as tabelas de resultados e usuários se elas não existirem."""
-    conn = conectar_db()
-    cursor = conn.cursor()
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS resultados (
-            concurso INTEGER PRIMARY KEY,
-            dezenas TEXT NOT NULL
-        );
-    """)
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS users (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            username TEXT UNIQUE NOT NULL,
-            password_hash TEXT NOT NULL
-        );
-    """)
-    conn.commit()
-    conn.close()
+    with transacao() as conn:
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS resultados (
+                concurso INTEGER PRIMARY KEY,
+                dezenas TEXT NOT NULL,
+                mascara INTEGER
+            );
+        """)
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS users (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                username TEXT UNIQUE NOT NULL,
+                password_hash TEXT NOT NULL
+            );
+        """)
     print("Banco de dados e tabelas verificados com sucesso.")
 
 def criar_tabela_sugestoes_salvas():
     """Cria a tabela para armazenar as sugestões de jogos salvos."""
-    conn = conectar_db()
-    cursor = conn.cursor()
-    # Para desenvolvimento, dropar a tabela para garantir que o novo schema seja aplicado.
-    # CUIDADO: Isso apaga todos os dados da tabela.
-    # cursor.execute("DROP TABLE IF EXISTS sugestoes_salvas;")
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS sugestoes_salvas (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER NOT NULL,
-            concurso INTEGER NOT NULL,
-            tipo_sugestao TEXT NOT NULL,
-            numeros_sugeridos TEXT NOT NULL,
-            resultado_concurso TEXT,
-            acertos INTEGER,
-            data_criacao TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (user_id) REFERENCES users(id)
-        );
-    """)
-    conn.commit()
-    conn.close()
+    with transacao() as conn:
+        # Para desenvolvimento, dropar a tabela para garantir que o novo schema seja aplicado.
+        # CUIDADO: Isso apaga todos os dados da tabela.
+        # conn.execute("DROP TABLE IF EXISTS sugestoes_salvas;")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS sugestoes_salvas (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id INTEGER NOT NULL,
+                concurso INTEGER NOT NULL,
+                tipo_sugestao TEXT NOT NULL,
+                numeros_sugeridos TEXT NOT NULL,
+                mascara_sugerida INTEGER,
+                resultado_concurso TEXT,
+                acertos INTEGER,
+                data_criacao TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (user_id) REFERENCES users(id)
+            );
+        """)
+        # Listagem das sugestões de um usuário, da mais recente para a mais antiga (paginação por chave)
+        conn.execute("""
+            CREATE INDEX IF NOT EXISTS idx_sugestoes_usuario
+            ON sugestoes_salvas (user_id, concurso DESC, id DESC);
+        """)
+        # Índice parcial: só as sugestões ainda sem acertos, usadas ao chegar um novo concurso
+        conn.execute("""
+            CREATE INDEX IF NOT EXISTS idx_sugestoes_pendentes
+            ON sugestoes_salvas (concurso) WHERE acertos IS NULL;
+        """)
+
+def migrar_mascaras():
+    """
+    Adiciona as colunas de máscara de bits (resultados.mascara e
+    sugestoes_salvas.mascara_sugerida) a bancos criados antes delas e preenche
+    as linhas que ainda não têm máscara. As colunas JSON continuam existindo.
+    """
+    with transacao() as conn:
+        for tabela, coluna_json, coluna_mascara in (
+            ("resultados", "dezenas", "mascara"),
+            ("sugestoes_salvas", "numeros_sugeridos", "mascara_sugerida"),
+        ):
+            colunas = [linha[1] for linha in conn.execute(f"PRAGMA table_info({tabela});")]
+            if coluna_mascara not in colunas:
+                conn.execute(f"ALTER TABLE {tabela} ADD COLUMN {coluna_mascara} INTEGER;")
+
+            pendentes = conn.execute(f"SELECT rowid, {coluna_json} FROM {tabela} WHERE {coluna_mascara} IS NULL;").fetchall()
+            if pendentes:
+                print(f"Preenchendo a máscara de {len(pendentes)} linha(s) da tabela {tabela}...")
+                conn.executemany(
+                    f"UPDATE {tabela} SET {coluna_mascara} = ? WHERE rowid = ?;",
+                    [(dezenas_para_mascara(json.loads(valor)), rowid) for rowid, valor in pendentes],
+                )
+
+def migrar_sugestoes_unicas():
+    """
+    Garante que uma mesma sugestão (usuário, concurso, tipo e números) seja
+    salva apenas uma vez. Bancos antigos podem ter duplicatas: mantém a mais
+    antiga de cada grupo antes de criar o índice UNIQUE, que faz o papel da
+    restrição de unicidade (o SQLite não permite adicioná-la com ALTER TABLE).
+    """
+    with transacao() as conn:
+        existe = conn.execute("""
+            SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = 'idx_sugestoes_unicas';
+        """).fetchone()
+        if existe:
+            return
+        removidas = conn.execute("""
+            DELETE FROM sugestoes_salvas
+            WHERE id NOT IN (
+                SELECT MIN(id) FROM sugestoes_salvas
+                GROUP BY user_id, concurso, tipo_sugestao, numeros_sugeridos
+            );
+        """).rowcount
+        if removidas:
+            print(f"Removida(s) {removidas} sugestão(ões) duplicada(s).")
+        conn.execute("""
+            CREATE UNIQUE INDEX idx_sugestoes_unicas
+            ON sugestoes_salvas (user_id, concurso, tipo_sugestao, numeros_sugeridos);
+        """)
+
+def criar_tabela_backtest():
+    """Cria a tabela que guarda o resultado de cada concurso testado no backtest."""
+    with transacao() as conn:
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS backtest_checkpoints (
+                estrategia TEXT NOT NULL,
+                concurso INTEGER NOT NULL,
+                historico TEXT NOT NULL DEFAULT '',
+                sugestao TEXT NOT NULL,
+                acertos INTEGER NOT NULL,
+                tempo REAL NOT NULL,
+                data_criacao TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (estrategia, concurso)
+            );
+        """)
+
+def migrar_checkpoints_historico():
+    """
+    Adiciona a coluna `historico` (a impressão digital do histórico de treino)
+    a tabelas de checkpoints criadas antes dela. As linhas antigas ficam com
+    impressão vazia, que não corresponde a nenhum histórico, e são refeitas.
+    """
+    with transacao() as conn:
+        colunas = [linha[1] for linha in conn.execute("PRAGMA table_info(backtest_checkpoints);")]
+        if "historico" not in colunas:
+            conn.execute("ALTER TABLE backtest_checkpoints ADD COLUMN historico TEXT NOT NULL DEFAULT '';")
+
+def criar_tabela_tarefas():
+    """Cria a tabela das tarefas executadas em segundo plano (atualização, retreino e backtest)."""
+    with transacao() as conn:
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS tarefas (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                tipo TEXT NOT NULL,
+                parametros TEXT NOT NULL,
+                chave TEXT NOT NULL,
+                user_id INTEGER,
+                status TEXT NOT NULL DEFAULT 'pendente',
+                progresso REAL NOT NULL DEFAULT 0,
+                mensagem TEXT,
+                resultado TEXT,
+                erro TEXT,
+                batimento REAL,
+                data_criacao TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                data_conclusao TIMESTAMP,
+                FOREIGN KEY (user_id) REFERENCES users(id)
+            );
+        """)
+        # Só pode haver uma tarefa idêntica (mesma chave) pendente ou em execução
+        conn.execute("""
+            CREATE UNIQUE INDEX IF NOT EXISTS idx_tarefas_em_andamento
+            ON tarefas (chave) WHERE status IN ('pendente', 'executando');
+        """)
+
+def _formatar_tarefa(linha):
+    id, tipo, parametros, user_id, status, progresso, mensagem, resultado, erro, data_criacao, data_conclusao = linha
+    return {
+        "id": id,
+        "tipo": tipo,
+        "parametros": json.loads(parametros),
+        "user_id": user_id,
+        "status": status,
+        "progresso": progresso,
+        "mensagem": mensagem,
+        "resultado": json.loads(resultado) if resultado is not None else None,
+        "erro": erro,
+        "data_criacao": data_criacao,
+        "data_conclusao": data_conclusao,
+    }
+
+_COLUNAS_TAREFA = ("id, tipo, parametros, user_id, status, progresso, mensagem, resultado, erro, "
+                   "data_criacao, data_conclusao")
 
+@metricas.medido("database")
+def criar_tarefa(tipo, parametros, chave, user_id, batimento, limite_batimento):
+    """
+    Cria uma tarefa pendente, a menos que já exista uma com a mesma `chave`
+    pendente ou em execução. Tarefas cujo último batimento é anterior a
+    `limite_batimento` são dadas como interrompidas (o processo que as
+    executava terminou) antes da verificação.
+    Retorna (id_da_tarefa, criada).
+    """
+    with transacao() as conn:
+        conn.execute("""
+            UPDATE tarefas
+            SET status = 'erro', erro = 'Tarefa interrompida antes de terminar.', data_conclusao = CURRENT_TIMESTAMP
+            WHERE status IN ('pendente', 'executando') AND batimento < ?;
+        """, (limite_batimento,))
+        cursor = conn.execute("""
+            INSERT OR IGNORE INTO tarefas (tipo, parametros, chave, user_id, batimento)
+            VALUES (?, ?, ?, ?, ?);
+        """, (tipo, json.dumps(parametros), chave, user_id, batimento))
+        if cursor.rowcount > 0:
+            return cursor.lastrowid, True
+        existente = conn.execute("""
+            SELECT id FROM tarefas WHERE chave = ? AND status IN ('pendente', 'executando');
+        """, (chave,)).fetchone()
+        return existente[0], False
+
+@metricas.medido("database")
+def atualizar_tarefa(tarefa_id, status=None, progresso=None, mensagem=None, batimento=None):
+    """Atualiza o andamento de uma tarefa; campos None permanecem como estão."""
+    with transacao() as conn:
+        conn.execute("""
+            UPDATE tarefas
+            SET status = COALESCE(?, status), progresso = COALESCE(?, progresso),
+                mensagem = COALESCE(?, mensagem), batimento = COALESCE(?, batimento)
+            WHERE id = ?;
+        """, (status, progresso, mensagem, batimento, tarefa_id))
+
+@metricas.medido("database")
+def registrar_batimento_tarefas(tarefas_ids, batimento):
+    """Marca as tarefas informadas como vivas no instante `batimento`."""
+    with transacao() as conn:
+        conn.executemany("UPDATE tarefas SET batimento = ? WHERE id = ?;",
+                         [(batimento, tarefa_id) for tarefa_id in tarefas_ids])
+
+@metricas.medido("database")
+def concluir_tarefa(tarefa_id, resultado=None, erro=None):
+    """Registra o fim de uma tarefa com o seu resultado (ou a mensagem de erro)."""
+    with transacao() as conn:
+        conn.execute("""
+            UPDATE tarefas
+            SET status = ?, progresso = CASE WHEN ? IS NULL THEN 1 ELSE progresso END,
+                resultado = ?, erro = ?, data_conclusao = CURRENT_TIMESTAMP
+            WHERE id = ?;
+        """, ("erro" if erro else "concluida", erro, json.dumps(resultado), erro, tarefa_id))
+
+@metricas.medido("database")
+def obter_tarefa(tarefa_id):
+    """Retorna os dados de uma tarefa, ou None se ela não existir."""
+    with conexao() as conn:
+        linha = conn.execute(f"SELECT {_COLUNAS_TAREFA} FROM tarefas WHERE id = ?;", (tarefa_id,)).fetchone()
+    return _formatar_tarefa(linha) if linha else None
+
+@metricas.medido("database")
+def obter_tarefas_recentes(limite=50, user_id=None, tipos_compartilhados=()):
+    """
+    Retorna as tarefas mais recentes, da mais nova para a mais antiga. Com
+    `user_id`, apenas as tarefas desse usuário e as dos `tipos_compartilhados`.
+    """
+    filtro, argumentos = "", []
+    if user_id is not None:
+        tipos = list(tipos_compartilhados)
+        filtro = f"WHERE user_id = ? OR tipo IN ({', '.join('?' * len(tipos))})"
+        argumentos = [user_id] + tipos
+    with conexao() as conn:
+        linhas = conn.execute(f"SELECT {_COLUNAS_TAREFA} FROM tarefas {filtro} ORDER BY id DESC LIMIT ?;",
+                              argumentos + [limite]).fetchall()
+    return [_formatar_tarefa(linha) for linha in linhas]
+
+@metricas.medido("database")
 def create_user(username, password_hash):
-    conn = conectar_db()
-    cursor = conn.cursor()
     try:
-        cursor.execute("INSERT INTO users (username, password_hash) VALUES (?, ?);", (username, password_hash))
-        conn.commit()
-        return cursor.lastrowid
+        with transacao() as conn:
+            cursor = conn.execute("INSERT INTO users (username, password_hash) VALUES (?, ?);", (username, password_hash))
+            return cursor.lastrowid
     except sqlite3.IntegrityError:
         return None # Username already exists
-    finally:
-        conn.close()
 
+@metricas.medido("database")
 def get_user_by_username(username):
-    conn = conectar_db()
-    cursor = conn.cursor()
-    cursor.execute("SELECT id, username, password_hash FROM users WHERE username = ?;", (username,))
-    user_data = cursor.fetchone()
-    conn.close()
+    with conexao() as conn:
+        user_data = conn.execute("SELECT id, username, password_hash FROM users WHERE username = ?;",
+                                 (username,)).fetchone()
     if user_data:
         return {"id": user_data[0], "username": user_data[1], "password_hash": user_data[2]}
     return None
 
+@metricas.medido("database")
 def get_user_by_id(user_id):
-    conn = conectar_db()
-    cursor = conn.cursor()
-    cursor.execute("SELECT id, username, password_hash FROM users WHERE id = ?;", (user_id,))
-    user_data = cursor.fetchone()
-    conn.close()
+    with conexao() as conn:
+        user_data = conn.execute("SELECT id, username, password_hash FROM users WHERE id = ?;",
+                                 (user_id,)).fetchone()
     if user_data:
         return {"id": user_data[0], "username": user_data[1], "password_hash": user_data[2]}
     return None
 
 
+@metricas.medido("database")
 def salvar_sugestao(user_id, concurso, numeros_sugeridos, tipo_sugestao):
     """Salva uma sugestão de jogo no banco de dados, evitando duplicatas."""
-    conn = conectar_db()
-    cursor = conn.cursor()
-    
-    # Converte a lista/tupla de números para uma string JSON para verificação
+    # Converte a lista/tupla de números para uma string JSON (ordenada, para que a mesma sugestão gere a mesma string)
     numeros_str = json.dumps(sorted(list(numeros_sugeridos)))
 
-    # Verifica se a sugestão já existe para este usuário
-    cursor.execute("""
-        SELECT id FROM sugestoes_salvas
-        WHERE user_id = ? AND concurso = ? AND numeros_sugeridos = ? AND tipo_sugestao = ?
-    """, (user_id, concurso, numeros_str, tipo_sugestao))
-    
-    if cursor.fetchone():
-        # A sugestão já existe, então não faz nada
-        conn.close()
-        return
-
-    # Se não existir, insere a nova sugestão
-    cursor.execute("""
-        INSERT INTO sugestoes_salvas (user_id, concurso, numeros_sugeridos, tipo_sugestao)
-        VALUES (?, ?, ?, ?);
-    """, (user_id, concurso, numeros_str, tipo_sugestao))
-    conn.commit()
-    conn.close()
+    with transacao() as conn:
+        # O índice único idx_sugestoes_unicas descarta a sugestão se ela já existir para este usuário
+        conn.execute("""
+            INSERT OR IGNORE INTO sugestoes_salvas (user_id, concurso, numeros_sugeridos, mascara_sugerida, tipo_sugestao)
+            VALUES (?, ?, ?, ?, ?);
+        """, (user_id, concurso, numeros_str, dezenas_para_mascara(numeros_sugeridos), tipo_sugestao))
 
-def obter_sugestoes_salvas(user_id):
-    """Retorna todas as sugestões salvas para um usuário, ordenadas pelo concurso."""
-    conn = conectar_db()
-    cursor = conn.cursor()
-    cursor.execute("""
-        SELECT id, concurso, tipo_sugestao, numeros_sugeridos, resultado_concurso, acertos
-        FROM sugestoes_salvas 
-        WHERE user_id = ?
-        ORDER BY concurso DESC, id DESC;
-    """, (user_id,))
-    sugestoes_raw = cursor.fetchall()
-    conn.close()
-    
+def _formatar_sugestoes(sugestoes_raw):
     sugestoes_formatadas = []
     for id, concurso, tipo, numeros_str, resultado_str, acertos in sugestoes_raw:
         numeros = json.loads(numeros_str)
@@ -186,55 +552,154 @@ def obter_sugestoes_salvas(user_id):
         })
     return sugestoes_formatadas
 
+@metricas.medido("database")
+def obter_sugestoes_salvas(user_id):
+    """Retorna todas as sugestões salvas para um usuário, ordenadas pelo concurso."""
+    with conexao() as conn:
+        sugestoes_raw = conn.execute("""
+            SELECT id, concurso, tipo_sugestao, numeros_sugeridos, resultado_concurso, acertos
+            FROM sugestoes_salvas 
+            WHERE user_id = ?
+            ORDER BY concurso DESC, id DESC;
+        """, (user_id,)).fetchall()
+    return _formatar_sugestoes(sugestoes_raw)
+
+@metricas.medido("database")
+def obter_pagina_sugestoes_salvas(user_id, tamanho_pagina=TAMANHO_PAGINA_SUGESTOES, cursor=None):
+    """
+    Retorna uma página das sugestões salvas de um usuário, da mais recente
+    para a mais antiga, e o cursor da página seguinte (None na última página).
+
+    A paginação é por chave: `cursor` é o par (concurso, id) da última
+    sugestão da página anterior, e a consulta continua a partir dele pelo
+    índice idx_sugestoes_usuario, sem percorrer as páginas anteriores.
+    """
+    with conexao() as conn:
+        if cursor is None:
+            sugestoes_raw = conn.execute("""
+                SELECT id, concurso, tipo_sugestao, numeros_sugeridos, resultado_concurso, acertos
+                FROM sugestoes_salvas
+                WHERE user_id = ?
+                ORDER BY concurso DESC, id DESC
+                LIMIT ?;
+            """, (user_id, tamanho_pagina + 1)).fetchall()
+        else:
+            ultimo_concurso, ultimo_id = cursor
+            sugestoes_raw = conn.execute("""
+                SELECT id, concurso, tipo_sugestao, numeros_sugeridos, resultado_concurso, acertos
+                FROM sugestoes_salvas
+                WHERE user_id = ? AND (concurso, id) < (?, ?)
+                ORDER BY concurso DESC, id DESC
+                LIMIT ?;
+            """, (user_id, ultimo_concurso, ultimo_id, tamanho_pagina + 1)).fetchall()
+
+    # Uma linha a mais indica que existe uma próxima página
+    proximo_cursor = None
+    if len(sugestoes_raw) > tamanho_pagina:
+        sugestoes_raw = sugestoes_raw[:tamanho_pagina]
+        proximo_cursor = (sugestoes_raw[-1][1], sugestoes_raw[-1][0])
+    return _formatar_sugestoes(sugestoes_raw), proximo_cursor
+
+@metricas.medido("database")
 def deletar_sugestao(sugestao_id, user_id):
     """Deleta uma sugestão específica do banco de dados, verificando o user_id."""
-    conn = conectar_db()
-    cursor = conn.cursor()
-    cursor.execute("DELETE FROM sugestoes_salvas WHERE id = ? AND user_id = ?;", (sugestao_id, user_id))
-    conn.commit()
-    conn.close()
-
-def atualizar_acertos_sugestoes():
-    """Verifica sugestões pendentes e calcula os acertos se o resultado estiver disponível."""
-    conn = conectar_db()
-    cursor = conn.cursor()
-
-    # Pega todas as sugestões que ainda não têm acertos calculados
-    cursor.execute("SELECT id, concurso, numeros_sugeridos FROM sugestoes_salvas WHERE acertos IS NULL;")
-    sugestoes_pendentes = cursor.fetchall()
-
-    if not sugestoes_pendentes:
-        conn.close()
-        return
-
-    print(f"Verificando acertos para {len(sugestoes_pendentes)} sugestão(ões) pendente(s)...")
-
-    for sugestao_id, concurso_num, numeros_sugeridos_str in sugestoes_pendentes:
-        # Busca o resultado oficial para o concurso da sugestão
-        cursor.execute("SELECT dezenas FROM resultados WHERE concurso = ?;", (concurso_num,))
-        resultado_oficial = cursor.fetchone()
-
-        if resultado_oficial:
-            dezenas_oficiais_str = resultado_oficial[0]
-            dezenas_oficiais = set(json.loads(dezenas_oficiais_str))
-            numeros_sugeridos = set(json.loads(numeros_sugeridos_str))
-            
-            # Calcula a interseção para encontrar os acertos
-            acertos = len(dezenas_oficiais.intersection(numeros_sugeridos))
-            
-            # Atualiza a linha no banco de dados com o resultado e os acertos
-            cursor.execute("""
-                UPDATE sugestoes_salvas
-                SET resultado_concurso = ?, acertos = ?
-                WHERE id = ?;
-            """, (dezenas_oficiais_str, acertos, sugestao_id))
-            print(f"Sugestão ID {sugestao_id} (Concurso {concurso_num}) atualizada: {acertos} acertos.")
-
-    conn.commit()
-    conn.close()
-
-
-
-# Garante que as tabelas sejam criadas na primeira vez que este módulo for usado
-criar_tabela()
-criar_tabela_sugestoes_salvas()
+    with transacao() as conn:
+        conn.execute("DELETE FROM sugestoes_salvas WHERE id = ? AND user_id = ?;", (sugestao_id, user_id))
+
+@metricas.medido("database")
+def atualizar_acertos_sugestoes(apos_concurso=None):
+    """
+    Calcula os acertos das sugestões pendentes cujo resultado já está disponível.
+
+    As sugestões pendentes são cruzadas com `resultados` em uma única consulta
+    (acertos = popcount das máscaras) e todas são atualizadas com um
+    `executemany` na mesma transação. Com `apos_concurso`, considera apenas os
+    concursos que acabaram de chegar (posteriores a ele).
+    """
+    with transacao() as conn:
+        filtro_concurso = "" if apos_concurso is None else "AND s.concurso > ?"
+        parametros = () if apos_concurso is None else (apos_concurso,)
+        atualizacoes = conn.execute(f"""
+            SELECT r.dezenas, popcount(s.mascara_sugerida & r.mascara), s.id
+            FROM sugestoes_salvas s
+            JOIN resultados r ON r.concurso = s.concurso
+            WHERE s.acertos IS NULL {filtro_concurso};
+        """, parametros).fetchall()
+
+        if not atualizacoes:
+            return 0
+
+        conn.executemany("""
+            UPDATE sugestoes_salvas
+            SET resultado_concurso = ?, acertos = ?
+            WHERE id = ?;
+        """, atualizacoes)
+
+    print(f"Acertos calculados para {len(atualizacoes)} sugestão(ões) pendente(s).")
+    return len(atualizacoes)
+
+
+@metricas.medido("database")
+def salvar_checkpoint_backtest(estrategia, concurso, historico, sugestao, acertos, tempo):
+    """
+    Salva o resultado de um concurso do backtest para a estratégia informada.
+    `historico` identifica os concursos usados no treino (ver
+    `obter_checkpoints_backtest`).
+    """
+    with transacao() as conn:
+        conn.execute("""
+            INSERT OR REPLACE INTO backtest_checkpoints (estrategia, concurso, historico, sugestao, acertos, tempo)
+            VALUES (?, ?, ?, ?, ?, ?);
+        """, (estrategia, concurso, historico, json.dumps(sugestao), acertos, tempo))
+
+@metricas.medido("database")
+def obter_checkpoints_backtest(estrategia, historicos):
+    """
+    Retorna os resultados já salvos da estratégia para os concursos informados,
+    no formato {concurso: (sugestao, acertos, tempo)}.
+    `historicos` é {concurso: impressão digital do histórico de treino}; um
+    checkpoint só é reaproveitado se foi gravado com o mesmo histórico, de modo
+    que concursos inseridos (ou removidos) antes dele o invalidam.
+    """
+    if not historicos:
+        return {}
+
+    with conexao() as conn:
+        checkpoints = conn.execute("""
+            SELECT concurso, historico, sugestao, acertos, tempo FROM backtest_checkpoints
+            WHERE estrategia = ? AND concurso BETWEEN ? AND ?;
+        """, (estrategia, min(historicos), max(historicos))).fetchall()
+
+    return {
+        concurso: (json.loads(sugestao_str), acertos, tempo)
+        for concurso, historico, sugestao_str, acertos, tempo in checkpoints
+        if historicos.get(concurso) == historico
+    }
+
+
+def _atualizar_feature_store():
+    # Importado só quando há inserção, para o pandas não pesar na partida dos processos
+    import features
+    features.ao_inserir_resultados()
+
+def inicializar():
+    """
+    Cria as tabelas e aplica as migrações pendentes no banco atual (DB_FILE)
+    e passa a manter o feature store em dia a cada inserção de concursos.
+    Deve ser chamada uma vez pelos pontos de entrada (CLI, aplicação web)
+    antes do primeiro acesso; chamadas seguintes no mesmo processo e para o
+    mesmo arquivo não fazem nada.
+    """
+    registrar_ouvinte_insercao(_atualizar_feature_store)
+    caminho = os.path.abspath(DB_FILE)
+    with _trava_inicializacao:
+        if caminho in _bancos_inicializados:
+            return
+        criar_tabela()
+        criar_tabela_sugestoes_salvas()
+        criar_tabela_backtest()
+        criar_tabela_tarefas()
+        migrar_mascaras()
+        migrar_sugestoes_unicas()
+        migrar_checkpoints_historico()
+        _bancos_inicializados.add(caminho)
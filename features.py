@@ -0,0 +1,408 @@
+import json
+import os
+import threading
+from contextlib import contextmanager
+from itertools import chain
+
+import numpy as np
+import pandas as pd
+
+import database
+import metricas
+
+# Janelas (em concursos) usadas nas features de frequência
+JANELAS_FREQUENCIA = [10, 20, 50]
+
+# Diretório do feature store: as features já calculadas de cada concurso,
+# gravadas em arquivos binários que só crescem e podem ser mapeados em memória
+FEATURE_STORE_DIR = "feature_store"
+# Versão do formato dos arquivos; mudar força a reconstrução do feature store
+VERSAO_FEATURE_STORE = 2
+_ARQUIVO_META = "meta.json"
+_ARQUIVO_CONCURSOS = "concursos.bin"
+_ARQUIVO_MATRIZ = "matriz.bin"
+_ARQUIVO_FEATURES = "features.bin"
+_ARQUIVO_TRAVA = ".trava"
+# Arquivos da versão 1, sem geração no nome, apagados na primeira reconstrução
+_ARQUIVOS_FORMATO_ANTIGO = (_ARQUIVO_CONCURSOS, _ARQUIVO_MATRIZ, _ARQUIVO_FEATURES)
+
+_trava_store = threading.Lock()
+
+# Quantidade de bits ligados em cada valor de byte (0 a 255)
+_BITS_POR_BYTE = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+def colunas_features():
+    """Retorna, em ordem, as colunas da matriz de features."""
+    colunas = [f'dezena_{i}' for i in range(1, 26)]
+    colunas += [f'atraso_{i}' for i in range(1, 26)]
+    colunas += [f'freq_{j}_{i}' for i in range(1, 26) for j in JANELAS_FREQUENCIA]
+    colunas += [f'lag_{i}' for i in range(1, 26)]
+    colunas += ['soma_dezenas']
+    return colunas
+
+def criar_matriz_sorteios(resultados):
+    """
+    Converte o histórico [(concurso, dezenas), ...] em um vetor com os números
+    dos concursos e em uma matriz compacta uint8 (concursos x 25) que marca 1
+    nas dezenas sorteadas.
+    """
+    resultados = sorted(resultados, key=lambda resultado: resultado[0])
+    n = len(resultados)
+    concursos = np.fromiter((concurso for concurso, _ in resultados), dtype=np.int64, count=n)
+    tamanhos = np.fromiter((len(dezenas) for _, dezenas in resultados), dtype=np.intp, count=n)
+    colunas = np.fromiter(chain.from_iterable(dezenas for _, dezenas in resultados),
+                          dtype=np.intp, count=int(tamanhos.sum()))
+    matriz = np.zeros((n, 25), dtype=np.uint8)
+    matriz[np.repeat(np.arange(n), tamanhos), colunas - 1] = 1
+    return concursos, matriz
+
+def matriz_para_mascaras(matriz):
+    """
+    Converte a matriz 0/1 (concursos x 25) em um vetor uint32 de máscaras de
+    25 bits, no mesmo formato de `database.dezenas_para_mascara`.
+    """
+    pesos = np.left_shift(np.uint32(1), np.arange(25, dtype=np.uint32))
+    return (np.asarray(matriz, dtype=np.uint32) * pesos).sum(axis=-1, dtype=np.uint32)
+
+def contar_acertos(mascaras_a, mascaras_b):
+    """
+    Conta, elemento a elemento, as dezenas em comum entre dois vetores uint32
+    de máscaras, isto é, o popcount de `a & b`.
+    """
+    comuns = np.bitwise_and(np.asarray(mascaras_a, dtype=np.uint32), np.asarray(mascaras_b, dtype=np.uint32))
+    if hasattr(np, 'bitwise_count'):
+        return np.bitwise_count(comuns)
+    # NumPy < 2.0: soma os bits de cada um dos 4 bytes com uma tabela
+    bytes_comuns = np.ascontiguousarray(comuns).view(np.uint8).reshape(comuns.shape + (4,))
+    return _BITS_POR_BYTE[bytes_comuns].sum(axis=-1, dtype=np.uint8)
+
+def calcular_atrasos(concursos, matriz, ultimo_sorteio_inicial=None):
+    """
+    Calcula o atraso das 25 dezenas para cada concurso em uma única passada.
+
+    `concursos` é o vetor (ordenado) com o número de cada concurso e `matriz`
+    a matriz 0/1 (concursos x 25) de presença das dezenas.
+    `ultimo_sorteio_inicial` é o último concurso em que cada dezena saiu antes
+    da primeira linha (0 quando não há histórico anterior).
+    """
+    concursos = np.asarray(concursos)
+    # Número do concurso onde a dezena saiu, 0 onde não saiu
+    sorteios_com_dezena = np.where(np.asarray(matriz) == 1, concursos[:, None], 0)
+    # O máximo acumulado dá o último concurso (até a linha atual) em que cada dezena saiu
+    ultimo_sorteio = np.maximum.accumulate(sorteios_com_dezena, axis=0)
+    # Desloca uma linha para considerar apenas os sorteios *anteriores* ao concurso atual
+    ultimo_sorteio_anterior = np.zeros_like(ultimo_sorteio)
+    ultimo_sorteio_anterior[1:] = ultimo_sorteio[:-1]
+    if ultimo_sorteio_inicial is not None:
+        ultimo_sorteio_anterior = np.maximum(ultimo_sorteio_anterior, np.asarray(ultimo_sorteio_inicial))
+    # Se a dezena nunca saiu antes, o último sorteio é 0 e o atraso é o próprio número do concurso
+    return concursos[:, None] - ultimo_sorteio_anterior
+
+def calcular_matriz_features(concursos, matriz, ultimo_sorteio_inicial=None):
+    """
+    Calcula todas as features (atraso, frequência, lag e soma) de uma vez a
+    partir da matriz de sorteios, usando somas acumuladas.
+
+    Retorna o mesmo DataFrame que o pipeline por colunas montava (dezenas,
+    atrasos, frequências, lags e soma, sem as linhas incompletas), porém com
+    tipos inteiros compactos.
+    `ultimo_sorteio_inicial` é o último concurso em que cada dezena saiu antes
+    da primeira linha com features; por padrão é calculado a partir da matriz.
+    """
+    concursos = np.asarray(concursos)
+    matriz = np.asarray(matriz, dtype=np.uint8)
+    n = len(concursos)
+    janela_maxima = max(JANELAS_FREQUENCIA)
+    colunas = colunas_features()
+
+    # As primeiras linhas não têm histórico suficiente para a maior janela de frequência
+    if n <= janela_maxima:
+        return pd.DataFrame(columns=colunas, index=pd.Index([], name='concurso'))
+
+    # acumulado[t] conta quantas vezes cada dezena saiu nos concursos *anteriores* à linha t
+    acumulado = np.zeros((n + 1, 25), dtype=np.int32)
+    np.cumsum(matriz, axis=0, dtype=np.int32, out=acumulado[1:])
+
+    linhas = slice(janela_maxima, n)
+    anteriores = slice(janela_maxima - 1, n - 1)
+    if ultimo_sorteio_inicial is None:
+        ultimo_sorteio_inicial = np.where(matriz[:janela_maxima] == 1, concursos[:janela_maxima, None], 0).max(axis=0)
+    atrasos = calcular_atrasos(concursos[linhas], matriz[linhas], ultimo_sorteio_inicial).astype(np.int32)
+    frequencias = {
+        j: (acumulado[janela_maxima:n] - acumulado[janela_maxima - j:n - j]).astype(np.uint8)
+        for j in JANELAS_FREQUENCIA
+    }
+    lags = matriz[anteriores]
+    somas = matriz @ np.arange(1, 26, dtype=np.uint16)
+
+    dados = {}
+    for i in range(25):
+        dados[f'dezena_{i + 1}'] = matriz[linhas, i]
+    for i in range(25):
+        dados[f'atraso_{i + 1}'] = atrasos[:, i]
+    for i in range(25):
+        for j in JANELAS_FREQUENCIA:
+            dados[f'freq_{j}_{i + 1}'] = frequencias[j][:, i]
+    for i in range(25):
+        dados[f'lag_{i + 1}'] = lags[:, i]
+    dados['soma_dezenas'] = somas[anteriores]
+
+    return pd.DataFrame(dados, index=pd.Index(concursos[linhas], name='concurso'))
+
+@metricas.medido("features")
+def calcular_features(resultados):
+    """
+    Motor de features: transforma o histórico [(concurso, dezenas), ...] na
+    matriz de features completa usada pelos modelos.
+    """
+    concursos, matriz = criar_matriz_sorteios(resultados)
+    return calcular_matriz_features(concursos, matriz)
+
+def _caminho(arquivo):
+    return os.path.join(FEATURE_STORE_DIR, arquivo)
+
+def _nome_geracao(arquivo, geracao):
+    """Nome do arquivo de dados de uma geração (ex.: features.3.bin)."""
+    base, extensao = os.path.splitext(arquivo)
+    return f"{base}.{geracao}{extensao}"
+
+def _geracao_do_arquivo(nome):
+    """Geração de um arquivo de dados do feature store, ou None se não for um."""
+    partes = nome.split('.')
+    if len(partes) == 3 and partes[2] == 'bin' and partes[1].isdigit():
+        return int(partes[1])
+    return None
+
+@contextmanager
+def _trava_entre_processos():
+    """
+    Garante que só um processo por vez escreva no feature store. A trava é do
+    sistema operacional (flock/msvcrt), então é liberada se o processo morrer,
+    sem depender de quanto tempo a escrita demora.
+    """
+    os.makedirs(FEATURE_STORE_DIR, exist_ok=True)
+    with open(_caminho(_ARQUIVO_TRAVA), 'a+b') as arquivo:
+        if os.name == 'nt':
+            import msvcrt
+            while True:
+                arquivo.seek(0)
+                try:
+                    # LK_LOCK espera cerca de 10 segundos antes de desistir; tenta de novo
+                    msvcrt.locking(arquivo.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    pass
+            try:
+                yield
+            finally:
+                arquivo.seek(0)
+                msvcrt.locking(arquivo.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            import fcntl
+            fcntl.flock(arquivo.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(arquivo.fileno(), fcntl.LOCK_UN)
+
+def _ler_meta():
+    try:
+        with open(_caminho(_ARQUIVO_META), encoding='utf-8') as arquivo:
+            return json.load(arquivo)
+    except (FileNotFoundError, ValueError):
+        return None
+
+def _gravar_meta(meta):
+    # Grava em um arquivo temporário e troca de uma vez, para leitores nunca verem um meta parcial
+    temporario = _caminho(_ARQUIVO_META + ".tmp")
+    with open(temporario, 'w', encoding='utf-8') as arquivo:
+        json.dump(meta, arquivo)
+    os.replace(temporario, _caminho(_ARQUIVO_META))
+
+def _meta_valida(meta):
+    return (
+        meta is not None
+        and meta.get('versao') == VERSAO_FEATURE_STORE
+        and meta.get('banco') == os.path.abspath(database.DB_FILE)
+        and meta.get('colunas') == colunas_features()
+    )
+
+def _ultimo_sorteio(concursos, matriz, ultimo_sorteio_inicial=None):
+    """Último concurso em que cada dezena saiu, considerando todas as linhas da matriz."""
+    ultimo = np.where(matriz == 1, concursos[:, None], 0).max(axis=0, initial=0)
+    if ultimo_sorteio_inicial is not None:
+        ultimo = np.maximum(ultimo, np.asarray(ultimo_sorteio_inicial))
+    return [int(concurso) for concurso in ultimo]
+
+def _proxima_geracao():
+    geracoes = [_geracao_do_arquivo(nome) for nome in os.listdir(FEATURE_STORE_DIR)]
+    return max((g for g in geracoes if g is not None), default=0) + 1
+
+def _remover_geracoes_antigas(geracao):
+    """
+    Apaga os arquivos das gerações anteriores à `geracao - 1`. A geração
+    imediatamente anterior fica para leitores que leram o meta antigo e ainda
+    não abriram os arquivos; no Windows, arquivos ainda mapeados não podem ser
+    apagados e ficam para a próxima reconstrução.
+    """
+    for nome in os.listdir(FEATURE_STORE_DIR):
+        geracao_arquivo = _geracao_do_arquivo(nome)
+        if (geracao_arquivo is not None and geracao_arquivo < geracao - 1) or nome in _ARQUIVOS_FORMATO_ANTIGO:
+            try:
+                os.remove(_caminho(nome))
+            except OSError:
+                pass
+
+def _recriar_feature_store():
+    """Calcula as features de todo o histórico e regrava o feature store do zero."""
+    concursos, matriz = criar_matriz_sorteios(database.obter_todos_os_resultados())
+    features = calcular_matriz_features(concursos, matriz).to_numpy(dtype=np.int32)
+
+    # Grava uma geração nova de arquivos e só então troca o meta: nenhum arquivo
+    # mapeado por um leitor é substituído, o que o Windows não permitiria
+    geracao = _proxima_geracao()
+    for arquivo, dados in ((_ARQUIVO_CONCURSOS, concursos), (_ARQUIVO_MATRIZ, matriz), (_ARQUIVO_FEATURES, features)):
+        with open(_caminho(_nome_geracao(arquivo, geracao)), 'wb') as saida:
+            saida.write(np.ascontiguousarray(dados).tobytes())
+
+    meta = {
+        'versao': VERSAO_FEATURE_STORE,
+        'banco': os.path.abspath(database.DB_FILE),
+        'colunas': colunas_features(),
+        'geracao': geracao,
+        'n_concursos': len(concursos),
+        'n_features': len(features),
+        'ultimo_concurso': int(concursos[-1]) if len(concursos) else 0,
+        'ultimo_sorteio': _ultimo_sorteio(concursos, matriz),
+    }
+    _gravar_meta(meta)
+    _remover_geracoes_antigas(geracao)
+    return meta
+
+def _acrescentar_concursos(meta, novos):
+    """Calcula as features apenas dos concursos novos e as acrescenta ao fim dos arquivos."""
+    janela_maxima = max(JANELAS_FREQUENCIA)
+    concursos_novos, matriz_nova = criar_matriz_sorteios(novos)
+
+    # O estado do fim do histórico: as últimas linhas da matriz (para as janelas,
+    # o lag e a soma) e o último concurso em que cada dezena saiu (para o atraso)
+    concursos_salvos, matriz_salva = _abrir_matriz(meta)
+    concursos = np.concatenate([concursos_salvos[-janela_maxima:], concursos_novos])
+    matriz = np.concatenate([matriz_salva[-janela_maxima:], matriz_nova])
+    features = calcular_matriz_features(concursos, matriz, meta['ultimo_sorteio']).to_numpy(dtype=np.int32)
+
+    novo_meta = dict(meta)
+    novo_meta.update({
+        'n_concursos': meta['n_concursos'] + len(concursos_novos),
+        'n_features': meta['n_features'] + len(features),
+        'ultimo_concurso': int(concursos_novos[-1]),
+        'ultimo_sorteio': _ultimo_sorteio(concursos_novos, matriz_nova, meta['ultimo_sorteio']),
+    })
+
+    # Os arquivos só crescem: o meta guarda o comprimento válido de cada um, então
+    # a escrita começa logo depois dele e sobrescreve o que uma escrita interrompida
+    # tenha deixado. Nada é truncado, o que falharia (Windows) ou derrubaria
+    # (SIGBUS) leitores com o arquivo mapeado
+    tamanhos = (
+        (_ARQUIVO_CONCURSOS, meta['n_concursos'] * 8, concursos_novos),
+        (_ARQUIVO_MATRIZ, meta['n_concursos'] * 25, matriz_nova),
+        (_ARQUIVO_FEATURES, meta['n_features'] * len(meta['colunas']) * 4, features),
+    )
+    for arquivo, tamanho, dados in tamanhos:
+        with open(_caminho(_nome_geracao(arquivo, meta['geracao'])), 'r+b') as saida:
+            saida.seek(tamanho)
+            saida.write(np.ascontiguousarray(dados).tobytes())
+    _gravar_meta(novo_meta)
+    return novo_meta
+
+def _em_dia(meta, ultimo_concurso, total_concursos):
+    return (_meta_valida(meta) and meta['ultimo_concurso'] == ultimo_concurso
+            and meta['n_concursos'] == total_concursos)
+
+@metricas.medido("features")
+def atualizar_feature_store():
+    """
+    Deixa o feature store em dia com o banco de dados: calcula e acrescenta
+    apenas os concursos que ainda não estão nele. Reconstrói tudo se os
+    arquivos não existirem, forem de outro banco ou de outro formato, ou se
+    o banco ganhou (ou perdeu) concursos anteriores ao último do feature
+    store, como ao preencher uma lacuna do histórico.
+    Retorna os metadados do feature store.
+    Quando o feature store já está em dia, nenhuma trava é usada: os leitores
+    de vários processos só leem o meta e o comparam com o banco.
+    """
+    ultimo_concurso, total_concursos = database.obter_resumo_concursos()
+    meta = _ler_meta()
+    if _em_dia(meta, ultimo_concurso, total_concursos):
+        return meta
+
+    with _trava_store, _trava_entre_processos():
+        # Outro processo (ou thread) pode ter atualizado enquanto esperávamos a trava
+        meta = _ler_meta()
+        ultimo_concurso, total_concursos = database.obter_resumo_concursos()
+        if _em_dia(meta, ultimo_concurso, total_concursos):
+            return meta
+        janela_maxima = max(JANELAS_FREQUENCIA)
+
+        if not _meta_valida(meta) or meta['ultimo_concurso'] > ultimo_concurso or meta['n_concursos'] < janela_maxima:
+            return _recriar_feature_store()
+        if meta['ultimo_concurso'] == ultimo_concurso:
+            # Mesmo último concurso com outra quantidade: mudou algo no meio do histórico
+            return _recriar_feature_store()
+
+        novos = database.obter_resultados_apos(meta['ultimo_concurso'])
+        # Os concursos posteriores ao último não explicam todos os que faltam: houve
+        # inserção no meio do histórico, que muda as features das linhas seguintes
+        if meta['n_concursos'] + len(novos) != total_concursos:
+            return _recriar_feature_store()
+        return _acrescentar_concursos(meta, novos)
+
+def _mapear(meta, arquivo, dtype, linhas, colunas=None):
+    forma = (linhas,) if colunas is None else (linhas, colunas)
+    if linhas == 0:
+        return np.empty(forma, dtype=dtype)
+    return np.memmap(_caminho(_nome_geracao(arquivo, meta['geracao'])), dtype=dtype, mode='r', shape=forma)
+
+def _abrir_matriz(meta):
+    concursos = _mapear(meta, _ARQUIVO_CONCURSOS, np.int64, meta['n_concursos'])
+    matriz = _mapear(meta, _ARQUIVO_MATRIZ, np.uint8, meta['n_concursos'], 25)
+    return concursos, matriz
+
+def carregar_matriz_sorteios(atualizar=True):
+    """
+    Retorna (concursos, matriz) do feature store, mapeados em memória (somente
+    leitura), no mesmo formato de `criar_matriz_sorteios`.
+    """
+    meta = atualizar_feature_store() if atualizar else _ler_meta()
+    if not _meta_valida(meta):
+        return np.empty(0, dtype=np.int64), np.empty((0, 25), dtype=np.uint8)
+    return _abrir_matriz(meta)
+
+@metricas.medido("features")
+def carregar_features(atualizar=True):
+    """
+    Retorna a matriz de features de todo o histórico a partir do feature store,
+    com os dados mapeados em memória (somente leitura). Tem as mesmas colunas e
+    valores de `calcular_features`, com todas as colunas em int32.
+    """
+    meta = atualizar_feature_store() if atualizar else _ler_meta()
+    if not _meta_valida(meta) or meta['n_features'] == 0:
+        return pd.DataFrame(columns=colunas_features(), index=pd.Index([], name='concurso'))
+
+    concursos, _ = _abrir_matriz(meta)
+    features = _mapear(meta, _ARQUIVO_FEATURES, np.int32, meta['n_features'], len(meta['colunas']))
+    indice = pd.Index(np.asarray(concursos[meta['n_concursos'] - meta['n_features']:]), name='concurso')
+    return pd.DataFrame(features, index=indice, columns=meta['colunas'], copy=False)
+
+def contar_concursos():
+    """Retorna quantos concursos o feature store cobre."""
+    meta = atualizar_feature_store()
+    return meta['n_concursos']
+
+def ao_inserir_resultados():
+    """Atualiza o feature store depois de uma inserção (registrada por database.inicializar)."""
+    try:
+        atualizar_feature_store()
+    except Exception as e:
+        # O feature store se recupera na próxima leitura; a inserção não deve falhar por isso
+        print(f"Erro ao atualizar o feature store: {e}")
@@ -0,0 +1,182 @@
+import csv
+import json
+import os
+import unicodedata
+
+import database
+
+# Formatos aceitos, identificados pela extensão do arquivo
+FORMATOS = {".xlsx": "planilha", ".csv": "csv", ".jsonl": "jsonl", ".json": "jsonl"}
+# Cabeçalho usado pela planilha oficial da Caixa e pelos arquivos exportados
+COLUNAS_BOLAS = [f"Bola{i}" for i in range(1, 16)]
+
+class ErroImportacao(ValueError):
+    """Linha inválida no arquivo importado."""
+
+def detectar_formato(caminho, formato=None):
+    """Retorna o formato ('planilha', 'csv' ou 'jsonl') informado ou deduzido da extensão."""
+    if formato:
+        if formato not in FORMATOS.values():
+            raise ValueError(f"Formato desconhecido: {formato}. Use planilha, csv ou jsonl.")
+        return formato
+    extensao = os.path.splitext(caminho)[1].lower()
+    if extensao not in FORMATOS:
+        raise ValueError(f"Não foi possível deduzir o formato de {caminho}. Use .xlsx, .csv ou .jsonl.")
+    return FORMATOS[extensao]
+
+def _normalizar(nome):
+    """'Nº Concurso ' -> 'nº concurso'; 'Bola 1' -> 'bola1' (sem acentos, espaços e maiúsculas)."""
+    nome = unicodedata.normalize("NFKD", str(nome or "")).encode("ascii", "ignore").decode()
+    return nome.strip().lower().replace(" ", "")
+
+def _colunas_tabela(cabecalho):
+    """
+    Localiza, em um cabeçalho de planilha/CSV, a coluna do concurso e as 15
+    colunas das bolas. Retorna None se o cabeçalho não for reconhecido.
+    """
+    nomes = [_normalizar(nome) for nome in cabecalho]
+    if "concurso" not in nomes:
+        return None
+    try:
+        bolas = [nomes.index(_normalizar(coluna)) for coluna in COLUNAS_BOLAS]
+    except ValueError:
+        return None
+    return nomes.index("concurso"), bolas
+
+def _ler_tabela(linhas, origem):
+    """Gera (numero_da_linha, concurso, dezenas) a partir das linhas de uma planilha ou CSV."""
+    colunas = None
+    for numero_linha, valores in enumerate(linhas, start=1):
+        if colunas is None:
+            # Ignora linhas de título até encontrar o cabeçalho
+            colunas = _colunas_tabela(valores)
+            continue
+        if not any(valor not in (None, "") for valor in valores):
+            continue
+        indice_concurso, indices_bolas = colunas
+        try:
+            yield numero_linha, valores[indice_concurso], [valores[i] for i in indices_bolas]
+        except IndexError:
+            raise ErroImportacao(f"{origem}, linha {numero_linha}: quantidade de colunas insuficiente.")
+    if colunas is None:
+        raise ErroImportacao(f"{origem}: cabeçalho com as colunas Concurso e Bola1..Bola15 não encontrado.")
+
+def _ler_planilha(caminho):
+    try:
+        import openpyxl
+    except ImportError:
+        raise ErroImportacao("Para ler a planilha oficial (.xlsx) instale o pacote openpyxl: pip install openpyxl")
+    # read_only percorre a planilha linha a linha sem carregá-la inteira na memória
+    pasta = openpyxl.load_workbook(caminho, read_only=True, data_only=True)
+    try:
+        yield from _ler_tabela(pasta.active.iter_rows(values_only=True), caminho)
+    finally:
+        pasta.close()
+
+def _ler_csv(caminho):
+    with open(caminho, newline="", encoding="utf-8-sig") as arquivo:
+        # A exportação da Caixa usa ';', a nossa usa ','
+        try:
+            dialeto = csv.Sniffer().sniff(arquivo.readline(), delimiters=",;\t")
+        except csv.Error:
+            dialeto = csv.excel
+        arquivo.seek(0)
+        yield from _ler_tabela(csv.reader(arquivo, dialeto), caminho)
+
+def _ler_jsonl(caminho):
+    with open(caminho, encoding="utf-8") as arquivo:
+        for numero_linha, linha in enumerate(arquivo, start=1):
+            if not linha.strip():
+                continue
+            try:
+                registro = json.loads(linha)
+            except json.JSONDecodeError as e:
+                raise ErroImportacao(f"{caminho}, linha {numero_linha}: JSON inválido ({e}).")
+            # Aceita o nosso formato e o formato de resposta da API da Caixa
+            concurso = registro.get("concurso", registro.get("numero"))
+            dezenas = registro.get("dezenas", registro.get("listaDezenas"))
+            yield numero_linha, concurso, dezenas
+
+_LEITORES = {"planilha": _ler_planilha, "csv": _ler_csv, "jsonl": _ler_jsonl}
+
+def validar_resultado(concurso, dezenas, origem="resultado"):
+    """
+    Converte e valida um resultado: concurso inteiro positivo e 15 dezenas
+    distintas entre 1 e 25. Retorna (concurso, dezenas_ordenadas).
+    """
+    try:
+        concurso = int(concurso)
+        dezenas = sorted(int(dezena) for dezena in dezenas)
+    except (TypeError, ValueError):
+        raise ErroImportacao(f"{origem}: concurso ou dezenas não numéricos.")
+    if concurso <= 0:
+        raise ErroImportacao(f"{origem}: número de concurso inválido ({concurso}).")
+    if len(dezenas) != 15 or len(set(dezenas)) != 15:
+        raise ErroImportacao(f"{origem}: o concurso {concurso} deve ter 15 dezenas distintas.")
+    if dezenas[0] < 1 or dezenas[-1] > 25:
+        raise ErroImportacao(f"{origem}: o concurso {concurso} tem dezenas fora do intervalo 1 a 25.")
+    return concurso, dezenas
+
+def ler_resultados(caminho, formato=None, permitir_lacuna=False):
+    """
+    Lê o arquivo aos poucos, gerando (concurso, dezenas) já validados.
+    Os concursos devem vir em ordem e sem lacunas (cada um igual ao anterior + 1).
+    O primeiro concurso do arquivo também deve continuar o histórico salvo (ser
+    no máximo o último concurso do banco + 1): a atualização pela API só busca
+    concursos posteriores ao último, então uma lacuna antes do arquivo nunca
+    seria preenchida. `permitir_lacuna=True` desliga essa verificação.
+    """
+    leitor = _LEITORES[detectar_formato(caminho, formato)]
+    anterior = None
+    ultimo_salvo = None if permitir_lacuna else database.obter_ultimo_concurso_salvo()
+    for numero_linha, concurso, dezenas in leitor(caminho):
+        origem = f"{caminho}, linha {numero_linha}"
+        concurso, dezenas = validar_resultado(concurso, dezenas, origem)
+        if anterior is None and ultimo_salvo is not None and concurso > ultimo_salvo + 1:
+            raise ErroImportacao(f"{origem}: o histórico salvo termina no concurso {ultimo_salvo}; o arquivo "
+                                 f"começa no concurso {concurso}, deixando uma lacuna "
+                                 f"(concursos {ultimo_salvo + 1} a {concurso - 1}).")
+        if anterior is not None and concurso != anterior + 1:
+            raise ErroImportacao(f"{origem}: esperado o concurso {anterior + 1}, encontrado {concurso}.")
+        anterior = concurso
+        yield concurso, dezenas
+
+def importar_resultados(caminho, formato=None, tamanho_lote=database.TAMANHO_LOTE_INGESTAO, permitir_lacuna=False):
+    """
+    Importa o histórico de um arquivo local para a tabela `resultados`,
+    gravando em lotes. Concursos já existentes são ignorados.
+    Retorna (inseridos, ignorados). Se uma linha for inválida, os lotes
+    anteriores a ela permanecem gravados e ErroImportacao é lançado.
+    `permitir_lacuna` é repassado a `ler_resultados`.
+    """
+    return database.inserir_resultados(ler_resultados(caminho, formato, permitir_lacuna), tamanho_lote=tamanho_lote)
+
+def exportar_resultados(caminho, formato=None):
+    """Exporta a tabela `resultados` para um arquivo no formato informado. Retorna a quantidade exportada."""
+    formato = detectar_formato(caminho, formato)
+    resultados = database.obter_todos_os_resultados()
+
+    if formato == "jsonl":
+        with open(caminho, "w", encoding="utf-8") as arquivo:
+            for concurso, dezenas in resultados:
+                arquivo.write(json.dumps({"concurso": concurso, "dezenas": dezenas}) + "\n")
+    elif formato == "csv":
+        with open(caminho, "w", newline="", encoding="utf-8") as arquivo:
+            escritor = csv.writer(arquivo)
+            escritor.writerow(["Concurso"] + COLUNAS_BOLAS)
+            for concurso, dezenas in resultados:
+                escritor.writerow([concurso] + dezenas)
+    else:
+        try:
+            import openpyxl
+        except ImportError:
+            raise ErroImportacao("Para gerar a planilha (.xlsx) instale o pacote openpyxl: pip install openpyxl")
+        # write_only grava as linhas em sequência, sem montar a planilha inteira na memória
+        pasta = openpyxl.Workbook(write_only=True)
+        planilha = pasta.create_sheet("Lotofácil")
+        planilha.append(["Concurso"] + COLUNAS_BOLAS)
+        for concurso, dezenas in resultados:
+            planilha.append([concurso] + dezenas)
+        pasta.save(caminho)
+
+    return len(resultados)
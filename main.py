@@ -1,12 +1,28 @@
-import time
+import argparse
 import api_client
 import database
 import sugestoes
-import ml_sugestoes
-import backtest
+import importacao
 
-def atualizar_banco_de_dados():
-    """Busca por novos resultados da Lotofácil e atualiza o banco de dados."""
+def _baixar_concursos(concursos_a_baixar, ao_progresso=None):
+    """Baixa os concursos informados, gerando (concurso, dezenas) à medida que chegam."""
+    for i, (numero_concurso, dados_concurso) in enumerate(api_client.buscar_concursos(concursos_a_baixar), start=1):
+        if dados_concurso and dados_concurso.get('listaDezenas'):
+            print(f"Concurso {numero_concurso} obtido.")
+            yield numero_concurso, [int(d) for d in dados_concurso['listaDezenas']]
+        else:
+            print(f"Falha ao obter dados do concurso {numero_concurso}. Pulando.")
+        if ao_progresso:
+            ao_progresso(i, len(concursos_a_baixar), f"Concurso {numero_concurso}")
+
+def atualizar_banco_de_dados(ao_progresso=None):
+    """
+    Busca por novos resultados da Lotofácil e atualiza o banco de dados.
+
+    `ao_progresso(concluidos, total, mensagem)`, se informado, é chamado a
+    cada concurso baixado. Retorna um resumo com os concursos inseridos e
+    ignorados, ou None se a API não puder ser consultada.
+    """
     print("Iniciando atualização do banco de dados...")
     
     # 1. Descobrir qual o último concurso salvo no nosso banco
@@ -16,7 +32,7 @@ def atualizar_banco_de_dados():
     # 2. Descobrir qual o último concurso que saiu no site da Caixa
     dados_ultimo_concurso_api = api_client.get_latest_concurso_info()
     if not dados_ultimo_concurso_api:
-        return # Encerra se não conseguir contato com a API
+        return None # Encerra se não conseguir contato com a API
 
     numero_ultimo_concurso_api = dados_ultimo_concurso_api.get('numero')
     print(f"Último concurso disponível na API da Caixa: {numero_ultimo_concurso_api}")
@@ -26,25 +42,18 @@ def atualizar_banco_de_dados():
 
     if not concursos_a_baixar:
         print("Seu banco de dados já está atualizado!")
-        return
+        return {"inseridos": 0, "ignorados": 0, "ultimo_concurso": ultimo_concurso_salvo}
 
     print(f"Encontrados {len(concursos_a_baixar)} novos concursos para adicionar ao banco.")
 
-    for numero_concurso in concursos_a_baixar:
-        print(f"Buscando dados do concurso {numero_concurso}...")
-        dados_concurso = api_client.get_concurso_data(numero_concurso)
-        if dados_concurso and dados_concurso.get('listaDezenas'):
-            dezenas = [int(d) for d in dados_concurso['listaDezenas']]
-            database.inserir_resultado(numero_concurso, dezenas)
-            print(f"Concurso {numero_concurso} salvo com sucesso.")
-        else:
-            print(f"Falha ao obter dados do concurso {numero_concurso}. Pulando.")
-        time.sleep(0.5) # Pausa para não sobrecarregar a API
+    inseridos, ignorados = database.inserir_resultados(_baixar_concursos(concursos_a_baixar, ao_progresso))
+    print(f"{inseridos} concurso(s) salvo(s), {ignorados} já existente(s).")
 
     print("\nAtualização do banco de dados concluída!")
 
-    # Após atualizar os resultados, verifica e atualiza os acertos das sugestões salvas
-    database.atualizar_acertos_sugestoes()
+    # Após atualizar os resultados, calcula os acertos das sugestões dos concursos que chegaram
+    database.atualizar_acertos_sugestoes(apos_concurso=ultimo_concurso_salvo)
+    return {"inseridos": inseridos, "ignorados": ignorados, "ultimo_concurso": database.obter_ultimo_concurso_salvo()}
 
 def exibir_sugestoes():
     """Busca os dados do banco e gera as sugestões de jogos."""
@@ -56,6 +65,27 @@ def exibir_sugestoes():
     
     sugestoes.gerar_sugestoes(todos_os_resultados)
 
+def importar_historico(caminho, formato=None, permitir_lacuna=False):
+    """Carrega o histórico de resultados a partir de um arquivo local, sem acessar a API."""
+    print(f"Importando resultados de {caminho}...")
+    try:
+        inseridos, ignorados = importacao.importar_resultados(caminho, formato, permitir_lacuna=permitir_lacuna)
+    except (OSError, ValueError) as e:
+        print(f"Importação interrompida: {e}")
+        return
+    print(f"{inseridos} concurso(s) importado(s), {ignorados} já existente(s).")
+    # O arquivo pode trazer concursos antigos, então considera todas as sugestões pendentes
+    database.atualizar_acertos_sugestoes()
+
+def exportar_historico(caminho, formato=None):
+    """Grava todo o histórico de resultados em um arquivo local."""
+    try:
+        total = importacao.exportar_resultados(caminho, formato)
+    except (OSError, ValueError) as e:
+        print(f"Exportação não realizada: {e}")
+        return
+    print(f"{total} concurso(s) exportado(s) para {caminho}.")
+
 def menu_principal():
     """Exibe o menu principal e gerencia a interação com o usuário."""
     while True:
@@ -66,7 +96,10 @@ def menu_principal():
         print("3. Gerar Sugestão com ML (Rápido, usa modelos salvos)")
         print("4. Atualizar Modelos de ML (Lento, treina com novos dados)")
         print("5. Avaliar Estratégia de ML (Backtest)")
-        print("6. Sair")
+        print("--- Arquivos ---")
+        print("6. Importar Histórico de Arquivo (.xlsx, .csv ou .jsonl)")
+        print("7. Exportar Histórico para Arquivo (.xlsx, .csv ou .jsonl)")
+        print("8. Sair")
         escolha = input("Escolha uma opção: ")
 
         if escolha == '1':
@@ -74,18 +107,64 @@ def menu_principal():
         elif escolha == '2':
             exibir_sugestoes()
         elif escolha == '3':
+            # O pandas e o scikit-learn só são carregados quando o ML é usado
+            import ml_sugestoes
             # Gera sugestão usando modelos já treinados (rápido)
             ml_sugestoes.gerar_sugestao_ml(force_retrain=False)
         elif escolha == '4':
+            import ml_sugestoes
             # Força o retreinamento dos modelos (lento)
             ml_sugestoes.gerar_sugestao_ml(force_retrain=True)
         elif escolha == '5':
+            import backtest
             backtest.executar_backtest()
         elif escolha == '6':
+            importar_historico(input("Caminho do arquivo: ").strip())
+        elif escolha == '7':
+            exportar_historico(input("Caminho do arquivo: ").strip())
+        elif escolha == '8':
             print("Obrigado por usar o programa!")
             break
         else:
             print("Opção inválida. Tente novamente.")
 
 if __name__ == "__main__":
-    menu_principal()
+    parser = argparse.ArgumentParser(description="Analisador Lotofácil. Sem argumentos, abre o menu interativo.")
+    parser.add_argument("--offline", action="store_true",
+                        help="não acessa a API da Caixa; usa apenas as respostas guardadas em cache")
+    subcomandos = parser.add_subparsers(dest="comando")
+    for comando, ajuda in (("importar", "importa o histórico de um arquivo local"),
+                           ("exportar", "exporta o histórico para um arquivo local")):
+        subparser = subcomandos.add_parser(comando, help=ajuda)
+        subparser.add_argument("arquivo")
+        subparser.add_argument("--formato", choices=sorted(set(importacao.FORMATOS.values())),
+                               help="padrão: deduzido da extensão do arquivo")
+    subcomandos.choices["importar"].add_argument(
+        "--permitir-lacuna", action="store_true",
+        help="aceita um arquivo que não continua o histórico salvo (os concursos entre eles ficam faltando)")
+    subparser = subcomandos.add_parser("backtest", help="avalia a estratégia de ML nos concursos mais recentes")
+    subparser.add_argument("concursos", type=int, help="quantidade de concursos recentes testados")
+    subparser.add_argument("--processos", type=int, default=1, help="processos usados para testar os concursos")
+    subparser.add_argument("--motor", help="motor dos modelos: por_dezena (padrão) ou multi_saida")
+    subparser.add_argument("--comparar-motores", action="store_true",
+                           help="executa o backtest com cada motor e compara acertos e tempos")
+    args = parser.parse_args()
+    database.inicializar()
+    if args.offline:
+        api_client.definir_modo_offline()
+
+    if args.comando == "importar":
+        importar_historico(args.arquivo, args.formato, args.permitir_lacuna)
+    elif args.comando == "exportar":
+        exportar_historico(args.arquivo, args.formato)
+    elif args.comando == "backtest":
+        import backtest
+        import ml_sugestoes
+        if args.motor:
+            ml_sugestoes.definir_motor(args.motor)
+        if args.comparar_motores:
+            backtest.comparar_motores(args.concursos, n_workers=args.processos)
+        else:
+            backtest.executar_backtest(args.concursos, n_workers=args.processos)
+    else:
+        menu_principal()
@@ -0,0 +1,193 @@
+import bisect
+from contextlib import contextmanager
+import functools
+import math
+import threading
+import time
+
+# Liga ou desliga a coleta de métricas (contagens e histogramas de latência)
+METRICAS_ATIVAS = True
+# Imprime, ao final de cada requisição web, o tempo gasto em cada etapa
+DETALHAR_REQUISICOES = False
+# Limites (em segundos) das faixas dos histogramas de latência
+LIMITES_HISTOGRAMA = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300)
+# Prefixo dos nomes das métricas expostas em /metrics
+PREFIXO = "lotofacil"
+
+class Histograma:
+    """Contagem, soma e distribuição por faixas das durações observadas."""
+
+    def __init__(self, limites=LIMITES_HISTOGRAMA):
+        self.limites = limites
+        self.faixas = [0] * (len(limites) + 1)  # a última faixa é +Inf
+        self.contagem = 0
+        self.soma = 0.0
+
+    def observar(self, segundos):
+        # Primeira faixa cujo limite é >= segundos (o "le" do Prometheus)
+        self.faixas[bisect.bisect_left(self.limites, segundos)] += 1
+        self.contagem += 1
+        self.soma += segundos
+
+# Durações por (componente, operação) e por (rota, método, status) das requisições web
+_duracoes = {}
+_requisicoes = {}
+# Erros (exceções) por (componente, operação)
+_erros = {}
+_trava = threading.Lock()
+# Etapas medidas durante a requisição web atual de cada thread
+_local = threading.local()
+
+def configurar(ativas=None, detalhar_requisicoes=None):
+    """Liga ou desliga a coleta de métricas e o detalhamento dos tempos de cada requisição."""
+    global METRICAS_ATIVAS, DETALHAR_REQUISICOES
+    if ativas is not None:
+        METRICAS_ATIVAS = ativas
+    if detalhar_requisicoes is not None:
+        DETALHAR_REQUISICOES = detalhar_requisicoes
+
+def limpar():
+    """Descarta todas as métricas coletadas."""
+    with _trava:
+        _duracoes.clear()
+        _requisicoes.clear()
+        _erros.clear()
+
+def observar(componente, operacao, segundos, erro=False):
+    """Registra uma execução de `operacao` de `componente` que levou `segundos`."""
+    if not METRICAS_ATIVAS:
+        return
+    chave = (componente, operacao)
+    with _trava:
+        histograma = _duracoes.get(chave)
+        if histograma is None:
+            histograma = _duracoes[chave] = Histograma()
+        histograma.observar(segundos)
+        if erro:
+            _erros[chave] = _erros.get(chave, 0) + 1
+    etapas = getattr(_local, "etapas", None)
+    if etapas is not None:
+        total = etapas.get(chave, (0, 0.0))
+        etapas[chave] = (total[0] + 1, total[1] + segundos)
+
+@contextmanager
+def medir(componente, operacao):
+    """Mede a duração do bloco como uma execução de `operacao` de `componente`."""
+    if not METRICAS_ATIVAS:
+        yield
+        return
+    inicio = time.perf_counter()
+    erro = True
+    try:
+        yield
+        erro = False
+    finally:
+        observar(componente, operacao, time.perf_counter() - inicio, erro)
+
+def medido(componente, operacao=None):
+    """Decorador que mede cada chamada da função (a operação é, por padrão, o nome dela)."""
+    def decorar(funcao):
+        nome = operacao or funcao.__name__
+
+        @functools.wraps(funcao)
+        def medir_chamada(*args, **kwargs):
+            if not METRICAS_ATIVAS:
+                return funcao(*args, **kwargs)
+            inicio = time.perf_counter()
+            erro = True
+            try:
+                resultado = funcao(*args, **kwargs)
+                erro = False
+                return resultado
+            finally:
+                observar(componente, nome, time.perf_counter() - inicio, erro)
+        return medir_chamada
+    return decorar
+
+def iniciar_requisicao():
+    """Começa a acumular as etapas medidas na thread atual (uma requisição web)."""
+    _local.etapas = {} if METRICAS_ATIVAS else None
+    _local.inicio = time.perf_counter()
+
+def encerrar_requisicao(rota, metodo, status):
+    """
+    Registra a duração da requisição iniciada com `iniciar_requisicao` e
+    retorna (duracao, etapas), onde `etapas` é uma lista de
+    (componente, operacao, chamadas, segundos) ordenada pelo tempo gasto.
+    Etapas aninhadas (ex.: uma consulta ao banco dentro da montagem das
+    features) aparecem cada uma com o seu próprio tempo.
+    """
+    inicio = getattr(_local, "inicio", None)
+    etapas = getattr(_local, "etapas", None) or {}
+    _local.etapas = _local.inicio = None
+    if inicio is None:
+        return 0.0, []
+    duracao = time.perf_counter() - inicio
+    if METRICAS_ATIVAS:
+        chave = (rota, metodo, str(status))
+        with _trava:
+            histograma = _requisicoes.get(chave)
+            if histograma is None:
+                histograma = _requisicoes[chave] = Histograma()
+            histograma.observar(duracao)
+    detalhes = sorted(((componente, operacao, chamadas, segundos)
+                       for (componente, operacao), (chamadas, segundos) in etapas.items()),
+                      key=lambda etapa: etapa[3], reverse=True)
+    return duracao, detalhes
+
+def formatar_detalhes(metodo, caminho, status, duracao, etapas):
+    """Monta a linha de log com o tempo total da requisição e de cada etapa."""
+    partes = [f"{componente}.{operacao} {chamadas}x {segundos * 1000:.1f}ms"
+              for componente, operacao, chamadas, segundos in etapas]
+    linha = f"[tempos] {metodo} {caminho} {status} {duracao * 1000:.1f}ms"
+    return f"{linha} | {'; '.join(partes)}" if partes else linha
+
+def _copiar_histograma(histograma):
+    copia = Histograma(histograma.limites)
+    copia.faixas = list(histograma.faixas)
+    copia.contagem = histograma.contagem
+    copia.soma = histograma.soma
+    return copia
+
+def _rotulos(**rotulos):
+    valores = []
+    for nome, valor in rotulos.items():
+        valor = str(valor).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        valores.append(f'{nome}="{valor}"')
+    return "{" + ",".join(valores) + "}"
+
+def _limite(limite):
+    return "+Inf" if math.isinf(limite) else repr(float(limite))
+
+def _exportar_histogramas(linhas, nome, descricao, histogramas, nomes_rotulos):
+    linhas.append(f"# HELP {nome} {descricao}")
+    linhas.append(f"# TYPE {nome} histogram")
+    for chave, histograma in sorted(histogramas.items()):
+        rotulos = dict(zip(nomes_rotulos, chave))
+        acumulado = 0
+        for limite, quantidade in zip(histograma.limites + (math.inf,), histograma.faixas):
+            acumulado += quantidade
+            linhas.append(f"{nome}_bucket{_rotulos(**rotulos, le=_limite(limite))} {acumulado}")
+        linhas.append(f"{nome}_sum{_rotulos(**rotulos)} {histograma.soma!r}")
+        linhas.append(f"{nome}_count{_rotulos(**rotulos)} {histograma.contagem}")
+
+def exportar_prometheus():
+    """Retorna as métricas coletadas no formato de texto do Prometheus."""
+    with _trava:
+        duracoes = {chave: _copiar_histograma(h) for chave, h in _duracoes.items()}
+        requisicoes = {chave: _copiar_histograma(h) for chave, h in _requisicoes.items()}
+        erros = dict(_erros)
+
+    linhas = []
+    _exportar_histogramas(linhas, f"{PREFIXO}_operacao_duracao_segundos",
+                          "Duração das operações instrumentadas (banco, features, modelos, API e backtest).",
+                          duracoes, ("componente", "operacao"))
+    nome = f"{PREFIXO}_operacao_erros_total"
+    linhas.append(f"# HELP {nome} Operações instrumentadas que terminaram com exceção.")
+    linhas.append(f"# TYPE {nome} counter")
+    for (componente, operacao), quantidade in sorted(erros.items()):
+        linhas.append(f"{nome}{_rotulos(componente=componente, operacao=operacao)} {quantidade}")
+    _exportar_histogramas(linhas, f"{PREFIXO}_requisicao_duracao_segundos",
+                          "Duração das requisições web por rota, método e status.",
+                          requisicoes, ("rota", "metodo", "status"))
+    return "\n".join(linhas) + "\n"
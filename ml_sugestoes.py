@@ -2,183 +2,600 @@
 import pandas as pd
 import numpy as np
 import os
+import copy
+import hashlib
+import json
+import threading
+import uuid
 import joblib
-from collections import Counter
-from sklearn.linear_model import LogisticRegression
 from sklearn.ensemble import RandomForestClassifier
-from database import obter_todos_os_resultados
+from features import JANELAS_FREQUENCIA
+import artefato
+import cache
 import database
+import features
+import metricas
 
 MODEL_DIR = "trained_models"
-# Garante que o diretório para salvar os modelos exista
-os.makedirs(MODEL_DIR, exist_ok=True)
-
-def criar_dataframe_features():
-    """
-    Cria um DataFrame do pandas com todos os resultados e a presença de cada dezena.
-    """
-    # Obter todos os resultados do banco de dados
-    resultados = obter_todos_os_resultados()
-    if not resultados:
-        return pd.DataFrame()
-
-    # Converter para um formato mais fácil de analisar
-    dados = []
-    for concurso, dezenas in resultados:
-        linha = {'concurso': concurso}
-        # Adiciona uma coluna para cada dezena, marcando 1 se ela foi sorteada
-        for i in range(1, 26):
-            linha[f'dezena_{i}'] = 1 if i in dezenas else 0
-        dados.append(linha)
-
-    df = pd.DataFrame(dados)
-    df = df.set_index('concurso')
-    df = df.sort_index()
-    
-    return df
+# Motor dos modelos: 'por_dezena' treina uma RandomForest por dezena, cada uma com
+# as 6 features da sua dezena; 'multi_saida' treina uma única RandomForest de 25
+# saídas sobre todas as features, que prevê as 25 dezenas de uma vez
+MOTORES = ('por_dezena', 'multi_saida')
+MOTOR_MODELOS = 'por_dezena'
+# Hiperparâmetros dos modelos (de cada dezena ou do modelo de múltiplas saídas)
+PARAMETROS_MODELO = {'n_estimators': 100, 'random_state': 42}
+# Arquivo que registra até qual concurso os modelos salvos foram treinados
+MANIFESTO_MODELOS = "manifesto.json"
+# Atualização incremental: árvores acrescentadas a cada atualização, número mínimo
+# de concursos usados para treiná-las e total de árvores a partir do qual os
+# modelos são retreinados do zero
+ARVORES_POR_ATUALIZACAO = 10
+JANELA_MINIMA_INCREMENTAL = 100
+LIMITE_ARVORES = 300
+# Artefato compacto: as 25 florestas compiladas em um único arquivo (ver artefato.py),
+# mapeado em memória e compartilhado entre os processos. Os arquivos joblib continuam
+# sendo gravados, pois a atualização incremental precisa dos modelos completos.
+# ARQUIVO_ARTEFATO é o nome base: cada geração de modelos grava o seu próprio arquivo
+# (ver caminho_artefato)
+ARTEFATO_COMPACTO = True
+ARQUIVO_ARTEFATO = "modelos.lfm"
+# Compressão, precisão e poda do artefato (ver artefato.OPCOES_PADRAO)
+OPCOES_ARTEFATO = dict(artefato.OPCOES_PADRAO)
+
+# Modelos carregados do disco, compartilhados por todas as requisições do processo
+_registro_modelos = {'versao': None, 'modelos': None, 'florestas': None}
+_registro_artefato = {'versao': None, 'florestas': None}
+_trava_registro = threading.Lock()
+
+def definir_motor(motor):
+    """Define o motor dos modelos ('por_dezena' ou 'multi_saida'). Cada motor tem seus próprios arquivos (ver diretorio_modelos)."""
+    global MOTOR_MODELOS
+    if motor not in MOTORES:
+        raise ValueError(f"Motor de modelos desconhecido: {motor}. Use {' ou '.join(MOTORES)}.")
+    MOTOR_MODELOS = motor
 
-def calcular_features_atraso(df):
+def descrever_estrategia():
     """
-    Calcula o atraso de cada dezena (há quantos concursos não aparece).
+    Retorna um identificador da configuração atual dos modelos (motor, tipo de
+    modelo, hiperparâmetros e janelas de frequência), usado para separar
+    resultados de backtest de configurações diferentes.
     """
-    df_atraso = pd.DataFrame(index=df.index)
+    configuracao = {
+        'modelo': RandomForestClassifier.__name__,
+        'parametros': PARAMETROS_MODELO,
+        'janelas': JANELAS_FREQUENCIA,
+    }
+    # O motor original não entra no identificador, para manter os checkpoints já gravados
+    if MOTOR_MODELOS != 'por_dezena':
+        configuracao['motor'] = MOTOR_MODELOS
+    return json.dumps(configuracao, sort_keys=True)
+
+def colunas_modelo(i):
+    """Retorna as colunas de features usadas pelo modelo da dezena `i`."""
+    return [f'atraso_{i}', f'freq_10_{i}', f'freq_20_{i}', f'freq_50_{i}', f'lag_{i}', 'soma_dezenas']
+
+def colunas_multi_saida():
+    """Retorna as colunas de features do modelo de múltiplas saídas: as de todas as dezenas, sem repetir a soma."""
+    colunas = [coluna for i in range(1, 26) for coluna in colunas_modelo(i)[:-1]]
+    return colunas + ['soma_dezenas']
+
+def _dados_treino(df_features):
+    """Gera (X, y) de cada modelo do motor: 25 pares no motor por dezena, um único no de múltiplas saídas."""
+    if MOTOR_MODELOS == 'multi_saida':
+        yield df_features[colunas_multi_saida()], df_features[[f'dezena_{i}' for i in range(1, 26)]]
+        return
     for i in range(1, 26):
-        dezena_col = f'dezena_{i}'
-        # Encontra os concursos em que a dezena apareceu
-        sorteios_com_dezena = df[df[dezena_col] == 1].index
-        # Calcula o atraso para cada concurso no DataFrame original
-        atrasos = []
-        for concurso_atual in df.index:
-            # Filtra os sorteios que aconteceram antes do concurso atual
-            sorteios_passados = sorteios_com_dezena[sorteios_com_dezena < concurso_atual]
-            if not sorteios_passados.empty:
-                ultimo_sorteio = sorteios_passados.max()
-                atraso = concurso_atual - ultimo_sorteio
-            else:
-                # Se a dezena nunca saiu antes, o atraso é o próprio número do concurso
-                atraso = concurso_atual
-            atrasos.append(atraso)
-        df_atraso[f'atraso_{i}'] = atrasos
-    return df_atraso
+        yield df_features[colunas_modelo(i)], df_features[f'dezena_{i}']
 
-def calcular_features_frequencia(df):
+def diretorio_modelos():
     """
-    Calcula a frequência de cada dezena nas últimas N janelas (10, 20, 50).
+    Retorna o diretório dos modelos, do manifesto e do artefato do motor
+    configurado: MODEL_DIR no motor por dezena e um subdiretório no de
+    múltiplas saídas, para que os dois motores não sobrescrevam um ao outro.
     """
-    df_frequencia = pd.DataFrame(index=df.index)
-    janelas = [10, 20, 50]
-    for i in range(1, 26):
-        dezena_col = f'dezena_{i}'
-        for j in janelas:
-            # Usamos shift(1) para que a frequência seja baseada nos jogos *anteriores*
-            df_frequencia[f'freq_{j}_{i}'] = df[dezena_col].shift(1).rolling(window=j).sum()
-    
-    # Remove as linhas que terão valores NaN devido à janela de rolling
-    df_frequencia = df_frequencia.dropna()
-    return df_frequencia
+    if MOTOR_MODELOS == 'multi_saida':
+        return os.path.join(MODEL_DIR, 'multi_saida')
+    return MODEL_DIR
+
+def caminho_modelo(i):
+    """Retorna o caminho do arquivo do modelo da dezena `i`."""
+    return os.path.join(MODEL_DIR, f"modelo_dezena_{i}.joblib")
+
+def caminhos_modelos():
+    """Retorna os caminhos dos arquivos dos modelos do motor configurado (MOTOR_MODELOS)."""
+    if MOTOR_MODELOS == 'multi_saida':
+        return [os.path.join(diretorio_modelos(), "modelo_multi_saida.joblib")]
+    return [caminho_modelo(i) for i in range(1, 26)]
 
-def calcular_feature_lag(df):
+def versao_modelos():
     """
-    Cria a feature de lag (se a dezena saiu no concurso anterior).
+    Retorna a versão dos modelos salvos (data de modificação e tamanho de cada
+    arquivo), ou None se algum dos arquivos não existir.
     """
-    df_lag = pd.DataFrame(index=df.index)
-    for i in range(1, 26):
-        # A feature de lag é simplesmente o resultado da dezena no concurso anterior
-        df_lag[f'lag_{i}'] = df[f'dezena_{i}'].shift(1)
-    return df_lag
+    versao = [diretorio_modelos()]
+    for caminho in caminhos_modelos():
+        try:
+            info = os.stat(caminho)
+        except FileNotFoundError:
+            return None
+        versao.append((info.st_mtime_ns, info.st_size))
+    return tuple(versao)
+
+def _probabilidade_classe_1(valores):
+    """Probabilidade da classe 1 em cada nó, a partir de `tree.value[:, saida, :]`."""
+    if valores[0].sum() > 1 + 1e-9:
+        # Versões antigas do scikit-learn guardam contagens e normalizam na previsão
+        total = valores.sum(axis=1)
+        total[total == 0.0] = 1.0
+        return valores[:, 1] / total
+    return valores[:, 1]
 
-def calcular_feature_soma(df):
+def _compilar_multi_saida(modelo):
     """
-    Calcula a soma das dezenas sorteadas para cada concurso.
+    Compila a RandomForest de 25 saídas: as árvores são percorridas uma vez só
+    e cada folha guarda a probabilidade das 25 dezenas (`probabilidades` com
+    uma coluna por saída).
     """
-    df_soma = pd.DataFrame(index=df.index)
-    somas = []
-    for index, row in df.iterrows():
-        # Pega apenas as colunas de dezenas (dezena_1 a dezena_25)
-        dezenas_sorteadas_no_concurso = [i for i in range(1, 26) if row[f'dezena_{i}'] == 1]
-        somas.append(sum(dezenas_sorteadas_no_concurso))
-    
-    # Usamos shift(1) para que a feature seja baseada no concurso *anterior*
-    df_soma['soma_dezenas'] = pd.Series(somas, index=df.index).shift(1)
-    return df_soma
+    if any(len(classes) != 2 for classes in modelo.classes_):
+        return None
+    esquerda, direita, features, limiares, probabilidades, raizes = [], [], [], [], [], []
+    inicio = 0
+    for arvore in modelo.estimators_:
+        tree = arvore.tree_
+        folha = tree.children_left == -1
+        esquerda.append(np.where(folha, -1, tree.children_left + inicio))
+        direita.append(np.where(folha, -1, tree.children_right + inicio))
+        features.append(np.where(folha, 0, tree.feature))
+        limiares.append(tree.threshold)
+        probabilidades.append(np.stack([_probabilidade_classe_1(tree.value[:, saida, :])
+                                        for saida in range(tree.value.shape[1])], axis=1))
+        raizes.append(inicio)
+        inicio += tree.node_count
 
-def treinar_ou_carregar_modelos_e_prever(df_features, force_retrain=False, verbose=True):
+    return {
+        'esquerda': np.concatenate(esquerda),
+        'direita': np.concatenate(direita),
+        'features': np.concatenate(features),
+        'limiares': np.concatenate(limiares),
+        'probabilidades': np.concatenate(probabilidades),
+        'raizes': np.array(raizes),
+        'n_arvores': len(modelo.estimators_),
+    }
+
+@metricas.medido("modelo", "compilar")
+def compilar_florestas(modelos):
     """
-    Função principal que lida com o treinamento, carregamento e previsão.
-    Retorna a sugestão de 15 dezenas.
-    `verbose=False` a torna silenciosa para uso em backtesting.
+    Junta as árvores das 25 RandomForests em vetores únicos (filhos, feature,
+    limiar e probabilidade de cada nó) para que a previsão percorra todas as
+    árvores de uma só vez. Retorna None se os modelos não forem florestas com o
+    mesmo número de árvores, caso em que a previsão usa `predict_proba`.
+    Também aceita a lista com o único modelo do motor de múltiplas saídas.
+    """
+    if not all(isinstance(modelo, RandomForestClassifier) for modelo in modelos):
+        return None
+    if len(modelos) == 1 and modelos[0].n_outputs_ > 1:
+        return _compilar_multi_saida(modelos[0])
+    n_arvores = len(modelos[0].estimators_)
+    if any(len(modelo.estimators_) != n_arvores or len(modelo.classes_) != 2 for modelo in modelos):
+        return None
+
+    esquerda, direita, features, limiares, probabilidades, raizes = [], [], [], [], [], []
+    inicio = 0
+    for m, modelo in enumerate(modelos):
+        n_features = modelo.n_features_in_
+        for arvore in modelo.estimators_:
+            tree = arvore.tree_
+            folha = tree.children_left == -1
+            esquerda.append(np.where(folha, -1, tree.children_left + inicio))
+            direita.append(np.where(folha, -1, tree.children_right + inicio))
+            # Cada modelo lê as suas features na linha correspondente da matriz (25 x n_features)
+            features.append(np.where(folha, 0, tree.feature) + m * n_features)
+            limiares.append(tree.threshold)
+            probabilidades.append(_probabilidade_classe_1(tree.value[:, 0, :]))
+            raizes.append(inicio)
+            inicio += tree.node_count
+
+    return {
+        'esquerda': np.concatenate(esquerda),
+        'direita': np.concatenate(direita),
+        'features': np.concatenate(features),
+        'limiares': np.concatenate(limiares),
+        'probabilidades': np.concatenate(probabilidades),
+        'raizes': np.array(raizes),
+        'n_arvores': n_arvores,
+    }
+
+def prever_florestas(florestas, X):
+    """
+    Calcula a probabilidade da classe 1 para cada linha de `X` (uma linha por
+    modelo), percorrendo todas as árvores juntas. Reproduz o `predict_proba`
+    da RandomForest, inclusive a ordem das somas. No modelo de múltiplas
+    saídas, `X` é uma única linha e o resultado traz uma probabilidade por saída.
+    """
+    # As árvores comparam as features em float32, como o scikit-learn
+    x = np.asarray(X, dtype=np.float32).astype(np.float64).ravel()
+    no = florestas['raizes'].copy()
+    while True:
+        esquerda = florestas['esquerda'][no]
+        folha = esquerda == -1
+        if folha.all():
+            break
+        vai_para_esquerda = x[florestas['features'][no]] <= florestas['limiares'][no]
+        no = np.where(folha, no, np.where(vai_para_esquerda, esquerda, florestas['direita'][no]))
+
+    n_arvores = florestas['n_arvores']
+    folhas = florestas['probabilidades'][no]
+    if folhas.ndim == 2:
+        # Múltiplas saídas: uma linha por árvore, uma coluna por saída
+        probabilidades_arvores = folhas.T
+    else:
+        probabilidades_arvores = folhas.reshape(-1, n_arvores)
+    soma = np.zeros(probabilidades_arvores.shape[0])
+    for k in range(n_arvores):
+        soma += probabilidades_arvores[:, k]
+    return soma / n_arvores
+
+def _registrar_modelos(modelos, versao):
+    _registro_modelos['versao'] = versao
+    _registro_modelos['modelos'] = modelos
+    _registro_modelos['florestas'] = compilar_florestas(modelos)
+
+def _florestas_registradas(modelos):
+    """Retorna as florestas compiladas se `modelos` forem os modelos em memória do processo."""
+    with _trava_registro:
+        if modelos is _registro_modelos['modelos']:
+            return _registro_modelos['florestas']
+    return None
+
+def carregar_modelos():
+    """
+    Retorna os modelos salvos em disco (do motor configurado), mantendo-os em memória no processo.
+    Os arquivos só são lidos novamente quando mudam em disco.
+    Retorna None se os modelos ainda não foram treinados.
+    """
+    versao = versao_modelos()
+    if versao is None:
+        return None
+
+    with _trava_registro:
+        if _registro_modelos['versao'] != versao:
+            with metricas.medir("modelo", "carregar"):
+                modelos = [joblib.load(caminho) for caminho in caminhos_modelos()]
+            _registrar_modelos(modelos, versao)
+        return _registro_modelos['modelos']
+
+def caminho_artefato(manifesto=None):
+    """
+    Retorna o caminho do artefato compacto dos modelos descritos em `manifesto`
+    (por padrão, o dos modelos salvos), ou None se não houver modelos salvos.
+
+    O nome traz a geração dos modelos e as OPCOES_ARTEFATO, então um artefato
+    é gravado uma única vez e nunca substituído: trocar um arquivo que outro
+    processo mantém mapeado falha no Windows. O manifesto dos modelos faz a
+    troca para o artefato novo.
+    """
+    if manifesto is None:
+        manifesto = ler_manifesto()
+    if not manifesto or not manifesto.get('geracao'):
+        return None
+    base, extensao = os.path.splitext(ARQUIVO_ARTEFATO)
+    opcoes = hashlib.sha1(json.dumps(OPCOES_ARTEFATO, sort_keys=True).encode('utf-8')).hexdigest()[:8]
+    return os.path.join(diretorio_modelos(), f"{base}.{manifesto['geracao'][:16]}.{opcoes}{extensao}")
+
+def _remover_artefatos_antigos(caminho_atual):
+    """
+    Apaga os artefatos de gerações (ou opções) anteriores. No Windows, os que
+    ainda estão mapeados por algum processo não podem ser apagados e ficam
+    para a próxima gravação.
+    """
+    base, extensao = os.path.splitext(ARQUIVO_ARTEFATO)
+    for nome in os.listdir(diretorio_modelos()):
+        caminho = os.path.join(diretorio_modelos(), nome)
+        antigo = nome == ARQUIVO_ARTEFATO or (nome.startswith(base + ".") and nome.endswith(extensao))
+        if antigo and caminho != caminho_atual:
+            try:
+                os.remove(caminho)
+            except OSError:
+                pass
+
+def _versao_artefato():
+    """Caminho, data de modificação e tamanho do artefato atual, ou None se ele não existir."""
+    caminho = caminho_artefato()
+    if caminho is None:
+        return None
+    try:
+        info = os.stat(caminho)
+    except FileNotFoundError:
+        return None
+    return caminho, json.dumps(OPCOES_ARTEFATO, sort_keys=True), info.st_mtime_ns, info.st_size
+
+def carregar_artefato():
+    """
+    Retorna as florestas do artefato compacto, prontas para `prever_florestas`
+    e mapeadas em memória, mantendo-as no processo até o arquivo mudar.
+    Retorna None se ARTEFATO_COMPACTO estiver desligado, se o artefato não
+    existir ou se ele não corresponder aos modelos salvos (geração diferente
+    da registrada no manifesto) ou às OPCOES_ARTEFATO atuais.
+    """
+    if not ARTEFATO_COMPACTO:
+        return None
+    versao = _versao_artefato()
+    if versao is None:
+        return None
+
+    with _trava_registro:
+        if _registro_artefato['versao'] != versao:
+            try:
+                with metricas.medir("modelo", "carregar_artefato"):
+                    manifesto_artefato, arrays = artefato.ler(versao[0])
+            except (OSError, ValueError) as e:
+                print(f"Artefato de modelos ignorado: {e}")
+                return None
+            manifesto = ler_manifesto()
+            if (manifesto_artefato.get('opcoes') != OPCOES_ARTEFATO
+                    or manifesto_artefato.get('estrategia') != descrever_estrategia()
+                    or (manifesto is not None and manifesto_artefato.get('geracao') != manifesto.get('geracao'))):
+                return None
+            _registro_artefato['versao'] = versao
+            _registro_artefato['florestas'] = dict(arrays, n_arvores=manifesto_artefato['n_arvores'])
+        return _registro_artefato['florestas']
+
+def _gravar_artefato(florestas, manifesto):
+    """Grava o artefato compacto a partir das florestas compiladas dos modelos salvos."""
+    arrays, n_arvores = artefato.preparar_florestas(florestas, OPCOES_ARTEFATO)
+    if MOTOR_MODELOS == 'multi_saida':
+        colunas = colunas_multi_saida()
+    else:
+        colunas = [colunas_modelo(i) for i in range(1, 26)]
+    manifesto = dict(
+        manifesto,
+        estrategia=descrever_estrategia(),
+        motor=MOTOR_MODELOS,
+        n_arvores=n_arvores,
+        opcoes=OPCOES_ARTEFATO,
+        parametros=PARAMETROS_MODELO,
+        colunas=colunas,
+    )
+    caminho = caminho_artefato(manifesto)
+    if caminho is None:
+        return
+    with metricas.medir("modelo", "salvar_artefato"):
+        artefato.gravar(caminho, manifesto, arrays, OPCOES_ARTEFATO['compressao'])
+    _remover_artefatos_antigos(caminho)
+
+def ler_manifesto():
+    """Retorna o manifesto dos modelos salvos, ou None se ainda não existir."""
+    try:
+        with open(os.path.join(diretorio_modelos(), MANIFESTO_MODELOS), encoding='utf-8') as arquivo:
+            return json.load(arquivo)
+    except (FileNotFoundError, ValueError):
+        # Ausente ou sendo regravado por outro processo
+        return None
+
+def _salvar_modelos(modelos, ultimo_concurso, atualizacoes_incrementais=0):
+    """Grava os modelos e o manifesto em disco e os torna os modelos em memória do processo."""
+    os.makedirs(diretorio_modelos(), exist_ok=True)
+    manifesto = {
+        'ultimo_concurso': int(ultimo_concurso),
+        'estrategia': descrever_estrategia(),
+        'n_arvores': len(getattr(modelos[0], 'estimators_', [])),
+        'atualizacoes_incrementais': atualizacoes_incrementais,
+        # Identifica este treino; o artefato compacto só vale se tiver a mesma geração
+        'geracao': uuid.uuid4().hex,
+    }
+    with _trava_registro, metricas.medir("modelo", "salvar"):
+        for model, caminho in zip(modelos, caminhos_modelos()):
+            joblib.dump(model, caminho)
+        with open(os.path.join(diretorio_modelos(), MANIFESTO_MODELOS), 'w', encoding='utf-8') as arquivo:
+            json.dump(manifesto, arquivo)
+        _registrar_modelos(modelos, versao_modelos())
+        if ARTEFATO_COMPACTO and _registro_modelos['florestas'] is not None:
+            _gravar_artefato(_registro_modelos['florestas'], manifesto)
+
+def treinar_modelos(df_features, verbose=True, salvar=True, n_jobs=-1):
+    """
+    Treina os modelos do motor configurado com todas as linhas de `df_features`
+    e retorna a lista com os modelos: um por dezena ou, no motor 'multi_saida',
+    um só. Com `salvar=True` os modelos são gravados em disco e passam a ser os
+    modelos em memória do processo.
+    """
+    modelos = []
+    for i, (X_train, y_train) in enumerate(_dados_treino(df_features), start=1):
+        if verbose:
+            if MOTOR_MODELOS == 'multi_saida':
+                print("Treinando o modelo de múltiplas saídas para as 25 dezenas...")
+            else:
+                print(f"Treinando o modelo para a dezena {i:02d}...")
+
+        # model = LogisticRegression(solver='liblinear')
+        model = RandomForestClassifier(**PARAMETROS_MODELO, n_jobs=n_jobs)
+        with metricas.medir("modelo", "ajustar"):
+            model.fit(X_train, y_train)
+        modelos.append(model)
+
+    if salvar:
+        _salvar_modelos(modelos, df_features.index[-1])
+    return modelos
+
+def atualizar_modelos_incremental(df_features, verbose=True, n_jobs=-1):
+    """
+    Atualiza os modelos salvos sem retreiná-los do zero: cada floresta ganha
+    novas árvores (warm start) treinadas com os concursos que chegaram depois
+    do último treino registrado no manifesto.
+    Faz o treino completo quando não há modelos salvos, quando a configuração
+    mudou ou quando as florestas passariam de LIMITE_ARVORES.
+    """
+    manifesto = ler_manifesto()
+    modelos = carregar_modelos()
+    if modelos is None or manifesto is None or manifesto.get('estrategia') != descrever_estrategia():
+        print("Não há modelos salvos com a configuração atual. Fazendo o treino completo...")
+        return treinar_modelos(df_features, verbose=verbose, n_jobs=n_jobs)
+
+    inicio_novos = df_features.index.searchsorted(manifesto['ultimo_concurso'], side='right')
+    novos = len(df_features) - inicio_novos
+    if novos <= 0:
+        print(f"Os modelos já estão treinados até o concurso {manifesto['ultimo_concurso']}.")
+        return modelos
+
+    n_arvores = len(modelos[0].estimators_) + ARVORES_POR_ATUALIZACAO
+    if n_arvores > LIMITE_ARVORES:
+        print(f"As florestas passariam de {LIMITE_ARVORES} árvores. Fazendo o treino completo...")
+        return treinar_modelos(df_features, verbose=verbose, n_jobs=n_jobs)
+
+    print(f"Atualizando os modelos com {novos} concurso(s) novo(s) (até o concurso {df_features.index[-1]})...")
+    # As novas árvores precisam ver as duas classes (dezena sorteada ou não), então,
+    # quando chegam poucos concursos, a janela é completada com os concursos anteriores
+    janela = df_features.iloc[min(inicio_novos, max(0, len(df_features) - JANELA_MINIMA_INCREMENTAL)):]
+
+    atualizados = []
+    for modelo, (X_janela, y_janela) in zip(modelos, _dados_treino(janela)):
+        # Copia para não alterar os modelos em uso por outras requisições
+        modelo = copy.deepcopy(modelo)
+        modelo.set_params(warm_start=True, n_estimators=n_arvores, n_jobs=n_jobs)
+        with metricas.medir("modelo", "ajustar_incremental"):
+            modelo.fit(X_janela, y_janela)
+        modelo.set_params(warm_start=False)
+        atualizados.append(modelo)
+
+    _salvar_modelos(atualizados, df_features.index[-1], manifesto.get('atualizacoes_incrementais', 0) + 1)
+    return atualizados
+
+@metricas.medido("modelo", "prever")
+def prever_probabilidades(modelos, df_features, florestas=None):
+    """
+    Calcula, em um único lote, a probabilidade de cada uma das 25 dezenas a
+    partir da última linha de `df_features`. Retorna {dezena: probabilidade}.
+    `florestas` é o resultado de `compilar_florestas(modelos)` (ou as
+    florestas do artefato compacto, caso em que `modelos` pode ser None);
+    sem ele, cada modelo é consultado com `predict_proba`.
+    """
+    if MOTOR_MODELOS == 'multi_saida':
+        colunas = colunas_multi_saida()
+        X = df_features.iloc[[-1]][colunas]
+        if florestas is not None:
+            return dict(zip(range(1, 26), prever_florestas(florestas, X.to_numpy())))
+        return {i: saida[0, 1] for i, saida in enumerate(modelos[0].predict_proba(X), start=1)}
+
+    colunas = [colunas_modelo(i) for i in range(1, 26)]
+    posicoes = df_features.columns.get_indexer([coluna for grupo in colunas for coluna in grupo])
+    # Extrai as features das 25 dezenas de uma vez: uma linha por dezena
+    X = df_features.iloc[-1].to_numpy()[posicoes].reshape(25, -1)
+
+    if florestas is not None:
+        return dict(zip(range(1, 26), prever_florestas(florestas, X)))
+
+    probabilidades = {}
+    for i, (model, colunas_dezena, x) in enumerate(zip(modelos, colunas, X), start=1):
+        X_predict = pd.DataFrame(x[None, :], columns=colunas_dezena)
+        probabilidades[i] = model.predict_proba(X_predict)[0, 1]
+    return probabilidades
+
+def selecionar_dezenas(probabilidades):
+    """Retorna, em ordem crescente, as 15 dezenas com as maiores probabilidades."""
+    dezenas_ordenadas = sorted(probabilidades, key=probabilidades.get, reverse=True)
+    return sorted(dezenas_ordenadas[:15])
+
+def calcular_probabilidades(df_features, force_retrain=False, verbose=True, salvar=True, n_jobs=-1,
+                            incremental=False):
+    """
+    Carrega (ou treina) os modelos e retorna a probabilidade de cada dezena
+    no formato {dezena: probabilidade}. Os argumentos são os mesmos de
+    `treinar_ou_carregar_modelos_e_prever`.
     """
     if verbose:
         print("\nCarregando ou treinando modelos...")
 
-    features_para_prever = df_features.iloc[[-1]]
-    probabilidades = {}
-    
-    for i in range(1, 26):
-        model_path = os.path.join(MODEL_DIR, f"modelo_dezena_{i}.joblib")
-        model = None
-
-        if not force_retrain and os.path.exists(model_path):
-            model = joblib.load(model_path)
-        
-        if model is None:
-            if verbose and force_retrain:
-                print(f"Forçando retreinamento do modelo para a dezena {i:02d}...")
-            
-            feature_cols = [f'atraso_{i}', f'freq_10_{i}', f'freq_20_{i}', f'freq_50_{i}', f'lag_{i}', 'soma_dezenas']
-            target_col = f'dezena_{i}'
-
-            X_train = df_features[feature_cols]
-            y_train = df_features[target_col]
-            
-            # model = LogisticRegression(solver='liblinear')
-            model = RandomForestClassifier(n_estimators=100, random_state=42, n_jobs=-1)
-            model.fit(X_train, y_train)
-            joblib.dump(model, model_path)
+    modelos = florestas = None
+    if not force_retrain:
+        # O artefato compacto dispensa a leitura dos arquivos joblib
+        florestas = carregar_artefato()
+        if florestas is None:
+            modelos = carregar_modelos()
+            if modelos is not None and ARTEFATO_COMPACTO and _florestas_registradas(modelos) is not None:
+                # Artefato ausente ou desatualizado: é gerado a partir dos modelos joblib
+                _gravar_artefato(_florestas_registradas(modelos), ler_manifesto() or {})
+                florestas = carregar_artefato()
 
-        # Realiza a previsão com o modelo (carregado ou recém-treinado)
-        feature_cols_predict = [f'atraso_{i}', f'freq_10_{i}', f'freq_20_{i}', f'freq_50_{i}', f'lag_{i}', 'soma_dezenas']
-        X_predict = features_para_prever[feature_cols_predict]
-        prob = model.predict_proba(X_predict)[0, 1]
-        probabilidades[i] = prob
+    if force_retrain and incremental and salvar:
+        modelos = atualizar_modelos_incremental(df_features, verbose=verbose, n_jobs=n_jobs)
+    elif modelos is None and florestas is None:
+        if verbose and force_retrain:
+            print("Forçando retreinamento dos modelos...")
+        modelos = treinar_modelos(df_features, verbose=verbose, salvar=salvar, n_jobs=n_jobs)
+
+    # Realiza a previsão com os modelos (carregados ou recém-treinados); os que
+    # acabaram de ser salvos preveem pelo artefato, como fará o próximo processo
+    if florestas is None and salvar:
+        florestas = carregar_artefato()
+    if florestas is None:
+        florestas = _florestas_registradas(modelos)
+    if florestas is None:
+        florestas = compilar_florestas(modelos)
+    probabilidades = prever_probabilidades(modelos, df_features, florestas)
 
     if verbose:
         print("Modelos processados.")
 
-    dezenas_ordenadas = sorted(probabilidades, key=probabilidades.get, reverse=True)
-    sugestao = sorted(dezenas_ordenadas[:15])
-    return sugestao
+    return probabilidades
 
-def gerar_sugestao_ml(concurso, user_id, force_retrain=False):
+def treinar_ou_carregar_modelos_e_prever(df_features, force_retrain=False, verbose=True, salvar=True, n_jobs=-1,
+                                         incremental=False):
+    """
+    Função principal que lida com o treinamento, carregamento e previsão.
+    Retorna a sugestão de 15 dezenas.
+    `verbose=False` a torna silenciosa para uso em backtesting.
+    `force_retrain=True` com `incremental=True` atualiza os modelos salvos
+    apenas com os concursos novos em vez de retreiná-los do zero.
+    `salvar=False` não grava os modelos treinados em disco e `n_jobs` define
+    quantos núcleos cada RandomForest usa (1 quando já roda dentro de um
+    processo paralelo do backtest).
+    """
+    probabilidades = calcular_probabilidades(df_features, force_retrain=force_retrain, verbose=verbose,
+                                             salvar=salvar, n_jobs=n_jobs, incremental=incremental)
+    return selecionar_dezenas(probabilidades)
+
+def gerar_sugestao_ml(concurso, user_id, force_retrain=False, incremental=False):
     """
     Orquestra a criação de features e a geração de sugestão, imprimindo os resultados.
+    Com `force_retrain=True`, `incremental=True` atualiza os modelos apenas com
+    os concursos novos; caso contrário eles são retreinados do zero.
     """
-    if force_retrain:
+    if force_retrain and incremental:
+        print("\nA atualização incremental dos modelos foi solicitada.")
+    elif force_retrain:
         print("\nO retreinamento forçado dos modelos foi solicitado.")
 
+    # Sem retreino, o resultado depende apenas do último concurso salvo e dos
+    # modelos em disco, então as probabilidades já calculadas são reaproveitadas
+    versao = versao_modelos()
+    if not force_retrain and versao is not None:
+        chave = (database.obter_ultimo_concurso_salvo(), versao, descrever_estrategia())
+        probabilidades = cache.cache_resultados.obter(chave)
+        if probabilidades is not None:
+            print("\nUsando as probabilidades já calculadas para o último concurso.")
+            sugestao = selecionar_dezenas(probabilidades)
+            database.salvar_sugestao(user_id, concurso, sugestao, "Machine Learning")
+            return sugestao
+
     print("\nIniciando a preparação de dados para Machine Learning...")
     
-    df_resultados = criar_dataframe_features()
+    # O feature store calcula apenas os concursos que ainda não tinham features
+    print("Carregando as features (Atraso, Frequência, Lag, Soma) do feature store...")
+    df_features = features.carregar_features()
 
-    if len(df_resultados) < 60:
+    # Os primeiros concursos da maior janela de frequência não têm linha de features, então
+    # o histórico tem len(df_features) + max(JANELAS_FREQUENCIA) concursos (menos, se vazio)
+    if len(df_features) + max(JANELAS_FREQUENCIA) < 60:
         print("\nDados insuficientes para treinar os modelos. Atualize o banco de dados.")
         return
 
-    print("Calculando todas as features (Atraso, Frequência, Lag, Soma)...")
-    df_atraso = calcular_features_atraso(df_resultados)
-    df_frequencia = calcular_features_frequencia(df_resultados)
-    df_lag = calcular_feature_lag(df_resultados)
-    df_soma = calcular_feature_soma(df_resultados)
-
-    df_features = pd.concat([df_resultados, df_atraso, df_frequencia, df_lag, df_soma], axis=1)
-    df_features = df_features.dropna()
-    for i in range(1, 26):
-        df_features[f'lag_{i}'] = df_features[f'lag_{i}'].astype(int)
-    df_features['soma_dezenas'] = df_features['soma_dezenas'].astype(int)
-
     print("\nEngenharia de Features Concluída!")
 
-    sugestao = treinar_ou_carregar_modelos_e_prever(df_features, force_retrain=force_retrain, verbose=True)
+    probabilidades = calcular_probabilidades(df_features, force_retrain=force_retrain, verbose=True,
+                                             incremental=incremental)
+    chave = (int(df_features.index[-1]), versao_modelos(), descrever_estrategia())
+    cache.cache_resultados.guardar(chave, probabilidades)
+    sugestao = selecionar_dezenas(probabilidades)
 
     # Salva a sugestão no banco de dados
     database.salvar_sugestao(user_id, concurso, sugestao, "Machine Learning")
@@ -188,4 +605,5 @@ def gerar_sugestao_ml(concurso, user_id, force_retrain=False):
 
 # Exemplo de como usar (para teste)
 if __name__ == '__main__':
+    database.inicializar()
     gerar_sugestao_ml()
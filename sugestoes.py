@@ -1,12 +1,36 @@
 from collections import Counter
 import random
+import cache
 import database
 
+def calcular_ranking_frequencia(todos_os_resultados=None):
+    """
+    Retorna as dezenas ordenadas da mais para a menos sorteada, como uma lista
+    de (dezena, vezes). O ranking fica em cache até a chegada de um novo concurso.
+    Sem `todos_os_resultados`, o histórico só é lido do banco quando o ranking
+    não está em cache.
+    """
+    chave = (database.obter_ultimo_concurso_salvo(), None, 'frequencia')
+    ranking = cache.cache_resultados.obter(chave)
+    if ranking is None:
+        if todos_os_resultados is None:
+            todos_os_resultados = database.obter_todos_os_resultados()
+        todas_as_dezenas = [dezena for resultado in todos_os_resultados for dezena in resultado[1]]
+        ranking = Counter(todas_as_dezenas).most_common()
+        cache.cache_resultados.guardar(chave, ranking)
+    return ranking
+
 def gerar_sugestoes(todos_os_resultados, concurso, user_id):
     """
     Analisa o histórico de resultados e gera 3 jogos sugeridos.
+    Com `todos_os_resultados` None, usa o ranking em cache e só lê o histórico
+    do banco se precisar recalculá-lo.
     """
-    if not todos_os_resultados or len(todos_os_resultados) < 10: # Precisa de um histórico mínimo
+    if todos_os_resultados is None:
+        _, quantidade = database.obter_resumo_concursos()
+    else:
+        quantidade = len(todos_os_resultados)
+    if quantidade < 10: # Precisa de um histórico mínimo
         print("Histórico de dados insuficiente para gerar sugestões.")
         # Gera um jogo completamente aleatório se não houver dados
         jogo_aleatorio = sorted(random.sample(range(1, 26), 15))
@@ -15,9 +39,7 @@ def gerar_sugestoes(todos_os_resultados, concurso, user_id):
     print("\nGerando sugestões com base no histórico completo...")
 
     # 1. Análise de Frequência
-    todas_as_dezenas = [dezena for resultado in todos_os_resultados for dezena in resultado[1]]
-    frequencia = Counter(todas_as_dezenas)
-    ranking = frequencia.most_common()
+    ranking = calcular_ranking_frequencia(todos_os_resultados)
 
     # Separa as dezenas em 3 grupos: mais frequentes, intermediárias e menos frequentes
     numeros_quentes = [num for num, count in ranking[:8]]
@@ -0,0 +1,161 @@
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import json
+import threading
+import time
+import traceback
+
+import database
+
+# Quantidade de tarefas executadas ao mesmo tempo; as demais aguardam na fila.
+# O backtest e o treino já usam vários núcleos (processos e n_jobs), por isso
+# as tarefas rodam em threads
+MAX_TAREFAS_SIMULTANEAS = 2
+# Intervalo (em segundos) entre os batimentos que indicam que uma tarefa continua viva
+INTERVALO_BATIMENTO = 15
+# Tarefas sem batimento há mais que isto (em segundos) são dadas como interrompidas
+LIMITE_BATIMENTO = 120
+# Quantidade de tarefas recentes cujos eventos ficam guardados em memória
+MAX_TAREFAS_COM_EVENTOS = 20
+
+# Funções executadas por tipo de tarefa, registradas com registrar_tipo
+_tipos = {}
+# Tipos cujo resultado não depende de quem pediu (ex.: atualizar o banco): pedidos
+# idênticos de usuários diferentes são combinados em uma única tarefa, visível a todos
+_tipos_compartilhados = set()
+# Tarefas deste processo que estão na fila ou em execução
+_em_andamento = set()
+# Eventos publicados por cada tarefa deste processo, para quem acompanha o andamento (SSE)
+_eventos = OrderedDict()
+# Protege o estado acima e avisa quem acompanha uma tarefa quando há novos eventos
+_condicao = threading.Condition()
+_executor = None
+
+def registrar_tipo(tipo, funcao, compartilhada=False):
+    """
+    Registra a função que executa as tarefas de `tipo`.
+    Com `compartilhada=False` (padrão) a tarefa pertence a quem a pediu: só
+    pedidos idênticos do mesmo usuário são combinados. Com `compartilhada=True`
+    o resultado não depende do usuário e pedidos idênticos de qualquer usuário
+    levam à mesma tarefa.
+
+    A função recebe os parâmetros da tarefa (dict, incluindo o `user_id` de
+    quem a pediu) e uma função `progresso(concluidos, total, mensagem=None,
+    evento=None)` para informar o andamento (e, opcionalmente, publicar um
+    evento para quem acompanha a tarefa), e retorna o resultado
+    (serializável em JSON) que fica guardado na tarefa.
+    """
+    _tipos[tipo] = funcao
+    if compartilhada:
+        _tipos_compartilhados.add(tipo)
+    else:
+        _tipos_compartilhados.discard(tipo)
+
+def _iniciar_executor():
+    global _executor
+    with _condicao:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=MAX_TAREFAS_SIMULTANEAS, thread_name_prefix="tarefa")
+            threading.Thread(target=_bater, name="batimento-tarefas", daemon=True).start()
+    return _executor
+
+def _bater():
+    """Renova periodicamente o batimento das tarefas deste processo."""
+    while True:
+        time.sleep(INTERVALO_BATIMENTO)
+        with _condicao:
+            ids = list(_em_andamento)
+        if ids:
+            database.registrar_batimento_tarefas(ids, time.time())
+
+def enfileirar(tipo, parametros=None, user_id=None):
+    """
+    Coloca uma tarefa na fila e retorna o seu id imediatamente.
+
+    Se uma tarefa idêntica (mesmo tipo e parâmetros e, se o tipo não for
+    compartilhado, mesmo usuário) já estiver pendente ou em execução, retorna
+    o id dela em vez de criar outra.
+    """
+    if tipo not in _tipos:
+        raise ValueError(f"Tipo de tarefa desconhecido: {tipo}")
+    parametros = parametros or {}
+    if tipo in _tipos_compartilhados:
+        chave = json.dumps([tipo, parametros], sort_keys=True)
+    else:
+        chave = json.dumps([tipo, parametros, user_id], sort_keys=True)
+    agora = time.time()
+    tarefa_id, criada = database.criar_tarefa(tipo, parametros, chave, user_id, agora, agora - LIMITE_BATIMENTO)
+    if criada:
+        with _condicao:
+            _em_andamento.add(tarefa_id)
+            _eventos[tarefa_id] = []
+            # Descarta os eventos das tarefas mais antigas que já terminaram
+            for antiga in list(_eventos):
+                if len(_eventos) <= MAX_TAREFAS_COM_EVENTOS:
+                    break
+                if antiga not in _em_andamento:
+                    del _eventos[antiga]
+        _iniciar_executor().submit(_executar, tarefa_id, tipo, parametros, user_id)
+    return tarefa_id
+
+def _executar(tarefa_id, tipo, parametros, user_id):
+    def progresso(concluidos, total, mensagem=None, evento=None):
+        fracao = min(1.0, concluidos / total) if total else None
+        database.atualizar_tarefa(tarefa_id, progresso=fracao, mensagem=mensagem, batimento=time.time())
+        if evento is not None:
+            with _condicao:
+                _eventos[tarefa_id].append(evento)
+                _condicao.notify_all()
+
+    database.atualizar_tarefa(tarefa_id, status="executando", batimento=time.time())
+    try:
+        resultado = _tipos[tipo](dict(parametros, user_id=user_id), progresso)
+    except Exception as e:
+        traceback.print_exc()
+        database.concluir_tarefa(tarefa_id, erro=f"{type(e).__name__}: {e}")
+    else:
+        database.concluir_tarefa(tarefa_id, resultado=resultado)
+    finally:
+        with _condicao:
+            _em_andamento.discard(tarefa_id)
+            _condicao.notify_all()
+
+def obter(tarefa_id, user_id=None):
+    """
+    Retorna o estado de uma tarefa (status, progresso, resultado...), ou None.
+    Com `user_id`, também retorna None se a tarefa for de outro usuário e de
+    um tipo não compartilhado.
+    """
+    tarefa = database.obter_tarefa(tarefa_id)
+    if tarefa is not None and user_id is not None and not pode_acessar(tarefa, user_id):
+        return None
+    return tarefa
+
+def pode_acessar(tarefa, user_id):
+    """Indica se o usuário pode acompanhar a tarefa: se ela é dele ou de um tipo compartilhado."""
+    return tarefa['user_id'] == user_id or tarefa['tipo'] in _tipos_compartilhados
+
+def acompanhar(tarefa_id, intervalo_espera=15):
+    """
+    Gera os eventos publicados pela tarefa desde o início e, enquanto ela
+    estiver em andamento neste processo, espera pelos próximos. Gera None a
+    cada `intervalo_espera` segundos sem novidades, para que a conexão de
+    quem acompanha possa ser mantida viva. Termina quando a tarefa termina.
+    """
+    enviados = 0
+    while True:
+        with _condicao:
+            if tarefa_id in _em_andamento and len(_eventos.get(tarefa_id, ())) == enviados:
+                _condicao.wait(intervalo_espera)
+            novos = _eventos.get(tarefa_id, [])[enviados:]
+            em_andamento = tarefa_id in _em_andamento
+        enviados += len(novos)
+        yield from novos
+        if not em_andamento:
+            return
+        if not novos:
+            yield None
+
+def listar(limite=50, user_id=None):
+    """Retorna as tarefas mais recentes; com `user_id`, só as que o usuário pode acompanhar."""
+    return database.obter_tarefas_recentes(limite, user_id, sorted(_tipos_compartilhados))
@@ -0,0 +1,109 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import api_client
+
+ESPERA_INICIAL = 0.05
+TAXA = 20
+
+
+class ServidorFalso:
+    """
+    API local: cada caminho responde, em ordem, os status da sua sequência e
+    depois 200 com os dados do concurso. Guarda o instante de cada requisição.
+    """
+
+    def __init__(self, sequencias=None, marcador="a"):
+        self.sequencias = {caminho: list(status) for caminho, status in (sequencias or {}).items()}
+        self.marcador = marcador
+        self.requisicoes = []
+        self._trava = threading.Lock()
+        servidor = self
+
+        class Manipulador(BaseHTTPRequestHandler):
+            def do_GET(self):
+                with servidor._trava:
+                    servidor.requisicoes.append((self.path, time.monotonic()))
+                    sequencia = servidor.sequencias.get(self.path)
+                    status = sequencia.pop(0) if sequencia else 200
+                if status == 200:
+                    numero = int(self.path.rsplit("/", 1)[-1])
+                    corpo = json.dumps({"numero": numero, "listaDezenas": ["01"], "fonte": servidor.marcador})
+                else:
+                    corpo = "{}"
+                corpo = corpo.encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(corpo)))
+                self.end_headers()
+                self.wfile.write(corpo)
+
+            def log_message(self, *args):
+                pass
+
+        self._http = ThreadingHTTPServer(("127.0.0.1", 0), Manipulador)
+        self.url_base = f"http://127.0.0.1:{self._http.server_port}/lotofacil/"
+        self._thread = threading.Thread(target=self._http.serve_forever, daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self._http.shutdown()
+        self._http.server_close()
+
+    def instantes(self, caminho):
+        return [instante for caminho_requisicao, instante in self.requisicoes if caminho_requisicao == caminho]
+
+
+@pytest.fixture
+def cache_temporario(tmp_path, monkeypatch):
+    monkeypatch.setattr(api_client, "ESPERA_INICIAL_TENTATIVA", ESPERA_INICIAL)
+    monkeypatch.setattr(api_client, "CACHE_API_DIR", api_client.CACHE_API_DIR)
+    api_client.definir_diretorio_cache(str(tmp_path / "cache_api"))
+
+
+def test_novas_tentativas_limite_de_taxa_e_ordem(cache_temporario):
+    numeros = list(range(1, 9))
+    # O concurso 3 falha com 503 e depois com 429 antes de responder
+    with ServidorFalso({"/lotofacil/3": [503, 429]}) as servidor:
+        limitador = api_client.LimitadorTaxa(taxa=TAXA, capacidade=1)
+        obtidos = list(api_client.buscar_concursos(numeros, max_concorrencia=4, url_base=servidor.url_base,
+                                                   limitador=limitador))
+
+    # Os resultados saem na ordem pedida, mesmo com o concurso 3 atrasado pelas novas tentativas
+    assert [numero for numero, _ in obtidos] == numeros
+    assert [dados["numero"] for _, dados in obtidos] == numeros
+
+    # Três requisições ao concurso 3, com espera exponencial entre elas
+    tentativas = servidor.instantes("/lotofacil/3")
+    assert len(tentativas) == 3
+    assert tentativas[1] - tentativas[0] >= ESPERA_INICIAL
+    assert tentativas[2] - tentativas[1] >= 2 * ESPERA_INICIAL
+
+    # Com capacidade 1, as requisições ficam espaçadas de pelo menos 1 / TAXA segundos
+    instantes = sorted(instante for _, instante in servidor.requisicoes)
+    assert len(instantes) == len(numeros) + 2
+    intervalos = [depois - antes for antes, depois in zip(instantes, instantes[1:])]
+    assert min(intervalos) >= 1 / TAXA * 0.8
+
+
+def test_desiste_depois_do_maximo_de_tentativas(cache_temporario):
+    with ServidorFalso({"/lotofacil/1": [500] * api_client.MAX_TENTATIVAS}) as servidor:
+        assert api_client.get_concurso_data(1, url_base=servidor.url_base) is None
+        assert len(servidor.instantes("/lotofacil/1")) == api_client.MAX_TENTATIVAS
+
+
+def test_cache_separado_por_url_base(cache_temporario):
+    with ServidorFalso(marcador="a") as servidor_a, ServidorFalso(marcador="b") as servidor_b:
+        assert api_client.get_concurso_data(5, url_base=servidor_a.url_base)["fonte"] == "a"
+        assert api_client.get_concurso_data(5, url_base=servidor_b.url_base)["fonte"] == "b"
+        # Cada fonte reaproveita o próprio cache, sem nova requisição
+        assert api_client.get_concurso_data(5, url_base=servidor_a.url_base)["fonte"] == "a"
+        assert len(servidor_a.requisicoes) == 1
+        assert len(servidor_b.requisicoes) == 1
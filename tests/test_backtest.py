@@ -0,0 +1,84 @@
+import pytest
+
+import backtest
+import benchmark
+import database
+import features
+import ml_sugestoes
+
+PERIODO = 3
+
+
+@pytest.fixture
+def banco_sintetico(tmp_path, monkeypatch):
+    """Banco e feature store em um diretório temporário, com um histórico sintético."""
+    monkeypatch.chdir(tmp_path)
+    database.inicializar()
+    database.inserir_resultados(benchmark.gerar_historico_sintetico(120, semente=7))
+    return database.obter_todos_os_resultados()
+
+
+def sugestoes_do_backtest(n_workers):
+    eventos = backtest.gerar_eventos_backtest(PERIODO, n_workers=n_workers, usar_checkpoints=False)
+    return {evento['concurso']: (evento['sugestao'], evento['acertos'])
+            for evento in eventos if evento['tipo'] == 'concurso'}
+
+
+def test_prefixo_igual_a_reconstrucao_por_concurso(banco_sintetico):
+    # Referência: a cada concurso, as features são recalculadas só com os concursos anteriores
+    esperado = {}
+    for concurso, dezenas in banco_sintetico[-PERIODO:]:
+        anteriores = [resultado for resultado in banco_sintetico if resultado[0] < concurso]
+        df_features = features.calcular_features(anteriores)
+        sugestao = ml_sugestoes.treinar_ou_carregar_modelos_e_prever(df_features, force_retrain=True, verbose=False,
+                                                                     salvar=False)
+        esperado[concurso] = ([int(dezena) for dezena in sugestao], len(set(sugestao) & set(dezenas)))
+
+    serial = sugestoes_do_backtest(1)
+    assert serial == esperado
+    # O backtest em vários processos dá exatamente o mesmo resultado
+    assert sugestoes_do_backtest(2) == serial
+
+
+def eventos_por_concurso(eventos):
+    return {evento['concurso']: evento for evento in eventos if evento['tipo'] == 'concurso'}
+
+
+def sem_tempos(evento):
+    return (evento['sugestao'], evento['acertos'])
+
+
+def test_retomar_backtest_interrompido(banco_sintetico):
+    # Interrompe o backtest depois do primeiro concurso testado
+    eventos = backtest.gerar_eventos_backtest(PERIODO)
+    for evento in eventos:
+        if evento['tipo'] == 'concurso':
+            break
+    eventos.close()
+
+    retomado = eventos_por_concurso(backtest.gerar_eventos_backtest(PERIODO))
+    assert [evento['checkpoint'] for evento in retomado.values()] == [True] + [False] * (PERIODO - 1)
+
+    novo = eventos_por_concurso(backtest.gerar_eventos_backtest(PERIODO, usar_checkpoints=False))
+    assert {concurso: sem_tempos(evento) for concurso, evento in retomado.items()} == \
+        {concurso: sem_tempos(evento) for concurso, evento in novo.items()}
+
+
+def test_checkpoint_invalidado_ao_preencher_lacuna(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    database.inicializar()
+    historico = benchmark.gerar_historico_sintetico(120, semente=7)
+    # O penúltimo concurso testado fica de fora e chega depois, preenchendo a lacuna
+    lacuna = historico[-2]
+    database.inserir_resultados([resultado for resultado in historico if resultado != lacuna])
+    list(backtest.gerar_eventos_backtest(PERIODO))
+
+    database.inserir_resultados([lacuna])
+    retomado = eventos_por_concurso(backtest.gerar_eventos_backtest(PERIODO))
+    # O concurso anterior à lacuna tem o mesmo histórico de treino; os seguintes não
+    assert {concurso: evento['checkpoint'] for concurso, evento in retomado.items()} == \
+        {historico[-3][0]: True, lacuna[0]: False, historico[-1][0]: False}
+
+    novo = eventos_por_concurso(backtest.gerar_eventos_backtest(PERIODO, usar_checkpoints=False))
+    assert {concurso: sem_tempos(evento) for concurso, evento in retomado.items()} == \
+        {concurso: sem_tempos(evento) for concurso, evento in novo.items()}
@@ -0,0 +1,52 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import benchmark
+import database
+import features
+
+TOTAL_CONCURSOS = 230
+
+
+@pytest.fixture
+def banco_vazio(tmp_path, monkeypatch):
+    """Banco e feature store vazios em um diretório temporário."""
+    monkeypatch.chdir(tmp_path)
+    database.inicializar()
+    return benchmark.gerar_historico_sintetico(TOTAL_CONCURSOS, semente=11)
+
+
+def assert_igual_ao_historico_completo(df_store):
+    resultados = database.obter_todos_os_resultados()
+    pd.testing.assert_frame_equal(df_store, features.calcular_features(resultados), check_dtype=False)
+
+    concursos, matriz = features.carregar_matriz_sorteios(atualizar=False)
+    assert isinstance(concursos, np.memmap) and isinstance(matriz, np.memmap)
+    concursos_esperados, matriz_esperada = features.criar_matriz_sorteios(resultados)
+    np.testing.assert_array_equal(concursos, concursos_esperados)
+    np.testing.assert_array_equal(matriz, matriz_esperada)
+
+
+@pytest.mark.parametrize("tamanho_lote", [1, 7, 49, 50, 51, 120, TOTAL_CONCURSOS])
+def test_ingestao_em_lotes_igual_ao_historico_completo(banco_vazio, tamanho_lote):
+    for inicio in range(0, TOTAL_CONCURSOS, tamanho_lote):
+        # A inserção atualiza o feature store pelo listener registrado em database.inicializar
+        database.inserir_resultados(banco_vazio[inicio:inicio + tamanho_lote])
+        assert features.contar_concursos() == min(inicio + tamanho_lote, TOTAL_CONCURSOS)
+
+    assert_igual_ao_historico_completo(features.carregar_features())
+
+
+def test_lotes_de_tamanhos_variados_e_lacuna_preenchida(banco_vazio):
+    # Deixa o concurso 100 de fora e o insere depois, no meio do histórico
+    sem_lacuna = [resultado for resultado in banco_vazio if resultado[0] != 100]
+    inicio = 0
+    for tamanho_lote in (60, 1, 3, 25, 2, 80):
+        database.inserir_resultados(sem_lacuna[inicio:inicio + tamanho_lote])
+        inicio += tamanho_lote
+    assert_igual_ao_historico_completo(features.carregar_features())
+
+    database.inserir_resultados(sem_lacuna[inicio:] + [banco_vazio[99]])
+    assert features.contar_concursos() == TOTAL_CONCURSOS
+    assert_igual_ao_historico_completo(features.carregar_features())
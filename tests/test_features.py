@@ -0,0 +1,62 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import benchmark
+import features
+
+
+def atrasos_referencia(df):
+    """Implementação original do atraso (O(N²)), mantida como referência."""
+    df_atraso = pd.DataFrame(index=df.index)
+    for i in range(1, 26):
+        dezena_col = f'dezena_{i}'
+        sorteios_com_dezena = df[df[dezena_col] == 1].index
+        atrasos = []
+        for concurso_atual in df.index:
+            sorteios_passados = sorteios_com_dezena[sorteios_com_dezena < concurso_atual]
+            if not sorteios_passados.empty:
+                atraso = concurso_atual - sorteios_passados.max()
+            else:
+                atraso = concurso_atual
+            atrasos.append(atraso)
+        df_atraso[f'atraso_{i}'] = atrasos
+    return df_atraso
+
+
+def historico(concursos, semente, dezenas_ausentes=()):
+    """DataFrame de presença das dezenas (como criar_dataframe_features) com sorteios aleatórios."""
+    rng = np.random.default_rng(semente)
+    matriz = np.zeros((len(concursos), 25), dtype=np.int64)
+    possiveis = [i for i in range(25) if i + 1 not in dezenas_ausentes]
+    for linha in matriz:
+        linha[rng.choice(possiveis, size=min(15, len(possiveis)), replace=False)] = 1
+    colunas = [f'dezena_{i}' for i in range(1, 26)]
+    return pd.DataFrame(matriz, index=pd.Index(concursos, name='concurso'), columns=colunas)
+
+
+@pytest.mark.parametrize("concursos, dezenas_ausentes", [
+    (list(range(1, 121)), ()),
+    # Lacunas na numeração dos concursos
+    ([1, 2, 3, 7, 8, 20, 21, 22, 50, 51] + list(range(60, 140, 3)), ()),
+    # Dezenas que nunca saem
+    (list(range(1, 81)), (1, 13, 25)),
+    # Lacunas e dezenas ausentes ao mesmo tempo, começando longe do concurso 1
+    ([500, 501, 505, 506, 510] + list(range(520, 600, 2)), (2, 24)),
+])
+def test_atraso_igual_a_implementacao_original(concursos, dezenas_ausentes):
+    df = historico(concursos, semente=len(concursos), dezenas_ausentes=dezenas_ausentes)
+    esperado = atrasos_referencia(df)
+
+    obtido = benchmark.calcular_features_atraso(df)
+    pd.testing.assert_frame_equal(obtido, esperado, check_dtype=False)
+
+    atrasos = features.calcular_atrasos(df.index.to_numpy(), df.to_numpy())
+    np.testing.assert_array_equal(atrasos, esperado.to_numpy())
+    for dezena in dezenas_ausentes:
+        np.testing.assert_array_equal(atrasos[:, dezena - 1], df.index.to_numpy())
+
+
+def test_atraso_de_historico_vazio():
+    df = historico([], semente=0)
+    assert benchmark.calcular_features_atraso(df).empty
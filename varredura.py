@@ -0,0 +1,296 @@
+"""
+Varredura de modelos e hiperparâmetros com validação temporal.
+
+Uso:
+    python varredura.py                                # grade padrão, 5 dobras de 50 concursos
+    python varredura.py --processos 8 --saida varredura.json
+    python varredura.py --dobras 10 --concursos-por-dobra 30 --sem-cache
+
+Cada candidato (modelo, hiperparâmetros e motor) é avaliado em dobras de
+janela expansível: a dobra k treina com todos os concursos anteriores ao seu
+bloco de teste e prevê cada concurso do bloco a partir das features dele, que
+só usam sorteios anteriores. As dobras rodam em um pool de processos que lêem
+a mesma matriz do feature store (mapeada em memória) e o resultado de cada
+dobra fica guardado em disco, então uma varredura interrompida ou ampliada só
+avalia as dobras que ainda faltam.
+"""
+import argparse
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import hashlib
+import importlib
+import itertools
+import json
+import os
+import threading
+import time
+
+import numpy as np
+
+import features
+import metricas
+
+# Grade avaliada: (modelo, {hiperparâmetro: valores}, motores). Cada combinação de
+# valores vira um candidato para cada motor (ver ml_sugestoes.MOTORES); a regressão
+# logística não aceita várias saídas, então só roda no motor por dezena
+GRADE_MODELOS = [
+    ('RandomForestClassifier',
+     {'n_estimators': [100, 200], 'max_depth': [None, 10], 'min_samples_leaf': [1, 5], 'random_state': [42]},
+     ('por_dezena', 'multi_saida')),
+    ('ExtraTreesClassifier',
+     {'n_estimators': [100], 'min_samples_leaf': [1, 5], 'random_state': [42]},
+     ('por_dezena', 'multi_saida')),
+    ('LogisticRegression',
+     {'C': [0.1, 1.0], 'solver': ['liblinear'], 'max_iter': [1000]},
+     ('por_dezena',)),
+]
+# Módulo do scikit-learn de cada modelo da grade, importado só nos processos que treinam
+MODULOS_MODELOS = {
+    'RandomForestClassifier': 'sklearn.ensemble',
+    'ExtraTreesClassifier': 'sklearn.ensemble',
+    'LogisticRegression': 'sklearn.linear_model',
+}
+# Dobras de janela expansível e concursos no bloco de teste de cada uma
+DOBRAS_PADRAO = 5
+CONCURSOS_POR_DOBRA = 50
+# Concursos mínimos de treino na primeira dobra
+TREINO_MINIMO = 200
+# Diretório do cache em disco dos resultados de cada dobra. Um concurso publicado
+# nunca muda, então o resultado vale enquanto a grade, as dobras e as features forem as mesmas
+CACHE_VARREDURA_DIR = "cache_varredura"
+# Versão do formato do cache; mudar descarta os resultados guardados
+VERSAO_CACHE = 1
+
+# Matriz de features de cada processo da varredura, preenchida por _inicializar_processo
+_df_features_processo = None
+
+def gerar_candidatos(grade=None):
+    """Expande a grade em candidatos {"modelo", "parametros", "motor"}."""
+    candidatos = []
+    for modelo, parametros, motores in grade or GRADE_MODELOS:
+        nomes = sorted(parametros)
+        for valores in itertools.product(*(parametros[nome] for nome in nomes)):
+            for motor in motores:
+                candidatos.append({'modelo': modelo, 'parametros': dict(zip(nomes, valores)), 'motor': motor})
+    return candidatos
+
+def descrever_candidato(candidato):
+    """Texto curto do candidato para o relatório, ex.: "RandomForestClassifier[multi_saida] max_depth=10"."""
+    parametros = " ".join(f"{nome}={valor}" for nome, valor in sorted(candidato['parametros'].items())
+                          if nome not in ('random_state', 'max_iter'))
+    return f"{candidato['modelo']}[{candidato['motor']}] {parametros}".strip()
+
+def dividir_dobras(n_linhas, n_dobras=DOBRAS_PADRAO, concursos_por_dobra=CONCURSOS_POR_DOBRA):
+    """
+    Retorna as dobras de janela expansível como [(fim_treino, fim_teste), ...]
+    (posições de linha): a dobra treina com as linhas [0, fim_treino) e testa
+    com [fim_treino, fim_teste). Os blocos de teste são os últimos concursos,
+    consecutivos e sem sobreposição.
+    """
+    inicio_testes = n_linhas - n_dobras * concursos_por_dobra
+    if n_dobras <= 0 or concursos_por_dobra <= 0 or inicio_testes < TREINO_MINIMO:
+        return []
+    return [(inicio_testes + k * concursos_por_dobra, inicio_testes + (k + 1) * concursos_por_dobra)
+            for k in range(n_dobras)]
+
+def _chave_dobra(candidato, concursos):
+    """Identificador do resultado de uma dobra: candidato, features e concursos de treino e de teste."""
+    descricao = json.dumps({
+        'versao': VERSAO_CACHE,
+        'candidato': candidato,
+        'janelas': features.JANELAS_FREQUENCIA,
+        'concursos': concursos,
+    }, sort_keys=True)
+    return hashlib.sha256(descricao.encode('utf-8')).hexdigest()[:32]
+
+def _caminho_cache(chave):
+    return os.path.join(CACHE_VARREDURA_DIR, f"{chave}.json")
+
+def _ler_cache(chave):
+    try:
+        with open(_caminho_cache(chave), encoding="utf-8") as arquivo:
+            return json.load(arquivo)
+    except (OSError, ValueError):
+        return None
+
+def _gravar_cache(chave, conteudo):
+    """Grava o arquivo do cache de forma atômica (arquivo temporário + rename)."""
+    caminho = _caminho_cache(chave)
+    os.makedirs(CACHE_VARREDURA_DIR, exist_ok=True)
+    temporario = f"{caminho}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(temporario, "w", encoding="utf-8") as arquivo:
+        json.dump(conteudo, arquivo)
+    os.replace(temporario, caminho)
+
+def _criar_modelo(candidato):
+    classe = getattr(importlib.import_module(MODULOS_MODELOS[candidato['modelo']]), candidato['modelo'])
+    return classe(**candidato['parametros'])
+
+def avaliar_dobra(df_features, candidato, fim_treino, fim_teste):
+    """
+    Treina o candidato com as linhas [0, fim_treino) de `df_features` e prevê
+    as linhas [fim_treino, fim_teste), escolhendo as 15 dezenas mais prováveis
+    de cada concurso como `ml_sugestoes.selecionar_dezenas`.
+    Retorna {"acertos": [...], "tempo_treino", "tempo_previsao"} (segundos, da dobra toda).
+    """
+    from ml_sugestoes import colunas_modelo, colunas_multi_saida
+
+    treino = df_features.iloc[:fim_treino]
+    teste = df_features.iloc[fim_treino:fim_teste]
+    colunas_dezenas = [f'dezena_{i}' for i in range(1, 26)]
+    if candidato['motor'] == 'multi_saida':
+        grupos = [(colunas_multi_saida(), colunas_dezenas)]
+    else:
+        grupos = [(colunas_modelo(i), f'dezena_{i}') for i in range(1, 26)]
+
+    inicio = time.perf_counter()
+    modelos = []
+    for colunas, alvo in grupos:
+        modelo = _criar_modelo(candidato)
+        modelo.fit(treino[colunas], treino[alvo])
+        modelos.append(modelo)
+    tempo_treino = time.perf_counter() - inicio
+
+    inicio = time.perf_counter()
+    if candidato['motor'] == 'multi_saida':
+        saidas = modelos[0].predict_proba(teste[grupos[0][0]])
+    else:
+        saidas = [modelo.predict_proba(teste[colunas]) for modelo, (colunas, _) in zip(modelos, grupos)]
+    probabilidades = np.column_stack([saida[:, 1] for saida in saidas])
+    # Ordenação estável: em caso de empate vence a menor dezena, como em selecionar_dezenas
+    escolhidas = np.argsort(-probabilidades, axis=1, kind='stable')[:, :15]
+    tempo_previsao = time.perf_counter() - inicio
+
+    sugestoes = np.zeros(probabilidades.shape, dtype=np.uint8)
+    np.put_along_axis(sugestoes, escolhidas, 1, axis=1)
+    acertos = features.contar_acertos(features.matriz_para_mascaras(sugestoes),
+                                      features.matriz_para_mascaras(teste[colunas_dezenas].to_numpy()))
+    return {'acertos': [int(valor) for valor in acertos], 'tempo_treino': tempo_treino,
+            'tempo_previsao': tempo_previsao}
+
+def _inicializar_processo():
+    """Abre a matriz do feature store uma vez por processo; as páginas mapeadas são compartilhadas entre eles."""
+    global _df_features_processo
+    _df_features_processo = features.carregar_features(atualizar=False)
+
+def _avaliar_dobra_no_processo(candidato, fim_treino, fim_teste):
+    return avaliar_dobra(_df_features_processo, candidato, fim_treino, fim_teste)
+
+def _resumir(candidato, resultados):
+    acertos = [valor for resultado in resultados for valor in resultado['acertos']]
+    return {
+        'candidato': candidato,
+        'descricao': descrever_candidato(candidato),
+        'acertos_medios': sum(acertos) / len(acertos),
+        'distribuicao': sorted(Counter(acertos).items(), reverse=True),
+        # Tempo médio de treino por dobra e de previsão por concurso testado
+        'tempo_treino': sum(resultado['tempo_treino'] for resultado in resultados) / len(resultados),
+        'tempo_previsao': sum(resultado['tempo_previsao'] for resultado in resultados) / len(acertos),
+    }
+
+def executar_varredura(n_dobras=DOBRAS_PADRAO, concursos_por_dobra=CONCURSOS_POR_DOBRA, n_processos=1,
+                       grade=None, usar_cache=True):
+    """
+    Avalia todos os candidatos da grade (GRADE_MODELOS por padrão) nas mesmas
+    dobras de janela expansível e retorna o ranking: uma lista de resumos
+    {"candidato", "descricao", "acertos_medios", "distribuicao", "tempo_treino",
+    "tempo_previsao"}, do maior para o menor número médio de acertos (e, no
+    empate, do treino mais rápido para o mais lento).
+
+    Args:
+        n_dobras (int): Quantidade de dobras (blocos de teste consecutivos).
+        concursos_por_dobra (int): Concursos testados em cada dobra.
+        n_processos (int): Processos que avaliam as dobras em paralelo. Com 1
+            a varredura roda no processo atual.
+        grade (list): Grade no formato de GRADE_MODELOS.
+        usar_cache (bool): Reaproveita as dobras já avaliadas e guarda as novas
+            em CACHE_VARREDURA_DIR.
+    """
+    df_features = features.carregar_features()
+    dobras = dividir_dobras(len(df_features), n_dobras, concursos_por_dobra)
+    if not dobras:
+        print(f"Histórico insuficiente: são necessários pelo menos {TREINO_MINIMO} concursos de treino "
+              f"além dos {n_dobras * concursos_por_dobra} testados.")
+        return []
+
+    candidatos = gerar_candidatos(grade)
+    concursos = df_features.index
+    resultados = {indice: {} for indice in range(len(candidatos))}
+    pendentes = []
+    for indice, candidato in enumerate(candidatos):
+        for dobra, (fim_treino, fim_teste) in enumerate(dobras):
+            chave = _chave_dobra(candidato, [int(concursos[0]), int(concursos[fim_treino]),
+                                             int(concursos[fim_teste - 1])])
+            guardado = _ler_cache(chave) if usar_cache else None
+            if guardado is not None:
+                resultados[indice][dobra] = guardado
+            else:
+                pendentes.append((indice, dobra, chave))
+
+    total = len(candidatos) * len(dobras)
+    print(f"Varredura de {len(candidatos)} candidato(s) em {len(dobras)} dobra(s) de {concursos_por_dobra} "
+          f"concursos (treino inicial com {dobras[0][0]} concursos).")
+    if total > len(pendentes):
+        print(f"Reaproveitando {total - len(pendentes)} dobra(s) já avaliada(s).")
+
+    def registrar(indice, dobra, chave, resultado):
+        resultados[indice][dobra] = resultado
+        metricas.observar("varredura", "dobra", resultado['tempo_treino'] + resultado['tempo_previsao'])
+        if usar_cache:
+            _gravar_cache(chave, resultado)
+        concluidas = sum(len(dobras_avaliadas) for dobras_avaliadas in resultados.values())
+        print(f"[{concluidas}/{total}] {descrever_candidato(candidatos[indice])}, dobra {dobra + 1}: "
+              f"{np.mean(resultado['acertos']):.2f} acertos em média (treino {resultado['tempo_treino']:.2f}s)")
+
+    if n_processos <= 1:
+        for indice, dobra, chave in pendentes:
+            fim_treino, fim_teste = dobras[dobra]
+            registrar(indice, dobra, chave, avaliar_dobra(df_features, candidatos[indice], fim_treino, fim_teste))
+    elif pendentes:
+        with ProcessPoolExecutor(max_workers=n_processos, initializer=_inicializar_processo) as executor:
+            tarefas = {executor.submit(_avaliar_dobra_no_processo, candidatos[indice], *dobras[dobra]):
+                       (indice, dobra, chave) for indice, dobra, chave in pendentes}
+            for tarefa in as_completed(tarefas):
+                registrar(*tarefas[tarefa], tarefa.result())
+
+    ranking = [_resumir(candidato, [resultados[indice][dobra] for dobra in range(len(dobras))])
+               for indice, candidato in enumerate(candidatos)]
+    ranking.sort(key=lambda resumo: (-resumo['acertos_medios'], resumo['tempo_treino']))
+    return ranking
+
+def imprimir_ranking(ranking):
+    """Imprime o ranking de `executar_varredura` como tabela."""
+    print("\n--- RANKING DA VARREDURA ---")
+    print(f"{'#':>3} {'acertos':>8} {'11+':>5} {'13+':>5} {'treino':>9} {'previsão':>10}  candidato")
+    for posicao, resumo in enumerate(ranking, start=1):
+        distribuicao = dict(resumo['distribuicao'])
+        testados = sum(distribuicao.values())
+        onze_ou_mais = sum(vezes for pontos, vezes in distribuicao.items() if pontos >= 11) / testados
+        treze_ou_mais = sum(vezes for pontos, vezes in distribuicao.items() if pontos >= 13) / testados
+        print(f"{posicao:>3} {resumo['acertos_medios']:>8.3f} {onze_ou_mais:>5.0%} {treze_ou_mais:>5.0%} "
+              f"{resumo['tempo_treino']:>8.2f}s {resumo['tempo_previsao'] * 1000:>8.2f}ms  {resumo['descricao']}")
+    if ranking:
+        print("\nDistribuição de acertos do melhor candidato:")
+        for pontos, vezes in ranking[0]['distribuicao']:
+            print(f"- {pontos} pontos: {vezes} vez(es)")
+
+if __name__ == "__main__":
+    import database
+
+    parser = argparse.ArgumentParser(description="Varredura de modelos e hiperparâmetros com validação temporal.")
+    parser.add_argument("--dobras", type=int, default=DOBRAS_PADRAO)
+    parser.add_argument("--concursos-por-dobra", type=int, default=CONCURSOS_POR_DOBRA)
+    parser.add_argument("--processos", type=int, default=os.cpu_count() or 1,
+                        help="processos que avaliam as dobras em paralelo (padrão: um por núcleo)")
+    parser.add_argument("--sem-cache", action="store_true", help="avalia todas as dobras de novo")
+    parser.add_argument("--saida", help="arquivo JSON com o ranking completo")
+    args = parser.parse_args()
+
+    database.inicializar()
+    ranking = executar_varredura(args.dobras, args.concursos_por_dobra, args.processos,
+                                 usar_cache=not args.sem_cache)
+    imprimir_ranking(ranking)
+    if args.saida and ranking:
+        with open(args.saida, "w", encoding="utf-8") as arquivo:
+            json.dump(ranking, arquivo, indent=2, ensure_ascii=False)
+        print(f"\nRanking gravado em {args.saida}.")